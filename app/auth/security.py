@@ -1,13 +1,26 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Callable, Optional, Tuple, TypeVar
 
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 
+from app.utils import metrics
 from app.utils.settings import settings
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
+
+# bcrypt releases the GIL, so a few threads hash in parallel while the loop keeps serving.
+# The semaphore keeps waiting logins queued on the loop (measured) instead of inside the pool.
+_hash_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="pwhash")
+_hash_slots = asyncio.Semaphore(settings.password_hash_workers)
+T = TypeVar("T")
 
 
 def hash_password(password: str) -> str:
@@ -18,6 +31,32 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+async def _run_hash(fn: Callable[..., T], *args) -> T:
+    queued = time.perf_counter()
+    async with _hash_slots:
+        started = time.perf_counter()
+        metrics.observe("auth.hash_queue_ms", (started - queued) * 1000)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+        finally:
+            metrics.observe("auth.hash_ms", (time.perf_counter() - started) * 1000)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hash(pwd_context.hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """(valid, new_hash); new_hash is set when the stored hash uses outdated cost parameters."""
+    if not hashed_password:
+        return False, None
+    return await _run_hash(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+def shutdown_hash_executor() -> None:
+    _hash_executor.shutdown(wait=False, cancel_futures=True)
+
+
 def create_access_token(subject: str, expires_minutes: Optional[int] = None, extra_claims: Optional[dict] = None) -> str:
     to_encode = {"sub": subject, "iat": int(datetime.now(timezone.utc).timestamp())}
     if extra_claims:
@@ -30,9 +69,63 @@ def create_access_token(subject: str, expires_minutes: Optional[int] = None, ext
     return encoded_jwt
 
 
+class VerifiedTokenCache:
+    """Bounded LRU of verified token payloads, keyed by SHA-256 of the token.
+
+    Entries are dropped at the token's ``exp``, so a cached token is never
+    accepted after it would have failed verification. Only valid tokens are cached.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, key: bytes) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: bytes, payload: dict) -> None:
+        if self.maxsize <= 0 or "exp" not in payload:
+            return
+        with self._lock:
+            self._entries[key] = (float(payload["exp"]), payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"token_cache.entries": len(self)}
+
+
+token_cache = VerifiedTokenCache(settings.token_cache_size)
+metrics.register_collector(token_cache.stats)
+
+
 def decode_access_token(token: str) -> Optional[dict]:
+    key = token_cache.key(token)
+    payload = token_cache.get(key)
+    if payload is not None:
+        metrics.incr("token_cache.hits")
+        return payload
+    metrics.incr("token_cache.misses")
     try:
         payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
-        return payload
     except JWTError:
         return None
+    token_cache.put(key, payload)
+    return payload
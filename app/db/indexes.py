@@ -0,0 +1,151 @@
+"""Declarative index specification and the canonical query shapes it serves.
+
+``INDEXES`` is the single source of truth: ``ensure_indexes`` creates it on
+startup and ``python -m etl.index_advisor`` explains every query in
+``canonical_queries()`` against it, reporting collection scans, in-memory sorts
+and poor examined/returned ratios, and optionally creating missing or
+dropping unlisted indexes.
+
+Compound keys follow the equality, sort, range order, and every sort key ends
+with ``_id`` so keyset pagination ranges (app/utils/pagination.py) come
+straight off the index.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: Tuple[Tuple[str, Any], ...]
+    name: str
+    options: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class QueryShape:
+    name: str
+    collection: str
+    filter: Dict[str, Any] = field(default_factory=dict)
+    sort: Optional[Dict[str, int]] = None
+    limit: Optional[int] = None
+    pipeline: Optional[List[dict]] = None  # aggregate instead of find
+    full_scan_ok: bool = False  # whole-collection rollups, expected to COLLSCAN
+
+
+ACTIVE_ONLY = {"partialFilterExpression": {"active": True}}
+
+INDEXES: List[IndexSpec] = [
+    # users
+    IndexSpec("users", (("email", 1),), "email_1", {"unique": True}),
+    # listings: search
+    IndexSpec(
+        "listings",
+        (("title", "text"), ("description", "text"), ("tags", "text")),
+        "listings_text_index",
+        {"default_language": "english"},
+    ),
+    IndexSpec("listings", (("location", "2dsphere"),), "location_2dsphere"),
+    # listings: browse (GET /listings, /latest) by date or price, optionally per category.
+    # Partial on active listings: expired ones are flagged by the sweeper and then archived.
+    IndexSpec("listings", (("posted_date", -1), ("_id", -1)), "active_posted_date_id_index", ACTIVE_ONLY),
+    IndexSpec("listings", (("price", 1), ("_id", 1)), "active_price_id_index", ACTIVE_ONLY),
+    IndexSpec("listings", (("category", 1), ("posted_date", -1), ("_id", -1)), "active_category_posted_date_id_index", ACTIVE_ONLY),
+    IndexSpec("listings", (("category", 1), ("price", 1), ("_id", 1)), "active_category_price_id_index", ACTIVE_ONLY),
+    # listings: semantic/hybrid/advanced filters
+    IndexSpec("listings", (("city", 1), ("posted_date", -1)), "active_city_posted_date_index", ACTIVE_ONLY),
+    IndexSpec("listings", (("tags", 1),), "active_tags_index", ACTIVE_ONLY),
+    # listings: /listings/me (owner's live listings, newest first)
+    IndexSpec("listings", (("userId", 1), ("posted_date", -1)), "active_userId_posted_date_index", ACTIVE_ONLY),
+    # listings: expiry sweep (app/services/archive.py)
+    IndexSpec("listings", (("expires_at", 1),), "active_expires_at_index", ACTIVE_ONLY),
+    IndexSpec("listings", (("active", 1),), "inactive_index", {"partialFilterExpression": {"active": False}}),
+    # listings: embedding store reconcile / ANN index refresh watermark
+    IndexSpec("listings", (("embedded_at", 1),), "embedded_at_index", {"sparse": True}),
+    # listings: analytics ETL watermark (every write sets updated_at, including on inactive listings)
+    IndexSpec("listings", (("updated_at", 1),), "updated_at_index"),
+    # embedding job queue: claim order, expired-lease pickup, oldest-job lag
+    IndexSpec("embedding_jobs", (("status", 1), ("available_at", 1)), "status_available_index"),
+    IndexSpec("embedding_jobs", (("status", 1), ("lease_expires_at", 1)), "status_lease_index"),
+    IndexSpec("embedding_jobs", (("status", 1), ("enqueued_at", 1)), "status_enqueued_index"),
+    # archive: index refresh picks up recently archived ids
+    IndexSpec("listings_archive", (("archived_at", 1),), "archived_at_index"),
+    # analytics: daily rollups (app/services/rollups.py), deleted-listing tombstones
+    IndexSpec("listing_rollups_daily", (("day", 1), ("city", 1), ("category", 1)), "day_city_category_index", {"unique": True}),
+    IndexSpec("listing_tombstones", (("deleted_at", 1),), "deleted_at_index"),
+    # image storage: unreferenced-blob sweep (app/services/storage.py)
+    IndexSpec("image_blobs", (("refs", 1),), "refs_index"),
+]
+
+
+def _sample_values() -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {"now": now, "month_ago": now - timedelta(days=30), "user": "000000000000000000000000"}
+
+
+def canonical_queries() -> List[QueryShape]:
+    """Representative instances of the hot queries in app/routes and app/services."""
+    # Imported here: routes and services import the db layer
+    from app.routes.analytics import LIVE_USER_FACETS, live_listing_facets
+    from app.services.rollups import rollup_pipelines, summary_pipeline
+    v = _sample_values()
+    return [
+        # app/routes/listings.py
+        QueryShape("browse newest", "listings", {"active": True}, {"posted_date": -1, "_id": -1}, 40),
+        QueryShape("browse next page (keyset)", "listings",
+                   {"active": True,
+                    "$or": [{"posted_date": {"$lt": v["month_ago"]}},
+                            {"posted_date": v["month_ago"], "_id": {"$lt": ObjectId()}}]},
+                   {"posted_date": -1, "_id": -1}, 40),
+        QueryShape("browse by price", "listings", {"active": True, "price": {"$gte": 100, "$lte": 5000}}, {"price": 1, "_id": 1}, 40),
+        QueryShape("category newest", "listings", {"active": True, "category": "electronics"}, {"posted_date": -1, "_id": -1}, 40),
+        QueryShape("category + price range, newest", "listings",
+                   {"active": True, "category": "electronics", "price": {"$gte": 100, "$lte": 5000}},
+                   {"posted_date": -1, "_id": -1}, 40),
+        QueryShape("category by price", "listings",
+                   {"active": True, "category": "electronics", "price": {"$gte": 100}}, {"price": 1, "_id": 1}, 40),
+        QueryShape("my listings", "listings",
+                   {"userId": v["user"], "active": True}, {"posted_date": -1}),
+        QueryShape("semantic filter: city", "listings", {"active": True, "city": "Colombo"}),
+        QueryShape("semantic filter: tags", "listings", {"active": True, "tags": {"$in": ["iphone", "laptop"]}}),
+        QueryShape("nearby", "listings", pipeline=[
+            {"$geoNear": {"near": {"type": "Point", "coordinates": [79.86, 6.93]},
+                          "distanceField": "distance", "spherical": True, "maxDistance": 5000,
+                          "query": {"active": True}}},
+            {"$limit": 40},
+        ]),
+        QueryShape("text search", "listings", pipeline=[
+            {"$match": {"$text": {"$search": "iphone"}, "active": True}},
+            {"$project": {"textScore": {"$meta": "textScore"}}},
+            {"$sort": {"textScore": {"$meta": "textScore"}}},
+            {"$limit": 500},
+        ]),
+        # app/utils/embedding_store.py, app/utils/vector_index.py
+        QueryShape("embedding watermark", "listings", {"embedded_at": {"$gte": v["now"] - timedelta(minutes=5)}}),
+        # app/services/archive.py
+        QueryShape("expire sweep", "listings", {"active": True, "expires_at": {"$lte": v["now"]}}),
+        QueryShape("archive batch", "listings", {"active": False}, limit=500),
+        # app/services/embedding_jobs.py
+        QueryShape("claim embedding job", "embedding_jobs",
+                   {"$or": [{"status": "pending", "available_at": {"$lte": v["now"]}},
+                            {"status": "running", "lease_expires_at": {"$lt": v["now"]}, "attempts": {"$lt": 5}}]},
+                   {"available_at": 1}, 64),
+        QueryShape("oldest embedding job", "embedding_jobs",
+                   {"status": {"$in": ["pending", "running"]}}, {"enqueued_at": 1}, 1),
+        # app/routes/auth.py
+        QueryShape("login", "users", {"email": "someone@example.com"}, limit=1),
+        # app/routes/analytics.py
+        QueryShape("summary date range", "listing_rollups_daily",
+                   pipeline=summary_pipeline(v["month_ago"].date(), v["now"].date())),
+        QueryShape("live analytics: listings", "listings", pipeline=live_listing_facets(v["now"]), full_scan_ok=True),
+        QueryShape("live analytics: users", "users", pipeline=LIVE_USER_FACETS, full_scan_ok=True),
+        # app/services/rollups.py (etl/run_etl.py)
+        QueryShape("changed listings since watermark", "listings", {"updated_at": {"$gte": v["now"] - timedelta(hours=1)}}),
+        QueryShape("tombstones since watermark", "listing_tombstones", {"deleted_at": {"$gte": v["now"] - timedelta(hours=1)}}),
+        QueryShape("rollup one day", "listings", pipeline=rollup_pipelines([v["now"].date()])[0]),
+        # app/services/storage.py (etl/image_blobs.py)
+        QueryShape("unreferenced image blobs", "image_blobs", {"refs": {"$lte": 0}}),
+    ]
@@ -1,5 +1,7 @@
 from typing import Optional
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.errors import ConnectionFailure, PyMongoError
+from app.db.indexes import INDEXES
 from app.utils.settings import settings
 
 _client: Optional[AsyncIOMotorClient] = None
@@ -27,53 +29,13 @@ def get_db() -> AsyncIOMotorDatabase:
 
 
 async def ensure_indexes():
-    try:
-        db = get_db()
-
-        # Users
-        try:
-            await db.users.create_index("email", unique=True)
-        except Exception:
-            pass  # Index might already exist
-
-        # Listings
-        try:
-            # Text index on title, description, tags
-            await db.listings.create_index(
-                [("title", "text"), ("description", "text"), ("tags", "text")],
-                name="listings_text_index",
-                default_language="english",
-            )
-        except Exception:
-            pass  # Index might already exist
-        
-        try:
-            # 2dsphere index on coordinates
-            await db.listings.create_index([("location", "2dsphere")], name="location_2dsphere")
-        except Exception:
-            pass
-        
-        try:
-            # userId index
-            await db.listings.create_index("userId", name="userId_index")
-        except Exception:
-            pass
-        
-        try:
-            # category index
-            await db.listings.create_index("category", name="category_index")
-        except Exception:
-            pass
-        
-        try:
-            await db.listings.create_index("posted_date", name="posted_date_index")
-        except Exception:
-            pass
-
-        # Analytics summary timestamp index
+    """Create the indexes declared in app/db/indexes.py; failures are reported, not raised."""
+    db = get_db()
+    for spec in INDEXES:
         try:
-            await db.analytics_summary.create_index("generatedAt", name="generatedAt_index")
-        except Exception:
-            pass
-    except Exception as e:
-        print(f"Warning: Error ensuring indexes: {e}")
+            await db[spec.collection].create_index(list(spec.keys), name=spec.name, **spec.options)
+        except PyMongoError as e:
+            # e.g. IndexOptionsConflict when an index with the same keys exists under another name
+            print(f"⚠️  Could not create index {spec.collection}.{spec.name}: {e}")
+            if isinstance(e, ConnectionFailure):
+                return
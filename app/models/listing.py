@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 from enum import Enum
 from datetime import datetime
@@ -58,6 +58,14 @@ class ListingUpdate(BaseModel):
     expiry_days: Optional[int] = Field(default=None, description="Allowed: 7,14,30,90")
 
 
+class ImageVariant(BaseModel):
+    src: str  # the original in ``images``
+    width: int
+    height: int
+    thumb: Dict[str, str] = {}  # format (avif/webp/jpeg) -> URL
+    medium: Dict[str, str] = {}
+
+
 class ListingOut(BaseModel):
     id: str = Field(alias="_id")
     title: str
@@ -71,8 +79,11 @@ class ListingOut(BaseModel):
     location: GeoPoint
     score: Optional[float] = None
     images: List[str] = []
+    image_variants: List[ImageVariant] = []
     posted_date: Optional[datetime] = None
     expires_at: Optional[datetime] = None
+    version: int = 0
+    updated_at: Optional[datetime] = None
 
     class Config:
         populate_by_name = True
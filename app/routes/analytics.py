@@ -1,182 +1,204 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+import asyncio
+import json
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional
 from app.db.mongo import get_db
-from app.utils.mongo_helpers import normalize_id
 from app.routes.auth import get_current_role
 from app.models.user import Role
+from app.utils import metrics
+from app.services.embedding_jobs import queue_stats
+from app.services.rollups import summarize
+from app.services.stream_analytics import ACTIVE_SELLER_DAYS, stream_analytics
+from app.utils.response_cache import MemoryBackend, ResponseCache
+from app.utils.settings import settings
 
 
 router = APIRouter()
 
+# Short TTL, per process: concurrent dashboard refreshes share one computation
+live_cache = ResponseCache(MemoryBackend(maxsize=4), settings.live_analytics_ttl)
+
 
 @router.get("/summary")
-async def get_summary(db=Depends(get_db), role: Role = Depends(get_current_role)):
-    """Get pre-generated analytics summary from ETL"""
+async def get_summary(
+    start: Optional[date] = Query(default=None, description="First creation day (UTC), inclusive"),
+    end: Optional[date] = Query(default=None, description="Last creation day (UTC), inclusive"),
+    db=Depends(get_db),
+    role: Role = Depends(get_current_role),
+):
+    """Analytics for listings created in a date range, summed from the ETL's daily rollups"""
     if role != Role.admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
-    doc = await db.analytics_summary.find_one(sort=[("generatedAt", -1)])
-    if not doc:
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    summary = await summarize(db, start, end)
+    if not summary:
         raise HTTPException(status_code=404, detail="No analytics available")
-    return normalize_id(doc)
+    return summary
 
 
-@router.get("/live")
-async def get_live_analytics(db=Depends(get_db), role: Role = Depends(get_current_role)):
-    """
-    Get real-time analytics using MongoDB aggregation pipelines.
-    Provides fresh data without needing ETL.
-    """
+@router.get("/metrics")
+async def get_metrics(role: Role = Depends(get_current_role)):
+    """Per-worker runtime counters (caches, embedding queues, timings)"""
     if role != Role.admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
-    
-    # Get total counts
-    total_listings = await db.listings.count_documents({})
-    total_users = await db.users.count_documents({})
-    
-    # Active listings (not expired)
-    now = datetime.utcnow()
-    active_listings = await db.listings.count_documents({
-        "$or": [
-            {"expires_at": {"$exists": False}},
-            {"expires_at": None},
-            {"expires_at": {"$gt": now}}
-        ]
-    })
-    
-    # Expired listings
-    expired_listings = total_listings - active_listings
-    
-    # Listings by city
-    city_pipeline = [
-        {"$group": {"_id": "$city", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 10}
-    ]
-    cities = await db.listings.aggregate(city_pipeline).to_list(length=10)
-    
-    # Listings by category
-    category_pipeline = [
-        {"$group": {"_id": "$category", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 10}
-    ]
-    categories = await db.listings.aggregate(category_pipeline).to_list(length=10)
-    
-    # Average price by category
-    price_by_category_pipeline = [
-        {"$match": {"price": {"$exists": True, "$gt": 0}}},
-        {"$group": {
-            "_id": "$category",
-            "avgPrice": {"$avg": "$price"},
-            "minPrice": {"$min": "$price"},
-            "maxPrice": {"$max": "$price"},
-            "count": {"$sum": 1}
-        }},
-        {"$sort": {"avgPrice": -1}},
-        {"$limit": 10}
-    ]
-    price_stats = await db.listings.aggregate(price_by_category_pipeline).to_list(length=10)
-    
-    # Daily new listings (last 30 days)
-    thirty_days_ago = now - timedelta(days=30)
-    daily_listings_pipeline = [
-        {"$match": {"posted_date": {"$gte": thirty_days_ago}}},
-        {"$group": {
-            "_id": {
-                "$dateToString": {
-                    "format": "%Y-%m-%d",
-                    "date": "$posted_date"
-                }
-            },
-            "count": {"$sum": 1}
-        }},
-        {"$sort": {"_id": -1}},
-        {"$limit": 30}
-    ]
-    daily_listings = await db.listings.aggregate(daily_listings_pipeline).to_list(length=30)
-    
-    # Top tags (unwind array and count)
-    tags_pipeline = [
-        {"$match": {"tags": {"$exists": True, "$ne": []}}},
-        {"$unwind": "$tags"},
-        {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 15}
-    ]
-    top_tags = await db.listings.aggregate(tags_pipeline).to_list(length=15)
-    
-    # Price range distribution
-    price_ranges_pipeline = [
-        {"$match": {"price": {"$exists": True, "$gt": 0}}},
-        {"$bucket": {
-            "groupBy": "$price",
-            "boundaries": [0, 100, 500, 1000, 5000, 10000, 50000, 100000],
-            "default": "100000+",
-            "output": {"count": {"$sum": 1}}
-        }}
-    ]
-    try:
-        price_ranges = await db.listings.aggregate(price_ranges_pipeline).to_list(length=10)
-    except:
-        price_ranges = []
-    
+    return metrics.snapshot()
+
+
+@router.get("/embedding-queue")
+async def get_embedding_queue(db=Depends(get_db), role: Role = Depends(get_current_role)):
+    """Embedding job queue depth and lag (oldest unfinished job age)"""
+    if role != Role.admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return await queue_stats(db)
+
+
+def live_listing_facets(now: datetime) -> List[dict]:
+    """Every listings breakdown in one collection pass."""
+    # Numeric prices only: one string price would make $bucket (and so the whole $facet) fail
+    priced = {"$match": {"price": {"$type": "number", "$gt": 0}}}
+    return [{"$facet": {
+        "overview": [
+            {"$group": {
+                "_id": None,
+                "hot": {"$sum": 1},
+                "active": {"$sum": {"$cond": [{"$eq": ["$active", True]}, 1, 0]}},
+                "withImages": {"$sum": {"$cond": [{"$gt": [{"$size": {"$ifNull": ["$images", []]}}, 0]}, 1, 0]}},
+            }},
+        ],
+        # Listings by city
+        "byCity": [
+            {"$group": {"_id": "$city", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": 10},
+        ],
+        # Listings by category
+        "byCategory": [
+            {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": 10},
+        ],
+        # Average price by category
+        "priceStatsByCategory": [
+            priced,
+            {"$group": {
+                "_id": "$category",
+                "avgPrice": {"$avg": "$price"},
+                "minPrice": {"$min": "$price"},
+                "maxPrice": {"$max": "$price"},
+                "count": {"$sum": 1}
+            }},
+            {"$sort": {"avgPrice": -1}},
+            {"$limit": 10},
+        ],
+        # Daily new listings (last 30 days)
+        "dailyListings": [
+            {"$match": {"posted_date": {"$gte": now - timedelta(days=30)}}},
+            {"$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$posted_date"}},
+                "count": {"$sum": 1}
+            }},
+            {"$sort": {"_id": -1}},
+            {"$limit": 30},
+        ],
+        # Price range distribution
+        "priceRanges": [
+            priced,
+            {"$bucket": {
+                "groupBy": "$price",
+                "boundaries": [0, 100, 500, 1000, 5000, 10000, 50000, 100000],
+                "default": "100000+",
+                "output": {"count": {"$sum": 1}}
+            }},
+        ],
+        # Most active users (by listing count); userId is the user's ObjectId as a string
+        "mostActiveUsers": [
+            {"$group": {"_id": "$userId", "listingCount": {"$sum": 1}}},
+            {"$sort": {"listingCount": -1}},
+            {"$limit": 10},
+            {"$addFields": {"userOid": {"$convert": {"input": "$_id", "to": "objectId", "onError": None, "onNull": None}}}},
+            {"$lookup": {"from": "users", "localField": "userOid", "foreignField": "_id", "as": "user"}},
+            {"$unwind": {"path": "$user", "preserveNullAndEmptyArrays": True}},
+            {"$project": {"_id": 1, "listingCount": 1, "email": "$user.email"}},
+        ],
+    }}]
+
+
+LIVE_USER_FACETS = [{"$facet": {
+    "overview": [{"$count": "total"}],
     # User registration trend (last 30 days)
-    user_trend_pipeline = [
+    "userRegistrations": [
         {"$group": {
-            "_id": {
-                "$dateToString": {
-                    "format": "%Y-%m-%d",
-                    "date": {"$toDate": "$_id"}
-                }
-            },
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": {"$toDate": "$_id"}}},
             "count": {"$sum": 1}
         }},
         {"$sort": {"_id": -1}},
-        {"$limit": 30}
-    ]
-    user_registrations = await db.users.aggregate(user_trend_pipeline).to_list(length=30)
-    
-    # Listings with images vs without
-    with_images = await db.listings.count_documents({"images": {"$exists": True, "$ne": []}})
-    without_images = total_listings - with_images
-    
-    # Most active users (by listing count)
-    active_users_pipeline = [
-        {"$group": {"_id": "$userId", "listingCount": {"$sum": 1}}},
-        {"$sort": {"listingCount": -1}},
-        {"$limit": 10},
-        {"$lookup": {
-            "from": "users",
-            "localField": "_id",
-            "foreignField": "_id",
-            "as": "user"
-        }},
-        {"$unwind": {"path": "$user", "preserveNullAndEmptyArrays": True}},
-        {"$project": {
-            "_id": 1,
-            "listingCount": 1,
-            "email": "$user.email"
-        }}
-    ]
-    active_users = await db.users.aggregate(active_users_pipeline).to_list(length=10)
-    
+        {"$limit": 30},
+    ],
+}}]
+
+
+async def _timed(name: str, work):
+    start = time.perf_counter()
+    try:
+        return await work
+    finally:
+        metrics.observe(f"live_analytics.{name}_ms", (time.perf_counter() - start) * 1000)
+
+
+async def _compute_live_analytics(db) -> dict:
+    now = datetime.utcnow()
+    # One pass per collection, all in flight at once; tags and distinct counts come from sketches
+    (listings,), (users,), archived, sketches = await asyncio.gather(
+        _timed("listings", db.listings.aggregate(live_listing_facets(now)).to_list(length=1)),
+        _timed("users", db.users.aggregate(LIVE_USER_FACETS).to_list(length=1)),
+        _timed("archive", db.listings_archive.estimated_document_count()),
+        _timed("sketches", stream_analytics.snapshot(db)),
+    )
+    counts = (listings["overview"] or [{}])[0]
+    hot_listings = counts.get("hot", 0)
+    active_listings = counts.get("active", 0)
+    with_images = counts.get("withImages", 0)
+    # Expired listings are moved to listings_archive
+    total_listings = hot_listings + archived
     return {
         "generatedAt": datetime.utcnow().isoformat(),
         "overview": {
             "totalListings": total_listings,
             "activeListings": active_listings,
-            "expiredListings": expired_listings,
-            "totalUsers": total_users,
+            "expiredListings": total_listings - active_listings,
+            "totalUsers": (users["overview"] or [{}])[0].get("total", 0),
             "listingsWithImages": with_images,
-            "listingsWithoutImages": without_images
+            "listingsWithoutImages": hot_listings - with_images,
+            "distinctCities": sketches["distinctCities"],  # approximate (HyperLogLog)
+            f"activeSellers{ACTIVE_SELLER_DAYS}d": sketches["activeSellers"],
         },
-        "byCity": cities,
-        "byCategory": categories,
-        "priceStatsByCategory": price_stats,
-        "dailyListings": daily_listings,
-        "topTags": top_tags,
-        "priceRanges": price_ranges,
-        "userRegistrations": user_registrations,
-        "mostActiveUsers": active_users
+        "byCity": listings["byCity"],
+        "byCategory": listings["byCategory"],
+        "priceStatsByCategory": listings["priceStatsByCategory"],
+        "dailyListings": listings["dailyListings"],
+        "topTags": sketches["topTags"],  # approximate (Count-Min / Space-Saving)
+        "priceRanges": listings["priceRanges"],
+        "userRegistrations": users["userRegistrations"],
+        "mostActiveUsers": listings["mostActiveUsers"]
     }
+
+
+@router.get("/live")
+async def get_live_analytics(db=Depends(get_db), role: Role = Depends(get_current_role)):
+    """
+    Get real-time analytics using MongoDB aggregation pipelines.
+    Provides fresh data without needing ETL (at most LIVE_ANALYTICS_TTL seconds old).
+    """
+    if role != Role.admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+
+    async def render():
+        summary = await _compute_live_analytics(db)
+        return json.dumps(summary, default=str).encode(), {}
+
+    body, _ = await live_cache.get_or_compute("analytics:live", render)
+    return Response(content=body, media_type="application/json")
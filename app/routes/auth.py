@@ -1,32 +1,43 @@
+from dataclasses import dataclass
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from typing import Optional
 
 from app.db.mongo import get_db
 from app.models.user import UserCreate, UserLogin, TokenResponse, Role
-from app.auth.security import hash_password, verify_password, create_access_token, decode_access_token
+from app.auth.security import hash_password_async, verify_password_async, create_access_token, decode_access_token
 
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
-async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
+@dataclass(frozen=True)
+class AuthContext:
+    user_id: str
+    role: Role
+
+
+async def get_auth_context(token: str = Depends(oauth2_scheme)) -> AuthContext:
+    """Caller identity; FastAPI resolves it once per request however many dependencies use it."""
     payload = decode_access_token(token)
     if not payload or "sub" not in payload:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    return payload["sub"]
+    try:
+        role = Role(payload.get("role"))
+    except ValueError:
+        # default to user for older tokens
+        role = Role.user
+    return AuthContext(user_id=payload["sub"], role=role)
 
 
-async def get_current_role(token: str = Depends(oauth2_scheme)) -> Role:
-    payload = decode_access_token(token)
-    if not payload or "role" not in payload:
-        # default to user for older tokens
-        return Role.user
-    try:
-        return Role(payload["role"])
-    except Exception:
-        return Role.user
+async def get_current_user_id(auth: AuthContext = Depends(get_auth_context)) -> str:
+    return auth.user_id
+
+
+async def get_current_role(auth: AuthContext = Depends(get_auth_context)) -> Role:
+    return auth.role
 
 
 @router.post("/register", response_model=TokenResponse)
@@ -34,7 +45,7 @@ async def register(user: UserCreate, db=Depends(get_db)):
     existing = await db.users.find_one({"email": user.email})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed = hash_password(user.password)
+    hashed = await hash_password_async(user.password)
     # default role is user
     res = await db.users.insert_one({"email": user.email, "hashed_password": hashed, "role": Role.user.value})
     user_id = str(res.inserted_id)
@@ -45,8 +56,14 @@ async def register(user: UserCreate, db=Depends(get_db)):
 @router.post("/login", response_model=TokenResponse)
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_db)):
     user = await db.users.find_one({"email": form_data.username})
-    if not user or not verify_password(form_data.password, user.get("hashed_password")):
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await verify_password_async(form_data.password, user.get("hashed_password"))
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Cost parameters changed (e.g. BCRYPT_ROUNDS raised): upgrade while we have the password
+        await db.users.update_one({"_id": user["_id"]}, {"$set": {"hashed_password": new_hash}})
     role = user.get("role") or Role.user.value
     token = create_access_token(str(user.get("_id")), extra_claims={"role": role})
     return TokenResponse(access_token=token, role=Role(role))
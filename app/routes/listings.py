@@ -1,16 +1,34 @@
-from typing import List, Optional
+import asyncio
+import json
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Response, UploadFile, File
 from enum import Enum
 
 from app.db.mongo import get_db
 from app.models.listing import ListingCreate, ListingUpdate, ListingOut, Category
 from app.routes.auth import get_current_user_id
 from app.utils.mongo_helpers import normalize_id
+from app.utils.response_cache import response_cache
+from app.utils.etag import CACHE_CONTROL, etag_matches, listing_etag, not_modified, page_etag, versioned
+from app.utils.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, keyset_filter
 from app.utils.settings import settings
-from app.utils.embeddings import embed_text
-from app.services.storage import save_image
-import math
+from app.utils import metrics
+from app.utils.corpus import corpus_hash, listing_corpus
+from app.utils.embeddings import embed_query_async
+from app.utils.scoring import as_vector, cosine_scores, stack_embeddings, top_k
+from app.utils.embedding_store import embedding_store
+from app.utils.vector_codec import HAS_EMBEDDING, decode_embedding
+from app.utils.vector_index import listing_index
+from app.services.embedding_jobs import enqueue_embedding
+from app.services.rollups import record_tombstone
+from app.services.stream_analytics import stream_analytics
+from app.services.images import generate_variants
+from app.services.storage import UploadTooLarge, acquire_images, release_images, save_image
+import numpy as np
 
 
 router = APIRouter()
@@ -47,70 +65,56 @@ def _to_object_id(id_str: str) -> ObjectId:
         raise HTTPException(status_code=400, detail="Invalid id")
 
 
-def _listing_corpus(doc: dict) -> str:
-    """
-    Enhanced corpus generation with category context and synonym expansion
-    for better semantic embeddings
-    """
-    parts = [
-        doc.get("title") or "",
-        doc.get("description") or "",
-    ]
-    
-    # Add category context to help model understand domain
-    category = doc.get("category", "")
-    if category:
-        parts.append(f"Category: {category}")
-    
-    # Expand tags with common synonyms/variations for better matching
-    tags = doc.get("tags") or []
-    expanded_tags = list(tags)  # Start with original tags
-    
-    for tag in tags:
-        tag_lower = tag.lower()
-        
-        # Brand/product expansions
-        if "iphone" in tag_lower or "apple" in tag_lower:
-            expanded_tags.extend(["Apple smartphone", "iOS phone", "Apple device"])
-        elif "samsung" in tag_lower:
-            expanded_tags.extend(["Samsung smartphone", "Android phone", "Galaxy device"])
-        elif "oneplus" in tag_lower or "one plus" in tag_lower:
-            expanded_tags.extend(["OnePlus smartphone", "Android phone", "One Plus device"])
-        elif "lexus" in tag_lower:
-            expanded_tags.extend(["Lexus vehicle", "luxury car", "Toyota premium brand"])
-        elif "toyota" in tag_lower:
-            expanded_tags.extend(["Toyota vehicle", "automobile", "car"])
-        elif "honda" in tag_lower:
-            expanded_tags.extend(["Honda vehicle", "automobile", "car", "motorcycle"])
-        elif "retriever" in tag_lower or "dog" in tag_lower:
-            expanded_tags.extend(["pet dog", "canine", "puppy", "animal companion"])
-        elif "cat" in tag_lower:
-            expanded_tags.extend(["pet cat", "feline", "kitten", "animal companion"])
-        elif "boat" in tag_lower:
-            expanded_tags.extend(["water vessel", "marine vehicle", "watercraft"])
-        elif "laptop" in tag_lower or "notebook" in tag_lower:
-            expanded_tags.extend(["portable computer", "laptop computer", "notebook computer"])
-        elif "phone" in tag_lower and "iphone" not in tag_lower:
-            expanded_tags.extend(["smartphone", "mobile phone", "cell phone"])
-    
-    if expanded_tags:
-        parts.append(" ".join(expanded_tags))
-    
-    # Add city for location awareness
-    city = doc.get("city") or ""
-    if city:
-        parts.append(f"Location: {city}")
-    
-    return " | ".join([p for p in parts if p])
+async def _page_validator(key: str, if_none_match: Optional[str]) -> tuple:
+    """(generation, weak ETag, 304 response or None) for a browse page."""
+    generation = await response_cache.generation()
+    if generation is None:
+        return None, None, None
+    etag = page_etag(key, response_cache.validator(generation))
+    return generation, etag, not_modified(etag) if etag_matches(if_none_match, etag) else None
+
+
+async def _cached_listings(
+    key: str, page: Callable[[Response], Awaitable[List[dict]]], if_none_match: Optional[str] = None
+) -> Response:
+    """Serve a rendered List[ListingOut] page through the write-invalidated response cache."""
+    generation, etag, unchanged = await _page_validator(key, if_none_match)
+    if unchanged is not None:
+        metrics.incr("etag.not_modified")
+        return unchanged
+
+    async def render():
+        scratch = Response()
+        results = await page(scratch)
+        body = json.dumps(
+            [ListingOut(**r).model_dump(mode="json", by_alias=True) for r in results],
+            ensure_ascii=False, separators=(",", ":"),
+        ).encode()
+        headers = {NEXT_CURSOR_HEADER: scratch.headers[NEXT_CURSOR_HEADER]} if NEXT_CURSOR_HEADER in scratch.headers else {}
+        return body, headers
+
+    body, headers = await response_cache.get_or_compute(key, render, generation)
+    if etag:
+        headers = {**headers, "ETag": etag, "Cache-Control": CACHE_CONTROL}
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _after_cursor(token: str, sort_field: str, sort_direction: int) -> dict:
+    """Range filter for the page after an X-Next-Cursor token."""
+    try:
+        value, last_id = decode_cursor(token, sort_field)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return keyset_filter(sort_field, sort_direction, value, last_id)
 
 
 @router.post("/", response_model=ListingOut)
-async def create_listing(payload: ListingCreate, user_id: str = Depends(get_current_user_id), db=Depends(get_db), background: BackgroundTasks = None):
+async def create_listing(payload: ListingCreate, user_id: str = Depends(get_current_user_id), db=Depends(get_db)):
     # mandatory fields enforced by model; compute posted/expiry
     allowed = {7, 14, 30, 90}
     expiry_days = payload.expiry_days if payload.expiry_days in allowed else 30
-    from datetime import datetime, timedelta
-    posted_date = payload.posted_date or datetime.utcnow()
+    now = datetime.utcnow()
+    posted_date = payload.posted_date or now
     expires_at = posted_date + timedelta(days=expiry_days)
     doc = {
         "title": payload.title,
@@ -124,16 +128,16 @@ async def create_listing(payload: ListingCreate, user_id: str = Depends(get_curr
         "location": {"type": "Point", "coordinates": [payload.lng, payload.lat]},
         "posted_date": posted_date,
         "expires_at": expires_at,
+        "active": True,  # cleared by the expired-listing sweeper (app/services/archive.py)
+        "version": 1,  # bumped by every write (app/utils/etag.py), backs the ETag
+        "updated_at": now,  # ETL watermark (app/services/rollups.py); posted_date may be backdated
     }
     res = await db.listings.insert_one(doc)
-    # Background embedding compute if enabled
-    if settings.enable_semantic_search and background is not None:
-        async def _compute_and_save(listing_id):
-            fresh = await db.listings.find_one({"_id": listing_id})
-            vec = embed_text(_listing_corpus(fresh or {}))
-            await db.listings.update_one({"_id": listing_id}, {"$set": {"embedding": vec}})
-
-        background.add_task(_compute_and_save, res.inserted_id)
+    await response_cache.invalidate()
+    stream_analytics.listing_created(doc)
+    # Durable embedding job; drained by the embedding worker
+    if settings.enable_semantic_search:
+        await enqueue_embedding(db, res.inserted_id)
     created = await db.listings.find_one({"_id": res.inserted_id})
     return normalize_id(created)
 
@@ -141,34 +145,11 @@ async def create_listing(payload: ListingCreate, user_id: str = Depends(get_curr
 # IMPORTANT: Specific routes like /me, /latest, /categories MUST come before /{listing_id}
 # Otherwise FastAPI will match /me to /{listing_id} and try to parse "me" as an ObjectId
 
-@router.get("/latest", response_model=List[ListingOut])
-async def latest_listings(
-    limit: int = 12,
-    sort_by: SortOption = Query(default=SortOption.date_desc, description="Sort listings by field"),
-    min_price: Optional[float] = Query(default=None, ge=0, description="Minimum price filter"),
-    max_price: Optional[float] = Query(default=None, ge=0, description="Maximum price filter"),
-    lat: Optional[float] = Query(default=None, description="Latitude for location filtering"),
-    lng: Optional[float] = Query(default=None, description="Longitude for location filtering"),
-    radius: Optional[float] = Query(default=10000, ge=0, description="Search radius in meters (default: 10km)"),
-    db=Depends(get_db)
-):
-    """
-    Get latest listings with optional sorting, price filtering, and location filtering
-    
-    Sort options:
-    - date_desc: Newest first (default)
-    - date_asc: Oldest first
-    - price_asc: Price low to high
-    - price_desc: Price high to low
-    
-    Filters:
-    - min_price/max_price: Filter by price range
-    - lat/lng/radius: Filter by distance from location (requires both lat and lng)
-    """
+async def _latest_listings(limit, sort_by, min_price, max_price, lat, lng, radius, db) -> List[dict]:
     limit = max(1, min(limit, 50))
     
-    # Build query with filters
-    query = {}
+    # Build query with filters (expired listings are inactive)
+    query = {"active": True}
     
     # Price range filtering
     if min_price is not None or max_price is not None:
@@ -220,6 +201,39 @@ async def latest_listings(
     return results
 
 
+@router.get("/latest", response_model=List[ListingOut])
+async def latest_listings(
+    limit: int = 12,
+    sort_by: SortOption = Query(default=SortOption.date_desc, description="Sort listings by field"),
+    min_price: Optional[float] = Query(default=None, ge=0, description="Minimum price filter"),
+    max_price: Optional[float] = Query(default=None, ge=0, description="Maximum price filter"),
+    lat: Optional[float] = Query(default=None, description="Latitude for location filtering"),
+    lng: Optional[float] = Query(default=None, description="Longitude for location filtering"),
+    radius: Optional[float] = Query(default=10000, ge=0, description="Search radius in meters (default: 10km)"),
+    if_none_match: Optional[str] = Header(default=None, include_in_schema=False),
+    db=Depends(get_db)
+):
+    """
+    Get latest listings with optional sorting, price filtering, and location filtering
+    
+    Sort options:
+    - date_desc: Newest first (default)
+    - date_asc: Oldest first
+    - price_asc: Price low to high
+    - price_desc: Price high to low
+    
+    Filters:
+    - min_price/max_price: Filter by price range
+    - lat/lng/radius: Filter by distance from location (requires both lat and lng)
+    """
+    key = response_cache.key(
+        "latest", limit=limit, sort_by=sort_by, min_price=min_price, max_price=max_price, lat=lat, lng=lng, radius=radius
+    )
+    return await _cached_listings(
+        key, lambda _: _latest_listings(limit, sort_by, min_price, max_price, lat, lng, radius, db), if_none_match
+    )
+
+
 @router.get("/categories", response_model=List[str])
 async def list_categories():
     try:
@@ -231,11 +245,9 @@ async def list_categories():
 @router.get("/me", response_model=List[ListingOut])
 async def my_listings(user_id: str = Depends(get_current_user_id), db=Depends(get_db)):
     try:
-        # active = not expired
-        from datetime import datetime
-        now = datetime.utcnow()
+        # active = not expired (the sweeper clears the flag and archives the listing)
         print(f"Fetching listings for user: {user_id}")
-        cursor = db.listings.find({"userId": user_id, "$or": [{"expires_at": {"$gt": now}}, {"expires_at": {"$exists": False}}]}).sort("posted_date", -1)
+        cursor = db.listings.find({"userId": user_id, "active": True}).sort("posted_date", -1)
         results = []
         skipped = 0
         async for doc in cursor:
@@ -258,7 +270,7 @@ async def my_listings(user_id: str = Depends(get_current_user_id), db=Depends(ge
 
 
 @router.put("/{listing_id}", response_model=ListingOut)
-async def update_listing(listing_id: str, payload: ListingUpdate, user_id: str = Depends(get_current_user_id), db=Depends(get_db), background: BackgroundTasks = None):
+async def update_listing(listing_id: str, payload: ListingUpdate, user_id: str = Depends(get_current_user_id), db=Depends(get_db)):
     oid = _to_object_id(listing_id)
     doc = await db.listings.find_one({"_id": oid})
     if not doc:
@@ -279,20 +291,27 @@ async def update_listing(listing_id: str, payload: ListingUpdate, user_id: str =
     if payload.expiry_days is not None:
         allowed = {7, 14, 30, 90}
         days = payload.expiry_days if payload.expiry_days in allowed else 30
-        from datetime import datetime, timedelta
         # Use existing posted_date or now
         base = doc.get("posted_date") or datetime.utcnow()
         update["expires_at"] = base + timedelta(days=days)
+        update["active"] = update["expires_at"] > datetime.utcnow()
     if not update:
         return normalize_id(doc)
-    await db.listings.update_one({"_id": oid}, {"$set": update})
-    if settings.enable_semantic_search and background is not None and update:
-        async def _compute_and_save(listing_id):
-            fresh = await db.listings.find_one({"_id": listing_id})
-            vec = embed_text(_listing_corpus(fresh or {}))
-            await db.listings.update_one({"_id": listing_id}, {"$set": {"embedding": vec}})
-
-        background.add_task(_compute_and_save, oid)
+    if "images" in update and doc.get("image_variants"):
+        # Variants follow their original; drop those whose image was removed
+        update["image_variants"] = [v for v in doc["image_variants"] if v.get("src") in update["images"]]
+    if "images" in update:
+        before, after = Counter(doc.get("images") or []), Counter(update["images"])
+        await acquire_images(db, (after - before).elements())
+    await db.listings.update_one({"_id": oid}, versioned({"$set": update}))
+    await response_cache.invalidate()
+    if "images" in update:
+        await release_images(db, (before - after).elements())
+    stream_analytics.listing_updated(doc, {**doc, **update})
+    # Only re-embed when the text the embedding is built from changed (not price/images/expiry)
+    if settings.enable_semantic_search:
+        if corpus_hash(listing_corpus({**doc, **update}), settings.embedding_model) != doc.get("embedding_hash"):
+            await enqueue_embedding(db, oid)
     updated = await db.listings.find_one({"_id": oid})
     return normalize_id(updated)
 
@@ -306,41 +325,21 @@ async def delete_listing(listing_id: str, user_id: str = Depends(get_current_use
     if doc.get("userId") != user_id:
         raise HTTPException(status_code=403, detail="Not authorized")
     await db.listings.delete_one({"_id": oid})
+    await record_tombstone(db, oid)
+    await response_cache.invalidate()
+    await release_images(db, doc.get("images") or [])
+    stream_analytics.listing_removed(doc)
+    listing_index.remove(listing_id)
+    await asyncio.to_thread(embedding_store.delete, [listing_id])
     return {"deleted": True}
 
 
-@router.get("/", response_model=List[ListingOut])
-async def list_listings(
-    skip: int = 0,
-    limit: int = 20,
-    category: Optional[Category] = None,
-    sort_by: SortOption = Query(default=SortOption.date_desc, description="Sort listings by field"),
-    min_price: Optional[float] = Query(default=None, ge=0, description="Minimum price filter"),
-    max_price: Optional[float] = Query(default=None, ge=0, description="Maximum price filter"),
-    lat: Optional[float] = Query(default=None, description="Latitude for location filtering"),
-    lng: Optional[float] = Query(default=None, description="Longitude for location filtering"),
-    radius: Optional[float] = Query(default=10000, ge=0, description="Search radius in meters (default: 10km)"),
-    db=Depends(get_db)
-):
-    """
-    List all listings with optional filtering and sorting
-    
-    Sort options:
-    - date_desc: Newest first (default)
-    - date_asc: Oldest first
-    - price_asc: Price low to high
-    - price_desc: Price high to low
-    
-    Filters:
-    - category: Filter by category
-    - min_price/max_price: Filter by price range
-    - lat/lng/radius: Filter by distance from location (requires both lat and lng)
-    """
+async def _list_listings(skip, limit, category, sort_by, min_price, max_price, lat, lng, radius, cursor, response, db) -> List[dict]:
     skip = max(0, skip)
     limit = max(1, min(limit, 100))
     
-    # Build query with filters
-    query = {}
+    # Build query with filters (expired listings are inactive)
+    query = {"active": True}
     if category:
         query["category"] = category.value if isinstance(category, Category) else str(category)
     
@@ -354,25 +353,31 @@ async def list_listings(
         if price_query:
             query["price"] = price_query
     
-    # Location filtering using MongoDB geospatial query
+    # Location filtering using MongoDB geospatial query. Results are ordered by
+    # sort_by rather than distance, so a radius filter is all that is needed.
     if lat is not None and lng is not None:
         query["location"] = {
-            "$near": {
-                "$geometry": {
-                    "type": "Point",
-                    "coordinates": [lng, lat]  # MongoDB uses [longitude, latitude] order
-                },
-                "$maxDistance": radius  # Distance in meters
+            "$geoWithin": {
+                "$centerSphere": [[lng, lat], (radius or 0) / 6378100]  # [longitude, latitude], radians
             }
         }
     
     # Get sort parameters
     sort_field, sort_direction = _get_sort_params(sort_by)
+    if cursor:
+        query.update(_after_cursor(cursor, sort_field, sort_direction))
     
-    # Fetch extra to account for invalid entries
-    cursor = db.listings.find(query).sort(sort_field, sort_direction).skip(skip).limit(limit * 2)
+    # Fetch extra to account for invalid entries; _id breaks ties so the cursor position is unique
+    rows = db.listings.find(query).sort([(sort_field, sort_direction), ("_id", sort_direction)])
+    if not cursor:
+        rows = rows.skip(skip)
+    rows = rows.limit(limit * 2)
     results = []
-    async for doc in cursor:
+    scanned = 0
+    last_key = None
+    async for doc in rows:
+        scanned += 1
+        last_key = (doc.get(sort_field), doc["_id"])
         try:
             normalized = normalize_id(doc)
             if 'embedding' in normalized:
@@ -384,9 +389,65 @@ async def list_listings(
         except Exception as e:
             print(f"⚠️  Skipping invalid listing {doc.get('_id')}: {str(e)}")
             continue
+    if last_key is not None and (len(results) >= limit or scanned >= limit * 2):
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(sort_field, *last_key)
     return results
 
 
+@router.get("/", response_model=List[ListingOut])
+async def list_listings(
+    skip: int = 0,
+    limit: int = 20,
+    category: Optional[Category] = None,
+    sort_by: SortOption = Query(default=SortOption.date_desc, description="Sort listings by field"),
+    min_price: Optional[float] = Query(default=None, ge=0, description="Minimum price filter"),
+    max_price: Optional[float] = Query(default=None, ge=0, description="Maximum price filter"),
+    lat: Optional[float] = Query(default=None, description="Latitude for location filtering"),
+    lng: Optional[float] = Query(default=None, description="Longitude for location filtering"),
+    radius: Optional[float] = Query(default=10000, ge=0, description="Search radius in meters (default: 10km)"),
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor from the previous page (replaces skip)"),
+    response: Response = None,
+    if_none_match: Optional[str] = Header(default=None, include_in_schema=False),
+    db=Depends(get_db)
+):
+    """
+    List all listings with optional filtering and sorting
+    
+    Sort options:
+    - date_desc: Newest first (default)
+    - date_asc: Oldest first
+    - price_asc: Price low to high
+    - price_desc: Price high to low
+    
+    Filters:
+    - category: Filter by category
+    - min_price/max_price: Filter by price range
+    - lat/lng/radius: Filter by distance from location (requires both lat and lng)
+
+    Pagination: pass the X-Next-Cursor response header back as `cursor` for the next page.
+    """
+    async def page(resp: Response) -> List[dict]:
+        return await _list_listings(skip, limit, category, sort_by, min_price, max_price, lat, lng, radius, cursor, resp, db)
+
+    key = response_cache.key(
+        "list", limit=limit, category=category, sort_by=sort_by,
+        min_price=min_price, max_price=max_price, lat=lat, lng=lng, radius=radius,
+        skip=skip or None, cursor=cursor,
+    )
+    if skip > 0 or cursor:
+        # Deeper pages are not cached, but revalidation still skips the query
+        _, etag, unchanged = await _page_validator(key, if_none_match)
+        if unchanged is not None:
+            metrics.incr("etag.not_modified")
+            return unchanged
+        if etag:
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = CACHE_CONTROL
+        return await page(response)
+    # First pages are the hot ones (browse landing, per-category tabs)
+    return await _cached_listings(key, page, if_none_match)
+
+
 @router.get("/search/advanced", response_model=List[ListingOut])
 async def search_listings(
     q: Optional[str] = Query(default=None, description="Text query"),
@@ -401,6 +462,8 @@ async def search_listings(
     skip: int = 0,
     limit: int = 20,
     sort_by: SortOption = Query(default=SortOption.similarity, description="Sort results by field"),
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor from the previous page (replaces skip)"),
+    response: Response = None,
     db=Depends(get_db),
 ):
     """
@@ -419,13 +482,15 @@ async def search_listings(
     - category: Filter by category
     - min_price/max_price: Filter by price range
     - lat/lng/radius: Filter by distance from location
+
+    Pagination: pass the X-Next-Cursor response header back as `cursor` for the next page.
     """
     skip = max(0, skip)
     limit = max(1, min(limit, 100))
     pipeline = []
 
     # Text search must be first if provided (MongoDB requirement)
-    match = {}
+    match = {"active": True}
     if q:
         match["$text"] = {"$search": q}
     
@@ -447,8 +512,7 @@ async def search_listings(
             match["price"] = price_query
     
     # Add initial match stage
-    if match:
-        pipeline.append({"$match": match})
+    pipeline.append({"$match": match})
     
     # Add text score if text search was used
     if q:
@@ -492,19 +556,27 @@ async def search_listings(
         }
     )
 
-    # Apply sorting based on user preference
+    # Apply sorting based on user preference; _id breaks ties so the cursor position is unique
     if sort_by == SortOption.similarity:
-        pipeline.append({"$sort": {"score": -1}})
+        sort_field, sort_direction = "score", -1
     else:
         sort_field, sort_direction = _get_sort_params(sort_by)
-        pipeline.append({"$sort": {sort_field: sort_direction}})
+    if cursor:
+        # MongoDB moves this $match ahead of the score stages when sorting by a stored field
+        pipeline.append({"$match": _after_cursor(cursor, sort_field, sort_direction)})
+    pipeline.append({"$sort": {sort_field: sort_direction, "_id": sort_direction}})
     
-    pipeline.append({"$skip": skip})
+    if not cursor:
+        pipeline.append({"$skip": skip})
     pipeline.append({"$limit": limit * 2})  # Fetch extra to account for invalid entries
 
-    cursor = db.listings.aggregate(pipeline)
+    rows = db.listings.aggregate(pipeline)
     results = []
-    async for doc in cursor:
+    scanned = 0
+    last_key = None
+    async for doc in rows:
+        scanned += 1
+        last_key = (doc.get(sort_field), doc["_id"])
         try:
             normalized = normalize_id(doc)
             if 'embedding' in normalized:
@@ -516,24 +588,54 @@ async def search_listings(
         except Exception as e:
             print(f"⚠️  Skipping invalid listing {doc.get('_id')}: {str(e)}")
             continue
+    if last_key is not None and (len(results) >= limit or scanned >= limit * 2):
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(sort_field, *last_key)
     return results
 
 
 @router.get("/nearby", response_model=List[ListingOut])
-async def listings_within_radius(lat: float, lng: float, radius: float = 5000, skip: int = 0, limit: int = 20, db=Depends(get_db)):
+async def listings_within_radius(
+    lat: float,
+    lng: float,
+    radius: float = 5000,
+    skip: int = 0,
+    limit: int = 20,
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor from the previous page (replaces skip)"),
+    response: Response = None,
+    db=Depends(get_db),
+):
+    """Listings within radius meters, nearest first."""
     skip = max(0, skip)
     limit = max(1, min(limit, 100))
-    query = {
-        "location": {
-            "$near": {
-                "$geometry": {"type": "Point", "coordinates": [lng, lat]},
-                "$maxDistance": radius,
-            }
-        }
+    geo_near = {
+        "near": {"type": "Point", "coordinates": [lng, lat]},
+        "distanceField": "distance",
+        "spherical": True,
+        "maxDistance": radius,
+        "query": {"active": True},
     }
-    cursor = db.listings.find(query).skip(skip).limit(limit * 2)
+    # Distance order: resume at the last distance, excluding the listings already
+    # returned at exactly that distance (the cursor carries their ids)
+    if cursor:
+        try:
+            last_distance, seen_ids = decode_cursor(cursor, "distance")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        geo_near["minDistance"] = last_distance
+        geo_near["query"]["_id"] = {"$nin": seen_ids}
+    pipeline = [{"$geoNear": geo_near}]
+    if not cursor:
+        pipeline.append({"$skip": skip})
+    pipeline.append({"$limit": limit * 2})
     results = []
-    async for doc in cursor:
+    scanned = 0
+    last_distance = None
+    tied_ids = []
+    async for doc in db.listings.aggregate(pipeline):
+        scanned += 1
+        if doc["distance"] != last_distance:
+            last_distance, tied_ids = doc["distance"], []
+        tied_ids.append(doc["_id"])
         try:
             normalized = normalize_id(doc)
             if 'embedding' in normalized:
@@ -545,14 +647,76 @@ async def listings_within_radius(lat: float, lng: float, radius: float = 5000, s
         except Exception as e:
             print(f"⚠️  Skipping invalid listing {doc.get('_id')}: {str(e)}")
             continue
+    if scanned and (len(results) >= limit or scanned >= limit * 2):
+        if cursor and geo_near["minDistance"] == last_distance:
+            tied_ids = geo_near["query"]["_id"]["$nin"] + tied_ids
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor("distance", last_distance, tied_ids)
     return results
 
 
-def _cosine(a, b):
-    dot = sum((x or 0.0) * (y or 0.0) for x, y in zip(a, b))
-    na = math.sqrt(sum((x or 0.0) ** 2 for x in a))
-    nb = math.sqrt(sum((y or 0.0) ** 2 for y in b))
-    return 0.0 if na == 0 or nb == 0 else dot / (na * nb)
+async def _semantic_scores(db, query_vec, base_filter: dict) -> Dict[str, float]:
+    """
+    Listing id -> cosine score for listings matching base_filter, without fetching the listings.
+
+    With the in-memory index loaded, unfiltered queries take the nearest neighbours
+    from the ANN index. Filtered queries fetch the matching ids from MongoDB and scan
+    their binary codes exhaustively, re-ranking the closest with exact cosine.
+    Without the index (or when the query's dimension differs from the stored
+    embeddings, e.g. after changing EMBEDDING_MODEL), up to 500 embedded listings are scored in one batched product.
+    """
+    if listing_index.accepts(query_vec):
+        filters = {k: v for k, v in base_filter.items() if k != "embedding"}
+        if set(filters) - {"active"}:
+            ids = [str(d["_id"]) async for d in db.listings.find(filters, {"_id": 1})]
+            return dict(listing_index.search_subset(query_vec, ids, settings.semantic_candidates, settings.binary_shortlist))
+        return dict(listing_index.search(query_vec, settings.semantic_candidates))
+    docs = await db.listings.find(base_filter, {"embedding": 1}).limit(500).to_list(length=500)
+    return {str(d["_id"]): score for d, score in _score_docs(query_vec, docs)}
+
+
+def _score_docs(query_vec, docs: List[dict]) -> List[tuple]:
+    if not docs:
+        return []
+    query = as_vector(query_vec)
+    matrix = stack_embeddings([decode_embedding(d.pop("embedding", None)) for d in docs], query.size)
+    scores = cosine_scores(query, matrix)
+    return [(d, float(score)) for d, score in zip(docs, scores)]
+
+
+async def _semantic_candidates(db, query_vec, base_filter: dict) -> List[tuple]:
+    """Return (doc, cosine score) pairs for listings matching base_filter."""
+    if listing_index.accepts(query_vec):
+        hits = await _semantic_scores(db, query_vec, base_filter)
+        if not hits:
+            return []
+        query = {"_id": {"$in": [ObjectId(i) for i in hits]}, "active": True}
+        docs = await db.listings.find(query, {"embedding": 0}).to_list(length=None)
+        return [(d, hits[str(d["_id"])]) for d in docs]
+    # Fallback: one query returns the documents and their embeddings together
+    docs = await db.listings.find(base_filter).limit(500).to_list(length=500)
+    return _score_docs(query_vec, docs)
+
+
+async def _text_scores(db, text_match: dict) -> Dict[str, float]:
+    """Listing id -> $text score normalised to 0-1, best 500 matches only."""
+    pipeline = [
+        {"$match": text_match},
+        {"$project": {"textScore": {"$meta": "textScore"}}},
+        {"$sort": {"textScore": {"$meta": "textScore"}}},
+        {"$limit": 500},
+    ]
+    scores = {}
+    try:
+        async for d in db.listings.aggregate(pipeline):
+            scores[str(d["_id"])] = d.get("textScore", 0)
+    except Exception as e:
+        # If text search fails (no index), continue with semantic only
+        print(f"⚠️  Text search failed: {e}")
+        return {}
+    max_score = max(scores.values(), default=0.0)
+    if max_score <= 0:
+        return {}
+    return {k: v / max_score for k, v in scores.items()}
 
 
 @router.get("/search/semantic", response_model=List[ListingOut])
@@ -593,10 +757,10 @@ async def semantic_search(
     expanded_query = preprocess_query(q)
     print(f"🔍 Original query: '{q}' → Expanded: '{expanded_query[:100]}...'")
     
-    query_vec = embed_text(expanded_query)
+    query_vec = await embed_query_async(expanded_query)
     
     # Base filter: only docs that have embeddings
-    base_filter: dict = {"embedding": {"$type": "array"}}
+    base_filter: dict = {"embedding": HAS_EMBEDDING, "active": True}
     if city:
         base_filter["city"] = city
     if tags:
@@ -616,9 +780,7 @@ async def semantic_search(
             base_filter["price"]["$lte"] = max_price
 
     candidates = []
-    async for d in db.listings.find(base_filter).limit(500):
-        score = _cosine(query_vec, d.get("embedding") or [])
-        
+    for d, score in await _semantic_candidates(db, query_vec, base_filter):
         # Filter by minimum similarity threshold
         if score >= min_score:
             d["_score"] = score
@@ -628,7 +790,8 @@ async def semantic_search(
     
     # Sort based on user preference
     if sort_by == SortOption.similarity:
-        ranked = sorted(candidates, key=lambda x: x.get("_score", 0), reverse=True)[:limit * 2]
+        scores = np.fromiter((d["_score"] for d in candidates), dtype=np.float32, count=len(candidates))
+        ranked = [candidates[i] for i in top_k(scores, limit * 2)]
     elif sort_by == SortOption.price_asc:
         ranked = sorted(candidates, key=lambda x: x.get("price", 0))[:limit * 2]
     elif sort_by == SortOption.price_desc:
@@ -672,6 +835,7 @@ async def hybrid_search(
     semantic_weight: float = Query(default=0.6, description="Weight for semantic search (0-1)"),
     min_score: float = Query(default=0.2, description="Minimum combined score"),
     sort_by: SortOption = Query(default=SortOption.similarity, description="Sort results by field"),
+    response: Response = None,
     db=Depends(get_db),
 ):
     """
@@ -701,80 +865,46 @@ async def hybrid_search(
     
     print(f"🔍 Hybrid search: '{q}' (text: {text_weight:.2f}, semantic: {semantic_weight:.2f})")
     
-    # Preprocess query for semantic search
-    from app.utils.query_processor import preprocess_query
-    expanded_query = preprocess_query(q)
-    
-    # 1. Get semantic search candidates
-    query_vec = embed_text(expanded_query)
-    
-    base_filter: dict = {"embedding": {"$type": "array"}}
+    # Filters shared by the semantic and the keyword candidate scans
+    filters: dict = {"active": True}
     if city:
-        base_filter["city"] = city
+        filters["city"] = city
     if tags:
-        base_filter["tags"] = {"$in": [t.strip() for t in tags.split(",") if t.strip()]}
+        filters["tags"] = {"$in": [t.strip() for t in tags.split(",") if t.strip()]}
     if category:
-        base_filter["category"] = category.value if isinstance(category, Category) else str(category)
+        filters["category"] = category.value if isinstance(category, Category) else str(category)
     if lat is not None and lng is not None and radius:
-        base_filter["location"] = {
+        filters["location"] = {
             "$geoWithin": {"$centerSphere": [[lng, lat], (radius / 1000) / 6378.1]}
         }
-    # Price filtering
     if min_price is not None or max_price is not None:
-        base_filter["price"] = {}
+        filters["price"] = {}
         if min_price is not None:
-            base_filter["price"]["$gte"] = min_price
+            filters["price"]["$gte"] = min_price
         if max_price is not None:
-            base_filter["price"]["$lte"] = max_price
-    
-    # Get semantic scores
-    semantic_scores = {}
-    async for d in db.listings.find(base_filter).limit(500):
-        doc_id = str(d["_id"])
-        semantic_scores[doc_id] = _cosine(query_vec, d.get("embedding") or [])
-    
-    # 2. Get text search candidates
-    text_match = {"$text": {"$search": q}}
-    if city:
-        text_match["city"] = city
-    if tags:
-        text_match["tags"] = {"$in": [t.strip() for t in tags.split(",") if t.strip()]}
-    if category:
-        text_match["category"] = category.value if isinstance(category, Category) else str(category)
-    if lat is not None and lng is not None and radius:
-        text_match["location"] = {
-            "$geoWithin": {"$centerSphere": [[lng, lat], (radius / 1000) / 6378.1]}
-        }
-    # Price filtering
-    if min_price is not None or max_price is not None:
-        text_match["price"] = {}
-        if min_price is not None:
-            text_match["price"]["$gte"] = min_price
-        if max_price is not None:
-            text_match["price"]["$lte"] = max_price
-    
-    text_pipeline = [
-        {"$match": text_match},
-        {"$addFields": {"textScore": {"$meta": "textScore"}}},
-        {"$limit": 500}
-    ]
-    
-    text_scores = {}
-    max_text_score = 0.0
-    try:
-        async for d in db.listings.aggregate(text_pipeline):
-            doc_id = str(d["_id"])
-            score = d.get("textScore", 0)
-            text_scores[doc_id] = score
-            max_text_score = max(max_text_score, score)
-    except Exception as e:
-        # If text search fails (no index), continue with semantic only
-        print(f"⚠️  Text search failed: {e}")
-        text_scores = {}
-    
-    # Normalize text scores to 0-1 range
-    if max_text_score > 0:
-        text_scores = {k: v / max_text_score for k, v in text_scores.items()}
+            filters["price"]["$lte"] = max_price
+
+    timings = {}
+    started = time.perf_counter()
+
+    async def semantic_phase() -> Dict[str, float]:
+        from app.utils.query_processor import preprocess_query
+        t0 = time.perf_counter()
+        query_vec = await embed_query_async(preprocess_query(q))
+        t1 = time.perf_counter()
+        scores = await _semantic_scores(db, query_vec, {"embedding": HAS_EMBEDDING, **filters})
+        timings["embed"] = (t1 - t0) * 1000
+        timings["semantic"] = (time.perf_counter() - t1) * 1000
+        return scores
+
+    async def text_phase() -> Dict[str, float]:
+        t0 = time.perf_counter()
+        scores = await _text_scores(db, {"$text": {"$search": q}, **filters})
+        timings["text"] = (time.perf_counter() - t0) * 1000
+        return scores
+
+    # 1-2. Semantic and keyword candidates (ids + scores only), concurrently
+    semantic_scores, text_scores = await asyncio.gather(semantic_phase(), text_phase())
     
     # 3. Combine scores
     all_doc_ids = set(semantic_scores.keys()) | set(text_scores.keys())
@@ -794,40 +924,35 @@ async def hybrid_search(
     
     print(f"✅ Found {len(combined_scores)} results above threshold {min_score}")
     
-    # 4. Fetch documents first
-    from bson import ObjectId
+    # 4. Fetch the documents in one $in query
+    t0 = time.perf_counter()
     if sort_by == SortOption.similarity:
-        # Sort by combined score
-        top_ids = sorted(combined_scores.items(), key=lambda x: x[1]["combined"], reverse=True)
+        ranked_ids = sorted(combined_scores, key=lambda k: combined_scores[k]["combined"], reverse=True)[:limit * 3]
+        query = {"_id": {"$in": [ObjectId(i) for i in ranked_ids]}, "active": True}
+        by_id = {str(d["_id"]): d async for d in db.listings.find(query, {"embedding": 0})}
+        docs = [by_id[i] for i in ranked_ids if i in by_id]  # keep ranked order
     else:
-        # Need to fetch docs to sort by other fields
-        top_ids = list(combined_scores.items())
-    
-    # Fetch documents (extra for validation)
-    docs_with_scores = []
-    for doc_id, scores in top_ids[:limit * 3]:
-        doc = await db.listings.find_one({"_id": ObjectId(doc_id)})
-        if doc:
-            doc["_score"] = scores["combined"]
-            doc["_text_score"] = scores["text"]
-            doc["_semantic_score"] = scores["semantic"]
-            docs_with_scores.append(doc)
-    
-    # Apply sorting if not similarity
-    if sort_by == SortOption.price_asc:
-        docs_with_scores.sort(key=lambda x: x.get("price", 0))
-    elif sort_by == SortOption.price_desc:
-        docs_with_scores.sort(key=lambda x: x.get("price", 0), reverse=True)
-    elif sort_by == SortOption.date_desc:
-        docs_with_scores.sort(key=lambda x: x.get("posted_date", ""), reverse=True)
-    elif sort_by == SortOption.date_asc:
-        docs_with_scores.sort(key=lambda x: x.get("posted_date", ""))
-    
+        # Other sort orders are applied by MongoDB over every qualifying candidate
+        sort_field, sort_direction = _get_sort_params(sort_by)
+        query = {"_id": {"$in": [ObjectId(i) for i in combined_scores]}, "active": True}
+        cursor = db.listings.find(query, {"embedding": 0}).sort(sort_field, sort_direction).limit(limit * 2)
+        docs = await cursor.to_list(length=limit * 2)
+    timings["fetch"] = (time.perf_counter() - t0) * 1000
+    timings["total"] = (time.perf_counter() - started) * 1000
+
+    phases = ("embed", "semantic", "text", "fetch", "total")
+    for phase in phases:
+        metrics.observe(f"hybrid_search.{phase}_ms", timings[phase])
+    response.headers["Server-Timing"] = ", ".join(f"{phase};dur={timings[phase]:.1f}" for phase in phases)
+
     # Validate and return
     results = []
-    for doc in docs_with_scores[:limit * 2]:
+    for doc in docs[:limit * 2]:
+        scores = combined_scores[str(doc["_id"])]
+        doc["_score"] = scores["combined"]
+        doc["_text_score"] = scores["text"]
+        doc["_semantic_score"] = scores["semantic"]
         try:
-            doc.pop("embedding", None)
             normalized = normalize_id(doc)
             ListingOut(**normalized)
             results.append(normalized)
@@ -842,11 +967,25 @@ async def hybrid_search(
 
 # IMPORTANT: This route MUST be last among GET routes to avoid catching specific routes like /latest
 @router.get("/{listing_id}", response_model=ListingOut)
-async def get_listing(listing_id: str, db=Depends(get_db)):
-    doc = await db.listings.find_one({"_id": _to_object_id(listing_id)})
+async def get_listing(
+    listing_id: str,
+    response: Response = None,
+    if_none_match: Optional[str] = Header(default=None, include_in_schema=False),
+    db=Depends(get_db),
+):
+    oid = _to_object_id(listing_id)
+    if if_none_match:
+        # Revalidation reads only the version; the document is neither fetched nor serialised
+        head = await db.listings.find_one({"_id": oid}, {"version": 1})
+        if head and etag_matches(if_none_match, listing_etag(head)):
+            metrics.incr("etag.not_modified")
+            return not_modified(listing_etag(head))
+    doc = await db.listings.find_one({"_id": oid}, {"embedding": 0})
     if not doc:
         raise HTTPException(status_code=404, detail="Listing not found")
-    
+    response.headers["ETag"] = listing_etag(doc)
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
     try:
         normalized = normalize_id(doc)
         if 'embedding' in normalized:
@@ -862,11 +1001,12 @@ async def get_listing(listing_id: str, db=Depends(get_db)):
 @router.post("/{listing_id}/images/upload")
 async def upload_listing_image(
     listing_id: str,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     user_id: str = Depends(get_current_user_id),
     db=Depends(get_db),
 ):
-    """Upload an image file for a listing"""
+    """Upload an image file for a listing; thumbnails/WebP variants are rendered after the response"""
     oid = _to_object_id(listing_id)
     doc = await db.listings.find_one({"_id": oid})
     if not doc:
@@ -877,9 +1017,18 @@ async def upload_listing_image(
     if not (file.content_type or "").startswith("image/"):
         raise HTTPException(status_code=400, detail="Only image uploads are allowed")
 
-    url = await save_image(file, listing_id)
-    await db.listings.update_one({"_id": oid}, {"$push": {"images": url}})
-    return {"url": url}
+    try:
+        saved = await save_image(db, file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"Image too large: {e}")
+    res = await db.listings.update_one({"_id": oid}, versioned({"$push": {"images": saved.url}}))
+    if not res.matched_count:
+        # Deleted while uploading: give back the reference save_image took
+        await release_images(db, [saved.url])
+        raise HTTPException(status_code=404, detail="Listing not found")
+    await response_cache.invalidate()
+    background_tasks.add_task(generate_variants, db, oid, saved.url, saved.path, saved.sha256)
+    return {"url": saved.url}
 
 
 @router.post("/{listing_id}/images/url")
@@ -902,5 +1051,6 @@ async def add_image_by_url(
         raise HTTPException(status_code=400, detail="Invalid URL format")
     
     # Add the URL to the images array
-    await db.listings.update_one({"_id": oid}, {"$push": {"images": image_url}})
+    await db.listings.update_one({"_id": oid}, versioned({"$push": {"images": image_url}}))
+    await response_cache.invalidate()
     return {"url": image_url, "message": "Image URL added successfully"}
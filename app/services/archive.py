@@ -0,0 +1,103 @@
+"""Expired-listing sweeper: keeps ``db.listings`` limited to live listings.
+
+Each pass first flips ``active`` to false on listings past ``expires_at``,
+which drops them out of every browse/search query and every partial index
+(``{"active": True}``) in one update. It then moves inactive listings to
+``listings_archive`` in batches and removes them from the embedding store
+and this process's ANN index. Other API workers drop them on their next
+index refresh (app/utils/vector_index.py reads ``archived_at``).
+
+Runs inside the API every ``settings.archive_sweep_seconds`` or on demand
+with ``python -m etl.archive_expired``.
+"""
+import asyncio
+from datetime import datetime
+from typing import List
+
+from pymongo import ReplaceOne
+
+from app.utils import metrics
+from app.utils.embedding_store import embedding_store
+from app.utils.etag import versioned
+from app.utils.response_cache import response_cache
+from app.services.stream_analytics import stream_analytics
+from app.utils.vector_index import listing_index
+
+
+async def backfill_active_flags(db) -> int:
+    """Set ``active`` on listings created before the flag existed."""
+    now = datetime.utcnow()
+    res = await db.listings.update_many(
+        {"active": {"$exists": False}},
+        [{"$set": {"active": {"$or": [
+            {"$eq": [{"$ifNull": ["$expires_at", None]}, None]},
+            {"$gt": ["$expires_at", now]},
+        ]}}}],
+    )
+    return res.modified_count
+
+
+async def archive_inactive(db, batch_size: int = 500) -> List[str]:
+    """Move inactive listings to ``listings_archive``; returns the archived ids.
+
+    Every API worker runs the sweeper, so two passes can read the same batch.
+    Each listing is claimed by deleting it with ``find_one_and_delete``; only
+    the pass whose delete succeeded reports it as archived.
+    """
+    archived: List[str] = []
+    while True:
+        docs = await db.listings.find({"active": False}).limit(batch_size).to_list(length=batch_size)
+        if not docs:
+            break
+        now = datetime.utcnow()
+        # Copy first, so a listing is never gone from both collections.
+        # Upserts keep a pass that crashed after this write safe to rerun.
+        await db.listings_archive.bulk_write(
+            [ReplaceOne({"_id": d["_id"]}, {**d, "archived_at": now}, upsert=True) for d in docs],
+            ordered=False,
+        )
+        claimed = await asyncio.gather(*[
+            db.listings.find_one_and_delete({"_id": d["_id"], "active": False}, projection={"_id": 1})
+            for d in docs
+        ])
+        lost = [d["_id"] for d, won in zip(docs, claimed) if won is None]
+        if lost:
+            # Renewed between the read and the delete: still live, drop the archive copy.
+            # (Archived by another worker: gone from listings, its copy stays.)
+            kept = [d["_id"] async for d in db.listings.find({"_id": {"$in": lost}}, {"_id": 1})]
+            if kept:
+                await db.listings_archive.delete_many({"_id": {"$in": kept}})
+        for d, won in zip(docs, claimed):
+            if won is not None:
+                archived.append(str(d["_id"]))
+                stream_analytics.listing_removed(d)
+        if len(docs) < batch_size:
+            break
+    return archived
+
+
+async def sweep_expired(db, batch_size: int = 500) -> int:
+    """Deactivate expired listings and archive them; returns how many were archived."""
+    now = datetime.utcnow()
+    res = await db.listings.update_many({"active": True, "expires_at": {"$lte": now}}, versioned({"$set": {"active": False}}))
+    archived = await archive_inactive(db, batch_size)
+    for listing_id in archived:
+        listing_index.remove(listing_id)
+    if archived:
+        await asyncio.to_thread(embedding_store.delete, archived)
+    if res.modified_count or archived:
+        await response_cache.invalidate()
+    metrics.incr("listings.expired", res.modified_count)
+    metrics.incr("listings.archived", len(archived))
+    return len(archived)
+
+
+async def run_archive_sweeper(db, interval: float, batch_size: int) -> None:
+    while True:
+        try:
+            archived = await sweep_expired(db, batch_size)
+            if archived:
+                print(f"🗄️  Archived {archived} expired listings")
+        except Exception as e:
+            print(f"⚠️  Expired-listing sweep failed: {e}")
+        await asyncio.sleep(interval)
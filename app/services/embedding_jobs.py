@@ -0,0 +1,231 @@
+"""Durable embedding job queue (outbox) in the ``embedding_jobs`` collection.
+
+Listing writes enqueue a job keyed by the listing ``_id`` in the same request,
+so re-edits coalesce into one pending job. Workers (``python -m
+etl.embedding_worker``) claim jobs in batches under a time-limited lease,
+embed them in one model call, write the results back with ``bulk_write``
+and delete the finished jobs. A job whose lease expires (worker crash) is
+claimed again; failures are retried with backoff up to
+``settings.embedding_job_max_attempts`` and then parked as ``failed``.
+
+Job document::
+
+    {_id: <listing ObjectId>, status: pending|running|failed, seq, attempts,
+     enqueued_at, available_at, lease_owner, lease_expires_at, last_error}
+
+``seq`` is bumped on every enqueue so a worker never deletes a job that was
+re-enqueued while it was processing the previous version.
+"""
+from __future__ import annotations
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Sequence, Tuple
+
+from pymongo import DeleteOne, UpdateOne
+
+from app.utils import metrics
+from app.utils.corpus import corpus_hash, listing_corpus
+from app.utils.embedding_store import embedding_store
+from app.utils.embeddings import embed_texts_async
+from app.utils.settings import settings
+from app.utils.vector_codec import encode_embedding
+
+
+async def enqueue_embedding(db, listing_id) -> None:
+    now = datetime.utcnow()
+    await db.embedding_jobs.update_one(
+        {"_id": listing_id},
+        {
+            "$set": {
+                "status": "pending",
+                "available_at": now,
+                "attempts": 0,
+                "lease_owner": None,
+                "lease_expires_at": None,
+            },
+            "$setOnInsert": {"enqueued_at": now},
+            "$inc": {"seq": 1},
+        },
+        upsert=True,
+    )
+
+
+async def embed_listings(db, docs: Sequence[dict], force: bool = False) -> List[Tuple[dict, List[float]]]:
+    """Embed listings whose corpus hash changed and write the results back.
+
+    Returns the (doc, vector) pairs that were actually embedded.
+    """
+    pending = []
+    for doc in docs:
+        text = listing_corpus(doc)
+        content_hash = corpus_hash(text, settings.embedding_model)
+        if force or doc.get("embedding_hash") != content_hash:
+            pending.append((doc, text, content_hash))
+    if not pending:
+        return []
+    vecs = await embed_texts_async([text for _, text, _ in pending])
+    now = datetime.utcnow()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)  # BSON dates are milliseconds
+    # Embeddings are not part of the listing response, so no ``version`` bump (app/utils/etag.py)
+    await db.listings.bulk_write(
+        [
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {
+                    "embedding": encode_embedding(vec),
+                    "embedding_hash": content_hash,
+                    "embedding_model": settings.embedding_model,
+                    "embedded_at": now,
+                }},
+            )
+            for (doc, _, content_hash), vec in zip(pending, vecs)
+        ],
+        ordered=False,
+    )
+    # Only listings the update matched: one deleted or archived during inference
+    # must not get a store row (a newer write by another worker appends its own)
+    written = {
+        d["_id"] async for d in db.listings.find(
+            {"_id": {"$in": [doc["_id"] for doc, _, _ in pending]}, "embedded_at": now}, {"_id": 1}
+        )
+    }
+    embedded = [(doc, vec) for (doc, _, _), vec in zip(pending, vecs) if doc["_id"] in written]
+    await asyncio.to_thread(embedding_store.append, [(str(doc["_id"]), vec) for doc, vec in embedded])
+    return embedded
+
+
+async def _park_expired(db, now: datetime) -> None:
+    """Fail jobs whose lease expired on their last allowed attempt.
+
+    A listing that crashes or OOMs its worker never reaches ``_fail``; without
+    this it would be reclaimed forever.
+    """
+    res = await db.embedding_jobs.update_many(
+        {
+            "status": "running",
+            "lease_expires_at": {"$lt": now},
+            "attempts": {"$gte": settings.embedding_job_max_attempts},
+        },
+        {"$set": {
+            "status": "failed",
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "last_error": "lease expired (worker crashed or timed out)",
+        }},
+    )
+    metrics.incr("embedding_jobs.failed", res.modified_count)
+
+
+def _claimable(now: datetime) -> dict:
+    return {"$or": [
+        {"status": "pending", "available_at": {"$lte": now}},
+        {
+            "status": "running",
+            "lease_expires_at": {"$lt": now},
+            "attempts": {"$lt": settings.embedding_job_max_attempts},
+        },
+    ]}
+
+
+async def claim_jobs(db, owner: str, limit: int, lease_seconds: float) -> List[dict]:
+    """Lease up to ``limit`` due jobs to ``owner`` in three round-trips.
+
+    Candidates are read, then leased with one ``update_many`` that re-checks
+    they are still claimable, so a job taken by another worker in between is
+    skipped. Each claim tags its jobs with a fresh lease id (``owner/<token>``),
+    so the read-back and ``_fail`` never touch jobs of a concurrent claim, even
+    from the same process.
+    """
+    now = datetime.utcnow()
+    await _park_expired(db, now)
+    candidates = await db.embedding_jobs.find(_claimable(now), {"_id": 1}).sort("available_at", 1).limit(limit).to_list(length=limit)
+    if not candidates:
+        return []
+    ids = [job["_id"] for job in candidates]
+    lease_owner = f"{owner}/{uuid.uuid4().hex[:8]}"
+    await db.embedding_jobs.update_many(
+        {"_id": {"$in": ids}, **_claimable(now)},
+        {
+            "$set": {"status": "running", "lease_owner": lease_owner,
+                     "lease_expires_at": now + timedelta(seconds=lease_seconds)},
+            "$inc": {"attempts": 1},
+        },
+    )
+    return await db.embedding_jobs.find({"_id": {"$in": ids}, "lease_owner": lease_owner}).to_list(length=None)
+
+
+async def _complete(db, jobs: Sequence[dict]) -> None:
+    if jobs:
+        await db.embedding_jobs.bulk_write(
+            [DeleteOne({"_id": job["_id"], "seq": job["seq"]}) for job in jobs], ordered=False
+        )
+
+
+async def _fail(db, jobs: Sequence[dict], error: Exception) -> None:
+    now = datetime.utcnow()
+    ops = []
+    for job in jobs:
+        attempts = job.get("attempts", 1)
+        failed = attempts >= settings.embedding_job_max_attempts
+        ops.append(UpdateOne(
+            # Only while we still hold the lease: after it expired another worker may own the job
+            {"_id": job["_id"], "seq": job["seq"], "lease_owner": job["lease_owner"]},
+            {"$set": {
+                "status": "failed" if failed else "pending",
+                "available_at": now + timedelta(seconds=min(300, 2 ** attempts)),
+                "lease_owner": None,
+                "lease_expires_at": None,
+                "last_error": str(error)[:500],
+            }},
+        ))
+    if ops:
+        await db.embedding_jobs.bulk_write(ops, ordered=False)
+    metrics.incr("embedding_jobs.failed", len(jobs))
+
+
+async def process_jobs(db, owner: str, batch_size: int, lease_seconds: float) -> int:
+    """Claim and process one batch of jobs; returns the number claimed."""
+    jobs = await claim_jobs(db, owner, batch_size, lease_seconds)
+    if not jobs:
+        return 0
+    now = datetime.utcnow()
+    for job in jobs:
+        metrics.observe("embedding_jobs.lag_seconds", (now - job["enqueued_at"]).total_seconds())
+
+    docs = await db.listings.find({"_id": {"$in": [job["_id"] for job in jobs]}}, {"embedding": 0}).to_list(length=None)
+    try:
+        embedded = await embed_listings(db, docs)
+    except Exception as e:
+        print(f"❌ Embedding batch of {len(jobs)} failed: {e}")
+        await _fail(db, jobs, e)
+        return len(jobs)
+    # Deleted listings and unchanged corpora complete without model work
+    await _complete(db, jobs)
+    metrics.incr("embedding_jobs.completed", len(jobs))
+    metrics.incr("embedding_jobs.embedded", len(embedded))
+    return len(jobs)
+
+
+async def run_worker_loop(db, owner: str, batch_size: int, lease_seconds: float, poll_interval: float) -> None:
+    while True:
+        try:
+            claimed = await process_jobs(db, owner, batch_size, lease_seconds)
+        except Exception as e:
+            print(f"⚠️  Embedding worker error: {e}")
+            claimed = 0
+        if not claimed:
+            await asyncio.sleep(poll_interval)
+
+
+async def queue_stats(db) -> dict:
+    """Queue depth per status and the age of the oldest waiting job."""
+    counts = {"pending": 0, "running": 0, "failed": 0}
+    async for row in db.embedding_jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["count"]
+    oldest = await db.embedding_jobs.find_one(
+        {"status": {"$in": ["pending", "running"]}}, sort=[("enqueued_at", 1)], projection={"enqueued_at": 1}
+    )
+    lag = (datetime.utcnow() - oldest["enqueued_at"]).total_seconds() if oldest else 0.0
+    return {**counts, "oldestJobAgeSeconds": lag}
@@ -0,0 +1,181 @@
+"""Resized image variants for listing photos, rendered off the request path.
+
+After an upload is saved, ``generate_variants`` hands the original to a
+process pool. The pool decodes it once and writes each size in
+``VARIANT_SIZES`` (long edge, never upscaled) as AVIF and WebP when this
+Pillow build can encode them, or as JPEG otherwise. It applies the EXIF
+orientation and writes no EXIF, so camera/GPS metadata is stripped. The
+listing then gets one ``image_variants`` entry per original::
+
+    {src, width, height, thumb: {webp: url, ...}, medium: {webp: url, ...}}
+
+Files are written next to the original's blob (app/services/storage.py) as
+``<sha256>_<size>.<format>`` and are removed with it. The rendered entry is
+also kept on the ``image_blobs`` document, so another upload of the same
+photo reuses it without rendering again. Pillow is optional: without it
+uploads still work and listings simply have no variants. Images added by
+URL are not processed.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import importlib.util
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
+
+from bson import ObjectId
+
+from app.services.storage import IMAGES_URL, blob_dir
+from app.utils import metrics
+from app.utils.etag import versioned
+from app.utils.response_cache import response_cache
+from app.utils.settings import settings
+
+VARIANT_SIZES = {"thumb": 320, "medium": 1024}  # longest edge in pixels
+_SAVE_OPTIONS = {
+    "avif": {"format": "AVIF", "quality": 55},
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True},
+}
+_EXIF_ORIENTATION = 0x0112
+
+
+# ------------------------------------------------------------- pool worker
+
+def _render_variants(src: str, out_dir: str, stem: str) -> dict:
+    """Runs inside a pool worker: decode ``src`` once and write every variant."""
+    from PIL import Image, ImageOps
+
+    try:
+        import pillow_avif  # noqa: F401  registers AVIF on Pillow builds without it
+    except ImportError:
+        pass
+    Image.init()
+    formats = [fmt for fmt in ("avif", "webp") if _SAVE_OPTIONS[fmt]["format"] in Image.SAVE] or ["jpeg"]
+
+    with Image.open(src) as original:
+        width, height = original.size
+        if original.getexif().get(_EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+            width, height = height, width  # stored sideways, displayed rotated
+        # JPEG: let the decoder downscale by up to 8x instead of decoding full size
+        original.draft("RGB", (max(VARIANT_SIZES.values()),) * 2)
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+        icc_profile = original.info.get("icc_profile")
+
+    variants: Dict[str, Dict[str, str]] = {}
+    for size_name, edge in VARIANT_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        resized.info = {}  # nothing from the original's metadata is carried over
+        variants[size_name] = {}
+        for fmt in formats:
+            out = resized.convert("RGB") if fmt == "jpeg" and has_alpha else resized
+            name = f"{stem}_{size_name}.{fmt}"
+            part = Path(out_dir) / f".{name}.part"
+            options = dict(_SAVE_OPTIONS[fmt])
+            if icc_profile:
+                options["icc_profile"] = icc_profile  # colour profile only, no EXIF
+            out.save(part, **options)
+            os.replace(part, Path(out_dir) / name)
+            variants[size_name][fmt] = name
+    return {"width": width, "height": height, "variants": variants}
+
+
+# ------------------------------------------------------------- process pool
+#
+# Decoding and encoding hold the GIL for long stretches, so variants are
+# rendered in worker processes rather than threads.
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+@lru_cache(maxsize=1)
+def variants_enabled() -> bool:
+    if settings.image_workers <= 0 or settings.storage_provider != "local":
+        return False
+    if importlib.util.find_spec("PIL") is None:
+        print("ℹ️  Pillow is not installed; image variants are disabled (pip install Pillow)")
+        return False
+    return True
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.image_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def shutdown_image_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def render_variants(path: Path, sha256: str) -> dict:
+    """Render variants of the file at ``path``; returns the ``image_variants`` entry minus ``src``."""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    out_dir = blob_dir(sha256)
+    result = await loop.run_in_executor(_get_executor(), _render_variants, str(path), str(out_dir), sha256)
+    metrics.observe("images.variant_ms", (time.perf_counter() - started) * 1000)
+    url_dir = f"{IMAGES_URL}/{out_dir.relative_to(settings.local_images_dir).as_posix()}"
+    return {
+        "width": result["width"],
+        "height": result["height"],
+        **{
+            size_name: {fmt: f"{url_dir}/{name}" for fmt, name in files.items()}
+            for size_name, files in result["variants"].items()
+        },
+    }
+
+
+async def generate_variants(db, listing_id: ObjectId, src_url: str, path: Path, sha256: str) -> bool:
+    """Render variants for one uploaded image and attach them to the listing.
+
+    Scheduled as a background task after the upload response; failures are
+    logged and leave the listing serving the original.
+    """
+    if not variants_enabled():
+        return False
+    blob = await db.image_blobs.find_one({"_id": sha256}, {"variants": 1})
+    try:
+        if blob and blob.get("variants"):
+            rendered = blob["variants"]
+            metrics.incr("images.variants_reused")
+        else:
+            rendered = await render_variants(path, sha256)
+            await db.image_blobs.update_one({"_id": sha256}, {"$set": {"variants": rendered}})
+        entry = {"src": src_url, **rendered}
+    except Exception as e:
+        metrics.incr("images.variant_failures")
+        print(f"⚠️  Could not render variants for {src_url}: {type(e).__name__}: {e}")
+        return False
+    # Skipped if the image was removed meanwhile or already has variants
+    res = await db.listings.update_one(
+        {"_id": listing_id, "images": src_url, "image_variants.src": {"$ne": src_url}},
+        versioned({"$push": {"image_variants": entry}}),
+    )
+    if res.modified_count:
+        metrics.incr("images.variants_generated")
+        await response_cache.invalidate()
+    return bool(res.modified_count)
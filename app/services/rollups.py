@@ -0,0 +1,217 @@
+"""Incremental daily analytics rollups in ``listing_rollups_daily``.
+
+One document per (day, city, category), where ``day`` is the UTC creation day
+taken from the listing ``_id``::
+
+    {day: "2025-10-01", city, category, count, priced, priceSum, priceMin,
+     priceMax, tags: [{tag, count}], computed_at}
+
+Archived listings (``listings_archive``) still count; deleted ones do not.
+A run recomputes only the days that changed since the last watermark in
+``etl_state``. Those are the days of listings with a newer ``updated_at``, of
+listings archived since then and of tombstones left by deletes. Each day is
+recomputed from source with an ``_id`` range on both collections. Recomputing
+rather than adjusting keeps min/max exact and makes reruns and overlapping
+windows harmless.
+
+``summarize`` answers any date range by summing rollups, so neither the ETL
+nor ``GET /analytics/summary`` scans the whole collection.
+"""
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+STATE_ID = "listing_rollups"
+LOOKBACK = timedelta(seconds=30)  # writes stamped just before the previous run started
+TOMBSTONE_RETENTION = timedelta(hours=1)  # API workers also drop deleted ids from their ANN index by them
+CHUNK_DAYS = 31
+
+
+async def record_tombstone(db, listing_id: ObjectId) -> None:
+    """Called on delete so the next run recomputes the listing's day."""
+    await db.listing_tombstones.update_one(
+        {"_id": listing_id}, {"$set": {"deleted_at": datetime.utcnow()}}, upsert=True
+    )
+
+
+def _day_of(oid: ObjectId) -> date:
+    return oid.generation_time.date()
+
+
+def _id_ranges(days: Iterable[date]) -> List[Tuple[ObjectId, ObjectId]]:
+    """``_id`` ranges covering ``days``, contiguous days merged."""
+    ranges: List[List[date]] = []
+    for day in sorted(set(days)):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1][1] = day + timedelta(days=1)
+        else:
+            ranges.append([day, day + timedelta(days=1)])
+    return [
+        (ObjectId.from_datetime(datetime.combine(lo, datetime.min.time())),
+         ObjectId.from_datetime(datetime.combine(hi, datetime.min.time())))
+        for lo, hi in ranges
+    ]
+
+
+def rollup_pipelines(days: Iterable[date]) -> Tuple[List[dict], List[dict]]:
+    """(bucket, tag) aggregations over listings plus the archive for ``days``."""
+    match = {"$match": {"$or": [{"_id": {"$gte": lo, "$lt": hi}} for lo, hi in _id_ranges(days)]}}
+    fields = {"$project": {"city": 1, "category": 1, "price": 1, "tags": 1}}
+    source = [
+        match,
+        fields,
+        {"$unionWith": {"coll": "listings_archive", "pipeline": [match, fields]}},
+        {"$set": {"day": {"$dateToString": {"format": "%Y-%m-%d", "date": {"$toDate": "$_id"}}}}},
+    ]
+    key = {"day": "$day", "city": "$city", "category": "$category"}
+    priced = {"$gt": ["$price", 0]}
+    buckets = source + [{"$group": {
+        "_id": key,
+        "count": {"$sum": 1},
+        "priced": {"$sum": {"$cond": [priced, 1, 0]}},
+        "priceSum": {"$sum": {"$cond": [priced, "$price", 0]}},
+        "priceMin": {"$min": {"$cond": [priced, "$price", None]}},
+        "priceMax": {"$max": {"$cond": [priced, "$price", None]}},
+    }}]
+    tags = source + [
+        {"$unwind": "$tags"},
+        {"$group": {"_id": {**key, "tag": "$tags"}, "count": {"$sum": 1}}},
+    ]
+    return buckets, tags
+
+
+async def rollup_days(db, days: List[date]) -> int:
+    """Recompute and replace the rollups of ``days``; returns buckets written."""
+    written = 0
+    days = sorted(set(days))
+    for i in range(0, len(days), CHUNK_DAYS):
+        chunk = days[i:i + CHUNK_DAYS]
+        bucket_pipeline, tag_pipeline = rollup_pipelines(chunk)
+        bucket_rows, tag_rows = await asyncio.gather(
+            db.listings.aggregate(bucket_pipeline).to_list(length=None),
+            db.listings.aggregate(tag_pipeline).to_list(length=None),
+        )
+        tags: Dict[tuple, List[dict]] = {}
+        for row in tag_rows:
+            k = row["_id"]
+            tags.setdefault((k["day"], k.get("city"), k.get("category")), []).append(
+                {"tag": k["tag"], "count": row["count"]}
+            )
+        stamp = datetime.utcnow()
+        ops = []
+        for row in bucket_rows:
+            k = row.pop("_id")
+            key = {"day": k["day"], "city": k.get("city"), "category": k.get("category")}
+            bucket_tags = sorted(tags.get(tuple(key.values()), []), key=lambda t: -t["count"])
+            ops.append(ReplaceOne(key, {**key, **row, "tags": bucket_tags, "computed_at": stamp}, upsert=True))
+        if ops:
+            await db.listing_rollups_daily.bulk_write(ops, ordered=False)
+        # Buckets that lost their last listing (deletes, city/category edits)
+        await db.listing_rollups_daily.delete_many(
+            {"day": {"$in": [d.isoformat() for d in chunk]}, "computed_at": {"$lt": stamp}}
+        )
+        written += len(ops)
+    return written
+
+
+async def _all_days(db) -> List[date]:
+    """Every day from the oldest listing (live or archived) to today."""
+    firsts = [
+        await db[name].find_one({}, {"_id": 1}, sort=[("_id", 1)])
+        for name in ("listings", "listings_archive")
+    ]
+    oids = [f["_id"] for f in firsts if f]
+    if not oids:
+        return []
+    start, today = _day_of(min(oids)), datetime.utcnow().date()
+    return [start + timedelta(days=n) for n in range((today - start).days + 1)]
+
+
+async def _changed_days(db, since: datetime) -> Set[date]:
+    days: Set[date] = set()
+    async for doc in db.listings.find({"updated_at": {"$gte": since}}, {"_id": 1}):
+        days.add(_day_of(doc["_id"]))
+    async for doc in db.listings_archive.find({"archived_at": {"$gte": since}}, {"_id": 1}):
+        days.add(_day_of(doc["_id"]))
+    async for doc in db.listing_tombstones.find({"deleted_at": {"$gte": since}}, {"_id": 1}):
+        days.add(_day_of(doc["_id"]))
+    return days
+
+
+async def run_rollups(db, full: bool = False) -> dict:
+    """One ETL pass; a full rebuild when forced or when no watermark exists yet."""
+    started = datetime.utcnow()
+    state = await db.etl_state.find_one({"_id": STATE_ID})
+    if full or not state:
+        days = await _all_days(db)
+        full = True
+    else:
+        days = sorted(await _changed_days(db, state["watermark"] - LOOKBACK))
+    buckets = await rollup_days(db, days)
+    if full:
+        # Days no longer covered at all (e.g. every listing of the oldest days deleted)
+        await db.listing_rollups_daily.delete_many({"computed_at": {"$lt": started}})
+    await db.etl_state.update_one(
+        {"_id": STATE_ID},
+        {"$set": {"watermark": started, "lastRunAt": datetime.utcnow(), "lastRunDays": len(days)}},
+        upsert=True,
+    )
+    # Tombstones older than the next window have been applied here; they are
+    # kept a while longer for index refreshes (app/utils/vector_index.py)
+    await db.listing_tombstones.delete_many({"deleted_at": {"$lt": started - max(LOOKBACK, TOMBSTONE_RETENTION)}})
+    return {"full": full, "days": len(days), "buckets": buckets}
+
+
+def summary_pipeline(start: Optional[date], end: Optional[date]) -> List[dict]:
+    day: dict = {}
+    if start:
+        day["$gte"] = start.isoformat()
+    if end:
+        day["$lte"] = end.isoformat()
+    by_count = {"$sort": {"count": -1}}
+    return [
+        {"$match": {"day": day} if day else {}},
+        {"$facet": {
+            "perCity": [{"$group": {"_id": "$city", "count": {"$sum": "$count"}}}, by_count],
+            "perCategory": [
+                {"$group": {
+                    "_id": "$category",
+                    "count": {"$sum": "$count"},
+                    "priced": {"$sum": "$priced"},
+                    "priceSum": {"$sum": "$priceSum"},
+                    "minPrice": {"$min": "$priceMin"},
+                    "maxPrice": {"$max": "$priceMax"},
+                }},
+                {"$project": {
+                    "count": 1,
+                    "avgPrice": {"$cond": [{"$gt": ["$priced", 0]}, {"$divide": ["$priceSum", "$priced"]}, None]},
+                    "minPrice": 1,
+                    "maxPrice": 1,
+                }},
+                by_count,
+            ],
+            "commonTags": [
+                {"$unwind": "$tags"},
+                {"$group": {"_id": "$tags.tag", "count": {"$sum": "$tags.count"}}},
+                by_count,
+                {"$limit": 20},
+            ],
+            "dailyNew": [{"$group": {"_id": "$day", "count": {"$sum": "$count"}}}, {"$sort": {"_id": 1}}],
+        }},
+    ]
+
+
+async def summarize(db, start: Optional[date] = None, end: Optional[date] = None) -> Optional[dict]:
+    """Breakdowns for listings created between ``start`` and ``end`` (UTC days, inclusive)."""
+    state = await db.etl_state.find_one({"_id": STATE_ID})
+    if not state:
+        return None
+    (facets,) = await db.listing_rollups_daily.aggregate(summary_pipeline(start, end)).to_list(length=1)
+    return {
+        "generatedAt": state["lastRunAt"].isoformat(),
+        "range": {"start": start.isoformat() if start else None, "end": end.isoformat() if end else None},
+        **facets,
+    }
@@ -1,11 +1,60 @@
+"""Content-addressed image storage with reference counts.
+
+An upload is stored once per distinct content, under its SHA-256 in
+two-level shard directories::
+
+    <LOCAL_IMAGES_DIR>/blobs/ab/cd/abcd1234...<64 hex>.jpg
+    -> /listings/images/blobs/ab/cd/abcd1234....jpg
+
+Each blob has a document in ``image_blobs`` whose ``refs`` counts the listing
+``images`` entries (live or archived) pointing at it. Uploads and image edits
+acquire references; edits and deletes release them. A blob whose count drops
+to zero is removed together with its rendered variants (app/services/images.py).
+The content never changes under a URL, so ``BlobStaticFiles`` serves blobs as
+cacheable forever. Images uploaded before this layout (flat
+``<listing_id>_<name>`` files) keep working and are moved over by
+``python -m etl.image_blobs``.
+"""
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import mimetypes
 import os
+import tempfile
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
-from typing import Tuple
-from fastapi import UploadFile
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
+from pymongo import ReturnDocument
+
+from app.utils import metrics
 from app.utils.settings import settings
 
+BLOBS_DIR = "blobs"
+IMAGES_URL = "/listings/images"
+BLOB_URL_PREFIX = f"{IMAGES_URL}/{BLOBS_DIR}/"
+IMMUTABLE = "public, max-age=31536000, immutable"
+_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif", ".bmp", ".tif", ".tiff", ".heic"}
+
+
+class UploadTooLarge(Exception):
+    """The upload exceeded ``settings.max_upload_bytes``."""
+
+
+@dataclass(frozen=True)
+class SavedImage:
+    url: str
+    sha256: str
+    size: int
+    path: Path  # where the file landed (local storage)
+    deduplicated: bool = False  # the same content was already stored
+
 
 def _ensure_local_dir() -> Path:
     p = Path(settings.local_images_dir)
@@ -13,21 +62,262 @@ def _ensure_local_dir() -> Path:
     return p
 
 
-async def save_image(file: UploadFile, listing_id: str) -> str:
-    """Save an image and return a public URL/path.
+def blob_relpath(sha256: str, ext: str) -> str:
+    """``blobs/ab/cd/<sha256><ext>``: 65536 shards keep every directory small."""
+    return f"{BLOBS_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}"
+
+
+def blob_dir(sha256: str) -> Path:
+    """Shard directory of a blob; its variants are written next to it."""
+    p = Path(settings.local_images_dir) / BLOBS_DIR / sha256[:2] / sha256[2:4]
+    p.mkdir(parents=True, exist_ok=True)
+    return p
+
+
+def blob_sha(url: str) -> Optional[str]:
+    """SHA-256 of a blob URL, or None for legacy uploads and external URLs."""
+    if not url.startswith(BLOB_URL_PREFIX):
+        return None
+    return url.rsplit("/", 1)[-1].split(".", 1)[0]
+
+
+def local_path(url: str) -> Optional[Path]:
+    """File behind a ``/listings/images/...`` URL, or None for external URLs."""
+    if not url.startswith(f"{IMAGES_URL}/"):
+        return None
+    return Path(settings.local_images_dir) / url[len(IMAGES_URL) + 1:]
+
+
+def image_extension(filename: str, content_type: str = "") -> str:
+    """File extension for a blob, so StaticFiles sends the right Content-Type."""
+    ext = Path(filename or "").suffix.lower()
+    if ext not in _EXTENSIONS:
+        ext = mimetypes.guess_extension(content_type or "") or ""
+    return ".jpg" if ext == ".jpeg" else ext
+
+
+def _write_chunk(out: BinaryIO, digest, chunk: bytes) -> None:
+    # Both release the GIL for large buffers, so this runs off the loop in parallel
+    digest.update(chunk)
+    out.write(chunk)
+
+
+def _finish(out: BinaryIO) -> None:
+    out.flush()
+    os.fsync(out.fileno())
+    out.close()
+
+
+async def _stream_to_temp(file: UploadFile, folder: Path) -> Tuple[Path, str, int]:
+    """Copy the upload to a temp file in ``folder`` chunk by chunk, hashing as it goes.
+
+    Memory stays at one chunk per upload; every disk write runs in a thread.
+    """
+    limit = settings.max_upload_bytes
+    if file.size is not None and file.size > limit:
+        raise UploadTooLarge(f"{file.size} bytes exceeds the {limit} byte limit")
+    fd, name = tempfile.mkstemp(dir=folder, prefix=".upload-", suffix=".part")
+    tmp = Path(name)
+    out = os.fdopen(fd, "wb")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while chunk := await file.read(settings.upload_chunk_bytes):
+            size += len(chunk)
+            if size > limit:
+                raise UploadTooLarge(f"upload exceeds the {limit} byte limit")
+            await asyncio.to_thread(_write_chunk, out, digest, chunk)
+        await asyncio.to_thread(_finish, out)
+    except BaseException:
+        out.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    return tmp, digest.hexdigest(), size
+
+
+def _place(tmp: Path, target: Path) -> bool:
+    """Move ``tmp`` to ``target`` unless identical content is already there."""
+    if target.exists():
+        tmp.unlink(missing_ok=True)
+        return False
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp, target)
+    return True
+
+
+async def store_blob(db, tmp: Path, sha256: str, size: int, ext: str) -> Tuple[dict, bool]:
+    """Take one reference on the blob for ``sha256`` and move ``tmp`` into it.
+
+    The reference is taken before the file is placed, so a concurrent
+    ``_free_blob`` of the same content either finishes first (and the file is
+    placed again) or sees ``refs > 0`` and backs off. Returns the blob document
+    and whether the content was new.
+    """
+    blob = await db.image_blobs.find_one_and_update(
+        {"_id": sha256},
+        {
+            "$inc": {"refs": 1},
+            "$set": {"released_at": None},
+            "$setOnInsert": {"path": blob_relpath(sha256, ext), "size": size, "created_at": datetime.utcnow()},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    placed = await asyncio.to_thread(_place, tmp, Path(settings.local_images_dir) / blob["path"])
+    return blob, placed
+
+
+async def save_image(db, file: UploadFile) -> SavedImage:
+    """Save an image and return its public URL/path, SHA-256 and size.
 
-    For local storage, returns a URL path under /listings/images/{filename} that the API can serve via StaticFiles.
+    For local storage the file is streamed to a temp file, hashed on the way and
+    stored as a content-addressed blob with one reference taken for the caller,
+    who must ``release_images`` it if the URL ends up unused. Uploading
+    content that is already stored returns the existing blob's URL.
+    Raises ``UploadTooLarge`` past ``settings.max_upload_bytes``.
     """
-    filename = f"{listing_id}_{file.filename}"
     if settings.storage_provider == "local":
         folder = _ensure_local_dir()
-        target = folder / filename
-        content = await file.read()
-        target.write_bytes(content)
-        return f"/listings/images/{filename}"
+        tmp, sha256, size = await _stream_to_temp(file, folder)
+        try:
+            blob, placed = await store_blob(db, tmp, sha256, size, image_extension(file.filename, file.content_type))
+        finally:
+            tmp.unlink(missing_ok=True)
+        metrics.incr("uploads.bytes", size)
+        if not placed:
+            metrics.incr("uploads.dedup_hits")
+        path = Path(settings.local_images_dir) / blob["path"]
+        return SavedImage(f"{IMAGES_URL}/{blob['path']}", sha256, size, path, deduplicated=not placed)
 
     # Placeholder for S3 implementation
     # elif settings.storage_provider == "s3":
     #     ... upload using boto3 and return public URL based on settings.s3_base_url ...
 
     raise RuntimeError("Unsupported STORAGE_PROVIDER")
+
+
+def _blob_refs(urls: Iterable[str]) -> List[str]:
+    """One SHA-256 per blob URL occurrence (a listing may hold the same image twice)."""
+    return [sha for sha in map(blob_sha, urls) if sha]
+
+
+async def acquire_images(db, urls: Iterable[str]) -> None:
+    """Take a reference for each blob URL a listing starts using (e.g. via an edit)."""
+    for sha256, count in Counter(_blob_refs(urls)).items():
+        await db.image_blobs.update_one({"_id": sha256}, {"$inc": {"refs": count}, "$set": {"released_at": None}})
+
+
+async def release_images(db, urls: Iterable[str]) -> int:
+    """Drop a reference for each blob URL a listing stopped using; returns blobs freed."""
+    freed = 0
+    for sha256, count in Counter(_blob_refs(urls)).items():
+        blob = await db.image_blobs.find_one_and_update(
+            {"_id": sha256}, {"$inc": {"refs": -count}}, return_document=ReturnDocument.AFTER
+        )
+        if blob and blob["refs"] <= 0:
+            await db.image_blobs.update_one(
+                {"_id": sha256, "refs": {"$lte": 0}}, {"$set": {"released_at": datetime.utcnow()}}
+            )
+            freed += await _free_blob(db, sha256)
+    return freed
+
+
+def _park(path: Path, parked: Path) -> bool:
+    try:
+        os.replace(path, parked)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _remove_files(parked: Optional[Path], folder: Path, sha256: str) -> None:
+    if parked:
+        parked.unlink(missing_ok=True)
+    for variant in folder.glob(f"{sha256}_*"):
+        variant.unlink(missing_ok=True)
+
+
+async def _free_blob(db, sha256: str) -> bool:
+    """Delete an unreferenced blob and its variants.
+
+    The file is first renamed aside, then the document is deleted only if it
+    still has no references. If an upload of the same content took a
+    reference in between, the file is put back instead.
+    """
+    blob = await db.image_blobs.find_one({"_id": sha256, "refs": {"$lte": 0}})
+    if not blob:
+        return False
+    path = Path(settings.local_images_dir) / blob["path"]
+    parked = path.with_name(f".gc-{path.name}")
+    moved = await asyncio.to_thread(_park, path, parked)
+    res = await db.image_blobs.delete_one({"_id": sha256, "refs": {"$lte": 0}})
+    if not res.deleted_count:
+        if moved:
+            await asyncio.to_thread(os.replace, parked, path)
+        return False
+    await asyncio.to_thread(_remove_files, parked if moved else None, path.parent, sha256)
+    metrics.incr("image_blobs.freed")
+    return True
+
+
+async def collect_unreferenced(db) -> int:
+    """Free blobs left at zero references (e.g. a worker stopped mid-release)."""
+    freed = 0
+    async for blob in db.image_blobs.find({"refs": {"$lte": 0}}, {"_id": 1}):
+        freed += await _free_blob(db, blob["_id"])
+    return freed
+
+
+class BlobStaticFiles(StaticFiles):
+    """Serves ``/listings/images``; blobs are immutable and cached for a year."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        root = os.path.realpath(self.directory)
+        if os.path.relpath(full_path, root).startswith(BLOBS_DIR + os.sep):
+            response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+
+# Room for the multipart boundary and part headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadSizeLimit:
+    """ASGI middleware capping multipart request bodies at ``max_upload_bytes``.
+
+    Starlette parses (and spools to disk) the whole multipart body before the
+    route runs, so the check in ``_stream_to_temp`` alone fires only after the
+    client has sent everything. This answers 413 from ``Content-Length`` before
+    reading, and stops reading a chunked body once it passes the limit.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        headers = dict(scope.get("headers") or [])
+        if scope["type"] != "http" or not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        detail = f"Image too large: uploads are limited to {self.max_bytes} bytes"
+        limit = self.max_bytes + MULTIPART_OVERHEAD
+        length = headers.get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised while FastAPI reads the form, which passes HTTPException through
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
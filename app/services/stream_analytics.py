@@ -0,0 +1,218 @@
+"""Top tags and distinct counts maintained as listings are written.
+
+Listing writes update per-worker delta sketches (app/utils/sketches.py) in
+memory:
+
+- tags of live listings: Count-Min (+1 on create and added tags, -1 on
+  removed tags, delete and archive) with a Space-Saving candidate set;
+- distinct cities seen: one HyperLogLog;
+- active sellers (created or edited a listing): one HyperLogLog per UTC
+  day, merged over the last ``ACTIVE_SELLER_DAYS`` days.
+
+Every ``settings.sketch_flush_seconds`` each worker merges its deltas into
+the shared documents in ``analytics_sketches`` with a compare-and-set on
+``rev``, then starts new deltas. Reading the figures costs a fixed number of
+small documents, however many listings exist. ``python -m
+etl.rebuild_sketches`` seeds or resets them from the collections.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional
+
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+from app.utils import metrics
+from app.utils.sketches import CountMinSketch, HyperLogLog, SpaceSaving
+
+TAGS_ID = "tags"
+CITIES_ID = "hll:cities"
+SELLERS_PREFIX = "hll:sellers:"
+ACTIVE_SELLER_DAYS = 30
+CMS_WIDTH, CMS_DEPTH = 2048, 4
+TOPK_CAPACITY = 256
+HLL_P = 12
+
+
+def _sellers_id(day) -> str:
+    return f"{SELLERS_PREFIX}{day.isoformat()}"
+
+
+def _tags_fields(cms: CountMinSketch, topk: SpaceSaving) -> dict:
+    return {"cms": Binary(cms.to_bytes()), "width": cms.width, "depth": cms.depth,
+            "topk": topk.to_list(), "capacity": topk.capacity}
+
+
+def _load_tags(doc: Optional[dict]):
+    if not doc:
+        return CountMinSketch(CMS_WIDTH, CMS_DEPTH), SpaceSaving(TOPK_CAPACITY)
+    return (CountMinSketch.from_bytes(doc["cms"], doc["width"], doc["depth"]),
+            SpaceSaving.from_list(doc["topk"], doc["capacity"]))
+
+
+def _load_hll(doc: Optional[dict]) -> HyperLogLog:
+    return HyperLogLog.from_bytes(doc["registers"], doc["p"]) if doc else HyperLogLog(HLL_P)
+
+
+async def _merge_into(db, doc_id: str, merged: Callable[[Optional[dict]], dict], attempts: int = 10) -> None:
+    """Read-merge-write ``doc_id``, retrying when another worker wrote in between."""
+    for _ in range(attempts):
+        doc = await db.analytics_sketches.find_one({"_id": doc_id})
+        fields = {**merged(doc), "updated_at": datetime.utcnow()}
+        if doc is None:
+            try:
+                await db.analytics_sketches.insert_one({"_id": doc_id, **fields, "rev": 1})
+                return
+            except DuplicateKeyError:
+                continue
+        res = await db.analytics_sketches.update_one(
+            {"_id": doc_id, "rev": doc["rev"]}, {"$set": fields, "$inc": {"rev": 1}}
+        )
+        if res.matched_count:
+            return
+        metrics.incr("sketches.flush_conflicts")
+    raise RuntimeError(f"sketch {doc_id} kept changing under concurrent flushes")
+
+
+class StreamAnalytics:
+    def __init__(self):
+        self._new_deltas()
+
+    def _new_deltas(self) -> None:
+        self.cms = CountMinSketch(CMS_WIDTH, CMS_DEPTH)
+        self.topk = SpaceSaving(TOPK_CAPACITY)
+        self.hlls: Dict[str, HyperLogLog] = {}
+        self.pending = 0
+
+    def _hll(self, doc_id: str) -> HyperLogLog:
+        return self.hlls.setdefault(doc_id, HyperLogLog(HLL_P))
+
+    def _tags(self, tags: Iterable[str], sign: int) -> None:
+        for tag in set(tags or []):
+            self.cms.add(tag, sign)
+            if sign > 0:
+                self.topk.add(tag, sign)
+        self.pending += 1
+
+    def _seen(self, doc: dict) -> None:
+        if doc.get("city"):
+            self._hll(CITIES_ID).add(str(doc["city"]))
+        if doc.get("userId"):
+            self._hll(_sellers_id(datetime.utcnow().date())).add(str(doc["userId"]))
+
+    def listing_created(self, doc: dict) -> None:
+        self._tags(doc.get("tags"), +1)
+        self._seen(doc)
+
+    def listing_updated(self, before: dict, after: dict) -> None:
+        old, new = set(before.get("tags") or []), set(after.get("tags") or [])
+        self._tags(new - old, +1)
+        self._tags(old - new, -1)
+        self._seen(after)
+
+    def listing_removed(self, doc: dict) -> None:
+        """Deleted or archived: its tags stop counting (distinct counts are seen-ever)."""
+        self._tags(doc.get("tags"), -1)
+
+    async def flush(self, db) -> None:
+        """Merge this worker's deltas into ``analytics_sketches``."""
+        cms, topk, hlls, pending = self.cms, self.topk, self.hlls, self.pending
+        if not pending and not hlls:
+            return
+        self._new_deltas()  # writes during the flush go to fresh deltas
+
+        def merge_tags(doc):
+            shared_cms, shared_topk = _load_tags(doc)
+            shared_cms.merge(cms)
+            shared_topk.merge(topk)
+            return _tags_fields(shared_cms, shared_topk)
+
+        def merge_hll(delta):
+            def merged(doc):
+                shared = _load_hll(doc)
+                shared.merge(delta)
+                return {"registers": Binary(shared.to_bytes()), "p": shared.p}
+            return merged
+
+        try:
+            if pending:
+                await _merge_into(db, TAGS_ID, merge_tags)
+                pending = 0
+            for doc_id in list(hlls):
+                await _merge_into(db, doc_id, merge_hll(hlls[doc_id]))
+                del hlls[doc_id]
+        except Exception:
+            # Keep what was not written; it goes out with the next flush
+            if pending:
+                self.cms.merge(cms)
+                self.topk.merge(topk)
+                self.pending += pending
+            for doc_id, delta in hlls.items():
+                self._hll(doc_id).merge(delta)
+            raise
+        metrics.incr("sketches.flushes")
+
+    async def snapshot(self, db, top_n: int = 15) -> dict:
+        """Dashboard figures from the shared sketches plus this worker's unflushed deltas."""
+        today = datetime.utcnow().date()
+        seller_ids = [_sellers_id(today - timedelta(days=n)) for n in range(ACTIVE_SELLER_DAYS)]
+        docs = {d["_id"]: d async for d in db.analytics_sketches.find({"_id": {"$in": [TAGS_ID, CITIES_ID, *seller_ids]}})}
+
+        cms, topk = _load_tags(docs.get(TAGS_ID))
+        cms.merge(self.cms)
+        topk.merge(self.topk)
+        ranked = sorted(((tag, cms.estimate(tag)) for tag, _ in topk.top(TOPK_CAPACITY)), key=lambda kv: -kv[1])
+        top_tags = [{"_id": tag, "count": count} for tag, count in ranked if count > 0][:top_n]
+
+        cities = _load_hll(docs.get(CITIES_ID))
+        if CITIES_ID in self.hlls:
+            cities.merge(self.hlls[CITIES_ID])
+        sellers = HyperLogLog(HLL_P)
+        for doc_id in seller_ids:
+            sellers.merge(_load_hll(docs.get(doc_id)))
+            if doc_id in self.hlls:
+                sellers.merge(self.hlls[doc_id])
+        return {"topTags": top_tags, "distinctCities": cities.count(), "activeSellers": sellers.count()}
+
+
+stream_analytics = StreamAnalytics()
+
+
+async def rebuild_sketches(db) -> dict:
+    """Replace the shared sketches with ones computed from the collections."""
+    cms, topk = CountMinSketch(CMS_WIDTH, CMS_DEPTH), SpaceSaving(TOPK_CAPACITY)
+    cities = HyperLogLog(HLL_P)
+    sellers: Dict[str, HyperLogLog] = {}
+    since = datetime.utcnow().date() - timedelta(days=ACTIVE_SELLER_DAYS - 1)
+    listings = 0
+    for name in ("listings", "listings_archive"):
+        async for doc in db[name].find({}, {"tags": 1, "city": 1, "userId": 1}):
+            if name == "listings":
+                listings += 1
+                for tag in set(doc.get("tags") or []):
+                    cms.add(tag)
+                    topk.add(tag)
+            if doc.get("city"):
+                cities.add(str(doc["city"]))
+            created = doc["_id"].generation_time.date()
+            if doc.get("userId") and created >= since:
+                sellers.setdefault(_sellers_id(created), HyperLogLog(HLL_P)).add(str(doc["userId"]))
+
+    now = datetime.utcnow()
+    await db.analytics_sketches.delete_many({})
+    docs = [
+        {"_id": TAGS_ID, **_tags_fields(cms, topk)},
+        {"_id": CITIES_ID, "registers": Binary(cities.to_bytes()), "p": HLL_P},
+        *({"_id": doc_id, "registers": Binary(h.to_bytes()), "p": HLL_P} for doc_id, h in sellers.items()),
+    ]
+    await db.analytics_sketches.insert_many([{**d, "rev": 1, "updated_at": now} for d in docs])
+    return {"listings": listings, "sketches": len(docs)}
+
+
+async def run_sketch_flusher(db, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await stream_analytics.flush(db)
+        except Exception as e:
+            print(f"⚠️  Analytics sketch flush failed: {e}")
@@ -0,0 +1,72 @@
+"""Text corpus a listing is embedded from, and the hash used to detect changes.
+
+Shared by the listing routes, the embedding worker and the backfill so they agree on
+what text an embedding represents.
+"""
+import hashlib
+
+
+# Bump when listing_corpus() changes so existing embeddings are recomputed
+CORPUS_VERSION = 1
+
+
+def listing_corpus(doc: dict) -> str:
+    """
+    Enhanced corpus generation with category context and synonym expansion
+    for better semantic embeddings
+    """
+    parts = [
+        doc.get("title") or "",
+        doc.get("description") or "",
+    ]
+    
+    # Add category context to help model understand domain
+    category = doc.get("category", "")
+    if category:
+        parts.append(f"Category: {category}")
+    
+    # Expand tags with common synonyms/variations for better matching
+    tags = doc.get("tags") or []
+    expanded_tags = list(tags)  # Start with original tags
+    
+    for tag in tags:
+        tag_lower = tag.lower()
+        
+        # Brand/product expansions
+        if "iphone" in tag_lower or "apple" in tag_lower:
+            expanded_tags.extend(["Apple smartphone", "iOS phone", "Apple device"])
+        elif "samsung" in tag_lower:
+            expanded_tags.extend(["Samsung smartphone", "Android phone", "Galaxy device"])
+        elif "oneplus" in tag_lower or "one plus" in tag_lower:
+            expanded_tags.extend(["OnePlus smartphone", "Android phone", "One Plus device"])
+        elif "lexus" in tag_lower:
+            expanded_tags.extend(["Lexus vehicle", "luxury car", "Toyota premium brand"])
+        elif "toyota" in tag_lower:
+            expanded_tags.extend(["Toyota vehicle", "automobile", "car"])
+        elif "honda" in tag_lower:
+            expanded_tags.extend(["Honda vehicle", "automobile", "car", "motorcycle"])
+        elif "retriever" in tag_lower or "dog" in tag_lower:
+            expanded_tags.extend(["pet dog", "canine", "puppy", "animal companion"])
+        elif "cat" in tag_lower:
+            expanded_tags.extend(["pet cat", "feline", "kitten", "animal companion"])
+        elif "boat" in tag_lower:
+            expanded_tags.extend(["water vessel", "marine vehicle", "watercraft"])
+        elif "laptop" in tag_lower or "notebook" in tag_lower:
+            expanded_tags.extend(["portable computer", "laptop computer", "notebook computer"])
+        elif "phone" in tag_lower and "iphone" not in tag_lower:
+            expanded_tags.extend(["smartphone", "mobile phone", "cell phone"])
+    
+    if expanded_tags:
+        parts.append(" ".join(expanded_tags))
+    
+    # Add city for location awareness
+    city = doc.get("city") or ""
+    if city:
+        parts.append(f"Location: {city}")
+    
+    return " | ".join([p for p in parts if p])
+
+
+def corpus_hash(corpus: str, model: str) -> str:
+    """Fingerprint of the corpus text, embedding model and corpus version."""
+    return hashlib.sha256(f"{CORPUS_VERSION}\x00{model}\x00{corpus}".encode("utf-8")).hexdigest()
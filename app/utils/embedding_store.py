@@ -0,0 +1,298 @@
+"""Memory-mapped on-disk store of listing embeddings for fast warm restarts.
+
+Layout of ``settings.embedding_store_dir``:
+
+- ``vectors.f32``     float32 rows (capacity x dim), memory-mapped
+- ``ids.bin``         24-byte hex ObjectId per row
+- ``tombstones.bin``  one bit per row, set when a row is superseded or deleted
+- ``meta.json``       dim, row count, capacity, embedding model and the
+                      reconcile watermark
+
+The dimension comes from ``EMBEDDING_DIM`` or, when unset, from the existing
+store of the same model or the first vector written to it. A store built
+for another model or dimension is discarded.
+
+Rows are only ever appended; re-embedding a listing tombstones its old row.
+Writers hold an exclusive lock on ``store.lock`` so the API workers and the
+backfill ETL can append to the same store. Waiting on that lock and resizing
+the files block, so async callers run every method through ``asyncio.to_thread``.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.settings import settings
+from app.utils.vector_codec import HAS_EMBEDDING, decode_embedding
+
+try:
+    import fcntl  # type: ignore
+except ImportError:  # pragma: no cover - Windows dev boxes run a single writer
+    fcntl = None
+
+ID_WIDTH = 24
+# Documents embedded while a reconcile is running may carry a slightly older
+# embedded_at than the moment we read past them, so re-check a short window.
+RECONCILE_LOOKBACK = timedelta(minutes=5)
+
+
+class EmbeddingStore:
+    def __init__(self, path: str, dim: int = 0, model: str = ""):
+        self.path = Path(path)
+        self.dim = dim
+        self.model = model
+        self.watermark: Optional[datetime] = None
+        self._count = 0
+        self._capacity = 0
+        self._generation = 0
+        self._vectors: Optional[np.memmap] = None
+        self._ids: Optional[np.memmap] = None
+        self._tombstones: Optional[np.memmap] = None
+        self._row_of: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    # ------------------------------------------------------------------ files
+
+    @contextmanager
+    def _locked(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / "store.lock", "a+") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            return json.loads((self.path / "meta.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_meta(self) -> None:
+        meta = {
+            "dim": self.dim,
+            "model": self.model,
+            "count": self._count,
+            "capacity": self._capacity,
+            "generation": self._generation,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+        }
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self.path / "meta.json")
+
+    def _map(self) -> None:
+        shape = max(self._capacity, 8)
+        self._vectors = np.memmap(self.path / "vectors.f32", dtype=np.float32, mode="r+", shape=(shape, self.dim))
+        self._ids = np.memmap(self.path / "ids.bin", dtype=f"S{ID_WIDTH}", mode="r+", shape=(shape,))
+        self._tombstones = np.memmap(self.path / "tombstones.bin", dtype=np.uint8, mode="r+", shape=(shape // 8,))
+
+    def _resize_files(self, capacity: int) -> None:
+        capacity = (capacity + 7) // 8 * 8
+        for name, size in (
+            ("vectors.f32", capacity * self.dim * 4),
+            ("ids.bin", capacity * ID_WIDTH),
+            ("tombstones.bin", capacity // 8),
+        ):
+            with open(self.path / name, "ab") as f:
+                f.truncate(size)
+        self._capacity = capacity
+        self._map()
+
+    def _reset_files(self) -> None:
+        for name in ("vectors.f32", "ids.bin", "tombstones.bin"):
+            (self.path / name).unlink(missing_ok=True)
+        self._count = 0
+        self._generation += 1
+        self.watermark = None
+        self._row_of = {}
+        self._resize_files(1024)
+        self._write_meta()
+
+    def _is_dead(self, row: int) -> bool:
+        return bool(self._tombstones[row >> 3] & (1 << (row & 7)))
+
+    def _kill(self, row: int) -> None:
+        self._tombstones[row >> 3] |= np.uint8(1 << (row & 7))
+
+    def _scan_ids(self, start: int, stop: int) -> None:
+        for row in range(start, stop):
+            if not self._is_dead(row):
+                self._row_of[self._ids[row].decode()] = row
+
+    def _refresh(self) -> None:
+        """Pick up rows appended by other processes since we last looked."""
+        meta = self._read_meta()
+        if not self.dim and meta is not None and meta.get("model") == self.model:
+            self.dim = meta.get("dim") or 0
+        if meta is None or meta.get("dim") != self.dim or meta.get("model") != self.model:
+            if not self.dim:
+                return  # nothing stored for this model yet; the first append fixes the dimension
+            self._generation = (meta or {}).get("generation", self._generation)
+            self._reset_files()
+            return
+        if meta["generation"] != self._generation or meta["capacity"] != self._capacity:
+            full = meta["generation"] != self._generation
+            self._generation = meta["generation"]
+            self._capacity = meta["capacity"]
+            self._map()
+            if full:
+                self._row_of = {}
+                self._count = 0
+        if meta["count"] > self._count:
+            self._scan_ids(self._count, meta["count"])
+        self._count = meta["count"]
+        self.watermark = datetime.fromisoformat(meta["watermark"]) if meta.get("watermark") else None
+
+    def _flush(self) -> None:
+        for mm in (self._vectors, self._ids, self._tombstones):
+            mm.flush()
+        self._write_meta()
+
+    # ----------------------------------------------------------------- public
+
+    def open(self) -> None:
+        with self._locked():
+            self._refresh()
+            # Forget rows that other processes deleted since this one last looked
+            self._row_of = {i: r for i, r in self._row_of.items() if not self._is_dead(r)}
+
+    def append(self, items: Sequence[Tuple[str, Iterable[float]]]) -> None:
+        """Append (listing_id, vector) rows, superseding older rows for the same ids."""
+        if not items:
+            return
+        with self._locked():
+            self._refresh()
+            if not self.dim:
+                self.dim = int(np.asarray(items[0][1]).size)
+                self._refresh()
+            needed = self._count + len(items)
+            if needed > self._capacity:
+                self._resize_files(max(needed, self._capacity * 2))
+            for listing_id, vec in items:
+                old = self._row_of.get(listing_id)
+                if old is not None:
+                    self._kill(old)
+                row = self._count
+                self._vectors[row] = np.asarray(vec, dtype=np.float32)
+                self._ids[row] = listing_id.encode()
+                self._row_of[listing_id] = row
+                self._count += 1
+            self._flush()
+
+    def delete(self, listing_ids: Iterable[str]) -> None:
+        with self._locked():
+            self._refresh()
+            if not self.dim:
+                return
+            for listing_id in listing_ids:
+                row = self._row_of.pop(listing_id, None)
+                if row is not None:
+                    self._kill(row)
+            self._flush()
+
+    def set_watermark(self, watermark: datetime) -> None:
+        with self._locked():
+            self._refresh()
+            if not self.dim:
+                return
+            self.watermark = watermark
+            self._write_meta()
+
+    def get(self, listing_id: str) -> Optional[np.ndarray]:
+        row = self._row_of.get(listing_id)
+        return None if row is None else np.asarray(self._vectors[row])
+
+    def ids(self) -> List[str]:
+        return list(self._row_of)
+
+    def live(self) -> Tuple[List[str], np.ndarray]:
+        """Live ids and an in-memory (n, dim) copy of their vectors."""
+        if not self._row_of:
+            return [], np.zeros((0, self.dim), dtype=np.float32)
+        ids = np.array(list(self._row_of), dtype=object)
+        rows = np.fromiter(self._row_of.values(), dtype=np.int64, count=len(ids))
+        alive = (self._tombstones[rows >> 3] & (1 << (rows & 7)).astype(np.uint8)) == 0
+        return ids[alive].tolist(), np.asarray(self._vectors[rows[alive]])
+
+    def compact(self, min_dead_ratio: float = 0.5) -> bool:
+        """Rewrite the files without tombstoned rows once they dominate the store."""
+        with self._locked():
+            self._refresh()
+            if self._count == 0 or 1 - len(self._row_of) / self._count < min_dead_ratio:
+                return False
+            ids, vectors = self.live()
+            watermark = self.watermark
+            self._reset_files()
+            self.watermark = watermark
+            if ids:
+                self._resize_files(max(len(ids), 1024))
+                self._vectors[: len(ids)] = vectors
+                self._ids[: len(ids)] = [i.encode() for i in ids]
+                self._row_of = {listing_id: row for row, listing_id in enumerate(ids)}
+                self._count = len(ids)
+            self._flush()
+            return True
+
+
+embedding_store = EmbeddingStore(settings.embedding_store_dir, settings.embedding_dim, settings.embedding_model)
+
+
+async def reconcile_embedding_store(db, store: Optional[EmbeddingStore] = None) -> Dict[str, int]:
+    """Bring the on-disk store up to date with MongoDB.
+
+    Only listings embedded since the stored watermark are read back, so a
+    warm restart costs one ``_id`` scan plus whatever changed while the
+    worker was down.
+    """
+    if store is None:
+        store = embedding_store
+    await asyncio.to_thread(store.open)
+    started = datetime.utcnow()
+
+    query: dict = {"embedding": HAS_EMBEDDING}
+    if store.watermark is not None:
+        query["embedded_at"] = {"$gte": store.watermark - RECONCILE_LOOKBACK}
+
+    added = 0
+    batch: List[Tuple[str, np.ndarray]] = []
+    async for doc in db.listings.find(query, {"embedding": 1}):
+        vec = decode_embedding(doc.get("embedding"))
+        if vec is not None and not store.dim:
+            store.dim = vec.size
+        if vec is None or vec.shape != (store.dim,):
+            continue
+        listing_id = str(doc["_id"])
+        current = store.get(listing_id)
+        if current is not None and np.array_equal(current, vec):
+            continue
+        batch.append((listing_id, vec))
+        if len(batch) >= 1000:
+            await asyncio.to_thread(store.append, batch)
+            added += len(batch)
+            batch = []
+    await asyncio.to_thread(store.append, batch)
+    added += len(batch)
+
+    # Drop rows for listings that were deleted (or lost their embedding) meanwhile
+    in_db = set()
+    async for doc in db.listings.find({"embedding": {"$exists": True}}, {"_id": 1}):
+        in_db.add(str(doc["_id"]))
+    stale = [listing_id for listing_id in store.ids() if listing_id not in in_db]
+    await asyncio.to_thread(store.delete, stale)
+
+    await asyncio.to_thread(store.set_watermark, started)
+    await asyncio.to_thread(store.compact)
+    return {"added": added, "removed": len(stale), "total": len(store)}
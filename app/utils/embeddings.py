@@ -1,13 +1,18 @@
 from __future__ import annotations
 
-from functools import lru_cache
-from typing import List
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
 
+from app.utils import metrics
 from app.utils.settings import settings
 
 
-@lru_cache(maxsize=1)
-def _model():
+def _new_model(name: str):
     try:
         from sentence_transformers import SentenceTransformer  # type: ignore
     except Exception as e:  # pragma: no cover
@@ -15,11 +20,10 @@ def _model():
             "Semantic search is enabled but 'sentence-transformers' is not installed.\n"
             "Install with: pip install sentence-transformers"
         ) from e
-    return SentenceTransformer(settings.embedding_model)
+    return SentenceTransformer(name)
 
 
-def embed_text(text: str) -> List[float]:
-    vec = _model().encode(text or "", normalize_embeddings=True)
+def _to_list(vec) -> List[float]:
     try:
         import numpy as np  # type: ignore
         if isinstance(vec, np.ndarray):
@@ -27,3 +31,233 @@ def embed_text(text: str) -> List[float]:
     except Exception:
         pass
     return [float(x) for x in vec]
+
+
+# ------------------------------------------------------------- worker pool
+#
+# Inference runs in a dedicated executor so SentenceTransformer.encode never
+# blocks the event loop. Each pool worker (thread or process) loads its own
+# copy of the model on first use.
+
+_worker_state = threading.local()
+_executor: Optional[Executor] = None
+
+
+def _worker_model(model_name: str):
+    if getattr(_worker_state, "model_name", None) != model_name:
+        _worker_state.model = _new_model(model_name)
+        _worker_state.model_name = model_name
+    return _worker_state.model
+
+
+def _encode_batch(texts: List[str], model_name: str) -> List[List[float]]:
+    """Runs inside a pool worker."""
+    vecs = _worker_model(model_name).encode([t or "" for t in texts], normalize_embeddings=True)
+    return [_to_list(v) for v in vecs]
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        workers = max(1, settings.embedding_workers)
+        if settings.embedding_executor == "process":
+            # spawn: torch does not survive fork() reliably
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed")
+    return _executor
+
+
+def shutdown_embedding_executor() -> None:
+    global _executor
+    batcher.stop()
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def embed_texts_async(texts: List[str]) -> List[List[float]]:
+    """Embed several texts in one model call on the embedding worker pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _encode_batch, list(texts), settings.embedding_model)
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent single-text embed requests into batched model calls.
+
+    Requests queue up while every pool worker is busy; a batch is dispatched
+    once ``max_batch`` texts are waiting or ``max_wait_ms`` has passed since
+    the first one arrived, and each caller's future is resolved from it.
+    """
+
+    def __init__(self, max_batch: int = 32, max_wait_ms: float = 5, concurrency: int = 2):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.concurrency = concurrency
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def embed(self, text: str) -> List[float]:
+        self._ensure_started()
+        fut = self._loop.create_future()
+        self._queue.put_nowait((text, fut))
+        metrics.set_gauge("embedding_batcher.queue_depth", self._queue.qsize())
+        return await fut
+
+    async def _run(self) -> None:
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            await slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            metrics.set_gauge("embedding_batcher.queue_depth", self._queue.qsize())
+            metrics.observe("embedding_batcher.batch_size", len(batch))
+            self._loop.create_task(self._dispatch(batch, slots))
+
+    async def _dispatch(self, batch, slots: asyncio.Semaphore) -> None:
+        try:
+            vecs = await embed_texts_async([text for text, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            for (_, fut), vec in zip(batch, vecs):
+                if not fut.done():
+                    fut.set_result(vec)
+        finally:
+            slots.release()
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+batcher = EmbeddingBatcher(
+    max_batch=settings.embedding_batch_size,
+    max_wait_ms=settings.embedding_batch_wait_ms,
+    concurrency=max(1, settings.embedding_workers),
+)
+
+
+async def embed_text_async(text: str) -> List[float]:
+    if settings.embedding_batch_size > 1:
+        return await batcher.embed(text)
+    return (await embed_texts_async([text]))[0]
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of query embeddings with a per-entry TTL.
+
+    Keys include the embedding model name, and the whole cache is dropped
+    as soon as ``settings.embedding_model`` changes.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._model_name = settings.embedding_model
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join((text or "").lower().split())
+
+    def _check_model(self) -> None:
+        if self._model_name != settings.embedding_model:
+            self._entries.clear()
+            self._model_name = settings.embedding_model
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = (settings.embedding_model, self.normalize(text))
+        with self._lock:
+            self._check_model()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.incr("query_embedding_cache.hits")
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            metrics.incr("query_embedding_cache.misses")
+            return None
+
+    def put(self, text: str, vec: List[float]) -> None:
+        key = (settings.embedding_model, self.normalize(text))
+        with self._lock:
+            self._check_model()
+            self._entries[key] = (time.monotonic() + self.ttl, vec)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "query_embedding_cache.size": len(self._entries),
+            "query_embedding_cache.hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+query_cache = QueryEmbeddingCache(settings.query_cache_size, settings.query_cache_ttl)
+metrics.register_collector(query_cache.stats)
+
+
+async def embed_query_async(expanded_query: str) -> List[float]:
+    """Embed a preprocessed search query, reusing cached vectors for repeats.
+
+    Cache misses are embedded on the worker pool.
+    """
+    vec = query_cache.get(expanded_query)
+    if vec is None:
+        vec = await embed_text_async(expanded_query)
+        query_cache.put(expanded_query, vec)
+    return vec
+
+
+async def warm_query_cache(queries: Iterable[str]) -> int:
+    """Pre-embed popular raw queries so their first search skips inference.
+
+    Runs on the worker pool in batches, like any other embedding call.
+    """
+    from app.utils.query_processor import preprocess_query
+
+    texts = list(dict.fromkeys(preprocess_query(q.strip()) for q in queries if q.strip()))
+    size = max(1, settings.embedding_batch_size)
+    for i in range(0, len(texts), size):
+        chunk = texts[i:i + size]
+        for text, vec in zip(chunk, await embed_texts_async(chunk)):
+            query_cache.put(text, vec)
+    return len(texts)
@@ -0,0 +1,48 @@
+"""ETags for conditional GETs on listing reads.
+
+A single listing gets a strong ETag from its ``version`` field, which every
+write path increments through ``versioned()``. Browse pages get a weak ETag
+from the response cache generation (app/utils/response_cache.py), which every
+listing write bumps. Either way a matching ``If-None-Match`` is answered with
+304 before anything is serialised.
+"""
+import hashlib
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Response
+
+CACHE_CONTROL = "no-cache"  # clients may store responses but must revalidate
+
+
+def versioned(update: dict) -> dict:
+    """Add the ``version`` bump and ``updated_at`` to a MongoDB update document."""
+    return {
+        **update,
+        "$set": {**update.get("$set", {}), "updated_at": datetime.utcnow()},
+        "$inc": {**update.get("$inc", {}), "version": 1},
+    }
+
+
+def listing_etag(doc: dict) -> str:
+    """Strong ETag; listings written before versioning count as version 0."""
+    return f'"{doc["_id"]}-v{doc.get("version", 0)}"'
+
+
+def page_etag(key: str, token: str) -> str:
+    """Weak ETag for a rendered page: same query, same cache generation."""
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:16]}-{token}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """``If-None-Match`` uses weak comparison (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
@@ -0,0 +1,53 @@
+"""Minimal in-process metrics registry (per worker).
+
+Counters only go up, gauges hold the latest value and summaries keep
+count/sum/max of observed values. ``snapshot()`` is served to admins by
+``GET /analytics/metrics``.
+"""
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, float] = {}
+_summaries: Dict[str, Dict[str, float]] = {}
+_collectors: List[Callable[[], Dict[str, float]]] = []
+
+
+def incr(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name: str, value: float) -> None:
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float) -> None:
+    with _lock:
+        s = _summaries.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+        s["count"] += 1
+        s["sum"] += value
+        s["max"] = max(s["max"], value)
+
+
+def register_collector(fn: Callable[[], Dict[str, float]]) -> None:
+    """Register a callable whose gauges are read at snapshot time."""
+    _collectors.append(fn)
+
+
+def snapshot() -> dict:
+    gauges = {}
+    for fn in _collectors:
+        gauges.update(fn())
+    with _lock:
+        gauges.update(_gauges)
+        summaries = {
+            name: {**s, "avg": s["sum"] / s["count"] if s["count"] else 0.0}
+            for name, s in _summaries.items()
+        }
+        return {"counters": dict(_counters), "gauges": gauges, "summaries": summaries}
@@ -0,0 +1,39 @@
+"""Opaque keyset pagination cursors.
+
+A cursor encodes the sort key and position of the last listing on a page. The
+next page is the range strictly after that position in ``(sort_key, _id)``
+order, which MongoDB serves from a compound index instead of skipping every
+earlier document. Cursors are returned in the ``X-Next-Cursor`` header.
+"""
+import base64
+from typing import Any, Tuple
+
+from bson import json_util
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(sort_key: str, value: Any, after: Any) -> str:
+    """``after`` is the last ``_id`` (or, for distance order, the ids at ``value``)."""
+    payload = json_util.dumps({"k": sort_key, "v": value, "a": after})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, sort_key: str) -> Tuple[Any, Any]:
+    """Return ``(value, after)``; raises ValueError for malformed or mismatched cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json_util.loads(raw.decode())
+        key, value, after = payload["k"], payload["v"], payload["a"]
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if key != sort_key:
+        raise ValueError("Cursor does not match sort_by")
+    return value, after
+
+
+def keyset_filter(sort_key: str, direction: int, value: Any, last_id: Any) -> dict:
+    """Match documents after ``(value, last_id)`` in ``(sort_key, _id)`` order."""
+    op = "$gt" if direction == 1 else "$lt"
+    return {"$or": [{sort_key: {op: value}}, {sort_key: value, "_id": {op: last_id}}]}
+
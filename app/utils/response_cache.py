@@ -0,0 +1,238 @@
+"""Write-invalidated cache for rendered browse responses.
+
+Entries are keyed by endpoint and normalised query parameters and tagged with
+a generation counter. Every listing write bumps the generation, so any entry
+rendered before the write stops matching without scanning or deleting keys.
+Concurrent misses for the same key share one computation (single flight), so
+a popular page that was just invalidated costs one MongoDB query, not one
+per waiting request.
+
+The default backend is an in-process LRU bounded by entry count and total
+bytes. With ``RESPONSE_CACHE_URL=redis://...`` (requires the ``redis``
+package) entries and the generation live in Redis, so a write on one API
+worker invalidates every worker. Without it, other workers serve stale
+pages for at most ``RESPONSE_CACHE_TTL`` seconds.
+
+``validator()`` turns the generation into the token behind the weak ETags on
+browse pages (app/utils/etag.py), so a client revalidation that finds the
+generation unchanged is answered with 304 without touching the entry.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.utils import metrics
+from app.utils.settings import settings
+
+GENERATION_KEY = "respcache:generation"
+Rendered = Tuple[bytes, Dict[str, str]]  # (JSON body, response headers)
+
+
+class MemoryBackend:
+    """Bounded in-process LRU; also the local stand-in for the Redis backend."""
+
+    def __init__(self, maxsize: int = 1024, max_bytes: int = 32 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Generations are per process: validators carry this to never match another worker's
+        self.scope = uuid.uuid4().hex[:8]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        now = time.monotonic()
+        out: List[Optional[bytes]] = []
+        with self._lock:
+            for key in keys:
+                if key in self._counters:
+                    out.append(str(self._counters[key]).encode())
+                    continue
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] <= now:
+                    self._drop(key)
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                out.append(entry[1] if entry is not None else None)
+        return out
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self.nbytes += len(value)
+            while len(self._entries) > self.maxsize or self.nbytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    async def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= len(entry[1])
+
+
+class RedisBackend:
+    """Same interface on any Redis-protocol server (Redis, Valkey, KeyDB...)."""
+
+    def __init__(self, url: str = "", client=None):
+        """Connects to ``url``, or wraps ``client`` (any ``redis.asyncio``-compatible object)."""
+        if client is None:
+            try:
+                import redis.asyncio as redis  # type: ignore
+            except Exception as e:  # pragma: no cover
+                raise RuntimeError(
+                    "RESPONSE_CACHE_URL is set but the 'redis' package is not installed.\n"
+                    "Install with: pip install redis"
+                ) from e
+            client = redis.from_url(url)
+        self._client = client
+        self.scope = None  # one generation shared by every worker
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return await self._client.mget(list(keys))
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._client.set(key, value, ex=max(1, int(ttl)))
+
+    async def incr(self, key: str) -> int:
+        return await self._client.incr(key)
+
+
+def _pack(generation: int, rendered: Rendered) -> bytes:
+    body, headers = rendered
+    return f"{generation}\n{json.dumps(headers)}\n".encode() + body
+
+
+def _unpack(raw: bytes) -> Tuple[int, Rendered]:
+    generation, headers, body = raw.split(b"\n", 2)
+    return int(generation), (body, json.loads(headers))
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl: float = 60):
+        self.backend = backend
+        self.ttl = ttl
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key(endpoint: str, **params) -> str:
+        """Normalised key: parameter order and unset parameters do not matter."""
+        parts = [f"{k}={getattr(v, 'value', v)}" for k, v in sorted(params.items()) if v is not None]
+        return f"respcache:{endpoint}?{'&'.join(parts)}"
+
+    async def invalidate(self) -> None:
+        try:
+            await self.backend.incr(GENERATION_KEY)
+            metrics.incr("response_cache.invalidations")
+        except Exception as e:
+            print(f"⚠️  Response cache invalidation failed: {e}")
+
+    async def generation(self) -> Optional[int]:
+        """Current generation, or None when the backend is unreachable."""
+        try:
+            (raw,) = await self.backend.get_many([GENERATION_KEY])
+        except Exception as e:
+            print(f"⚠️  Response cache read failed: {e}")
+            return None
+        return int(raw or 0)
+
+    def validator(self, generation: int) -> str:
+        """Token that changes whenever pages rendered at ``generation`` may be stale."""
+        scope = self.backend.scope
+        if scope is None:
+            return str(generation)
+        # Writes on other workers do not bump this process's counter; like the
+        # cached entries themselves, validators then go stale after one TTL
+        return f"{scope}.{generation}.{int(time.time() // max(self.ttl, 1))}"
+
+    async def get_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[Rendered]], generation: Optional[int] = None
+    ) -> Rendered:
+        """Cached rendering of ``key``; pass ``generation`` when the caller already read it."""
+        if self.ttl <= 0:
+            return await compute()
+        try:
+            if generation is None:
+                raw_generation, raw = await self.backend.get_many([GENERATION_KEY, key])
+                generation = int(raw_generation or 0)
+            else:
+                (raw,) = await self.backend.get_many([key])
+        except Exception as e:  # cache outage must not take browse down
+            print(f"⚠️  Response cache read failed: {e}")
+            return await compute()
+        if raw is not None:
+            cached_generation, rendered = _unpack(raw)
+            if cached_generation == generation:
+                metrics.incr("response_cache.hits")
+                return rendered
+
+        flight = f"{generation}:{key}"
+        pending = self._inflight.get(flight)
+        if pending is not None:
+            metrics.incr("response_cache.coalesced")
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # shield() keeps our own cancellation away from ``pending``, so a
+                # cancelled ``pending`` means the leader was cancelled (its client
+                # went away). Task.cancelling() (3.11+) also catches both at once.
+                cancelling = getattr(asyncio.current_task(), "cancelling", None)
+                if not pending.cancelled() or (cancelling is not None and cancelling()):
+                    raise
+                metrics.incr("response_cache.leader_cancelled")
+                return await compute()
+
+        metrics.incr("response_cache.misses")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[flight] = future
+        try:
+            rendered = await compute()
+            # Tagged with the generation read *before* computing: a write that
+            # lands meanwhile bumps it and this entry is never served
+            try:
+                await self.backend.set(key, _pack(generation, rendered), self.ttl)
+            except Exception as e:
+                print(f"⚠️  Response cache write failed: {e}")
+            future.set_result(rendered)
+            return rendered
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self._inflight.pop(flight, None)
+
+    def stats(self) -> dict:
+        if isinstance(self.backend, MemoryBackend):
+            return {"response_cache.entries": len(self.backend), "response_cache.bytes": self.backend.nbytes}
+        return {}
+
+
+def _backend():
+    if settings.response_cache_url:
+        return RedisBackend(settings.response_cache_url)
+    return MemoryBackend(settings.response_cache_size, settings.response_cache_max_bytes)
+
+
+response_cache = ResponseCache(_backend(), settings.response_cache_ttl)
+metrics.register_collector(response_cache.stats)
@@ -0,0 +1,78 @@
+"""Vectorised similarity scoring shared by the semantic and hybrid search routes.
+
+Embeddings from ``embed_texts_async`` are already L2-normalised, so cosine
+similarity reduces to one float32 matrix-vector product over the candidate set.
+"""
+from __future__ import annotations
+
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+
+def as_vector(vec: Iterable[float]) -> np.ndarray:
+    return np.asarray(vec, dtype=np.float32).ravel()
+
+
+def stack_embeddings(vectors: Sequence[Optional[Iterable[float]]], dim: int) -> np.ndarray:
+    """Stack stored embeddings into an (n, dim) float32 matrix.
+
+    Missing or wrong-sized embeddings become zero rows, which score 0.
+    """
+    mat = np.zeros((len(vectors), dim), dtype=np.float32)
+    for row, vec in enumerate(vectors):
+        if vec is None:
+            continue
+        arr = np.asarray(vec, dtype=np.float32)
+        if arr.shape == (dim,):
+            mat[row] = arr
+    return mat
+
+
+def cosine_scores(query: Iterable[float], matrix: np.ndarray) -> np.ndarray:
+    """Cosine similarity of ``query`` against every row of ``matrix`` (unit vectors)."""
+    return matrix @ as_vector(query)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` largest scores, highest first.
+
+    Uses argpartition so only the selected ``k`` entries are fully sorted.
+    """
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(scores.size)
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+# --------------------------------------------------------------- binary codes
+#
+# One sign bit per dimension gives a code 32x smaller than the float32 vector.
+# Hamming distance between codes approximates angular distance, so it works as
+# a cheap exhaustive first pass before exact cosine re-ranking.
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def pack_sign_bits(matrix: np.ndarray) -> np.ndarray:
+    """(n, dim) float matrix -> (n, ceil(dim / 8)) uint8 sign-bit codes."""
+    return np.packbits(np.atleast_2d(matrix) > 0, axis=1)
+
+
+def hamming_distances(query_code: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Popcount Hamming distance from ``query_code`` to every row of ``codes``."""
+    xor = np.bitwise_xor(codes, query_code.reshape(1, -1))
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0 has a native popcount
+        return np.bitwise_count(xor).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[xor].sum(axis=1, dtype=np.int32)
+
+
+def shortlist_by_hamming(query: np.ndarray, codes: np.ndarray, size: int) -> np.ndarray:
+    """Indices of the ``size`` codes closest to ``query`` (unordered)."""
+    if codes.shape[0] <= size:
+        return np.arange(codes.shape[0])
+    dist = hamming_distances(pack_sign_bits(query)[0], codes)
+    return np.argpartition(dist, size - 1)[:size]
@@ -9,8 +9,45 @@ class Settings(BaseSettings):
     jwt_secret: str = Field(alias="JWT_SECRET", default="change_me")
     jwt_algorithm: str = Field(alias="JWT_ALGORITHM", default="HS256")
     jwt_expires_minutes: int = Field(alias="JWT_EXPIRES_MINUTES", default=60)
+    # Password hashing (bcrypt runs in a thread pool, never on the event loop)
+    bcrypt_rounds: int = Field(alias="BCRYPT_ROUNDS", default=12)  # raising it rehashes users on their next login
+    password_hash_workers: int = Field(alias="PASSWORD_HASH_WORKERS", default=2)  # concurrent bcrypt calls per API worker
+    token_cache_size: int = Field(alias="TOKEN_CACHE_SIZE", default=1024)  # verified JWTs kept per worker; 0 disables
     enable_semantic_search: bool = Field(alias="ENABLE_SEMANTIC_SEARCH", default=False)
     embedding_model: str = Field(alias="EMBEDDING_MODEL", default="sentence-transformers/all-MiniLM-L6-v2")
+    embedding_executor: str = Field(alias="EMBEDDING_EXECUTOR", default="thread")  # thread | process
+    embedding_workers: int = Field(alias="EMBEDDING_WORKERS", default=2)
+    embedding_batch_size: int = Field(alias="EMBEDDING_BATCH_SIZE", default=32)  # 1 disables micro-batching
+    embedding_batch_wait_ms: float = Field(alias="EMBEDDING_BATCH_WAIT_MS", default=5)
+    # Query embedding cache
+    query_cache_size: int = Field(alias="QUERY_CACHE_SIZE", default=2048)
+    query_cache_ttl: float = Field(alias="QUERY_CACHE_TTL", default=3600)  # seconds
+    query_cache_warmup_file: str = Field(alias="QUERY_CACHE_WARMUP_FILE", default="")  # one query per line
+    # ANN index used by semantic/hybrid search
+    ann_nlist: int = Field(alias="ANN_NLIST", default=0)  # 0 = sqrt(collection size)
+    ann_nprobe: int = Field(alias="ANN_NPROBE", default=24)
+    semantic_candidates: int = Field(alias="SEMANTIC_CANDIDATES", default=500)
+    binary_shortlist: int = Field(alias="BINARY_SHORTLIST", default=500)  # Hamming survivors re-ranked exactly
+    embedding_format: str = Field(alias="EMBEDDING_FORMAT", default="float32")  # float32 | int8 | array
+    embedding_store_dir: str = Field(alias="EMBEDDING_STORE_DIR", default="data/embedding_store")
+    embedding_dim: int = Field(alias="EMBEDDING_DIM", default=0)  # 0 = from the stored embeddings of EMBEDDING_MODEL
+    # Embedding job queue (drained by `python -m etl.embedding_worker`)
+    embedding_job_batch_size: int = Field(alias="EMBEDDING_JOB_BATCH_SIZE", default=64)
+    embedding_job_lease_seconds: float = Field(alias="EMBEDDING_JOB_LEASE_SECONDS", default=120)
+    embedding_job_max_attempts: int = Field(alias="EMBEDDING_JOB_MAX_ATTEMPTS", default=5)
+    embedding_worker_inline: bool = Field(alias="EMBEDDING_WORKER_INLINE", default=False)  # dev: drain queue in the API
+    index_refresh_seconds: float = Field(alias="INDEX_REFRESH_SECONDS", default=5)
+    # Browse response cache (invalidated on every listing write)
+    response_cache_ttl: float = Field(alias="RESPONSE_CACHE_TTL", default=60)  # seconds; 0 disables
+    response_cache_size: int = Field(alias="RESPONSE_CACHE_SIZE", default=1024)  # entries
+    response_cache_max_bytes: int = Field(alias="RESPONSE_CACHE_MAX_BYTES", default=32 * 1024 * 1024)
+    response_cache_url: str = Field(alias="RESPONSE_CACHE_URL", default="")  # redis://... shares it across workers
+    # Admin analytics
+    live_analytics_ttl: float = Field(alias="LIVE_ANALYTICS_TTL", default=30)  # seconds GET /analytics/live is reused; 0 disables
+    sketch_flush_seconds: float = Field(alias="SKETCH_FLUSH_SECONDS", default=30)  # tag/distinct sketches -> MongoDB
+    # Expired-listing archival
+    archive_sweep_seconds: float = Field(alias="ARCHIVE_SWEEP_SECONDS", default=300)  # 0 = only via etl.archive_expired
+    archive_batch_size: int = Field(alias="ARCHIVE_BATCH_SIZE", default=500)
     cors_origins: List[str] = Field(alias="CORS_ORIGINS", default_factory=lambda: [
         "http://localhost:5173",
         "http://127.0.0.1:5173",
@@ -21,6 +58,9 @@ class Settings(BaseSettings):
     # Image storage
     storage_provider: str = Field(alias="STORAGE_PROVIDER", default="local")  # local | s3
     local_images_dir: str = Field(alias="LOCAL_IMAGES_DIR", default="app/listings_images")
+    max_upload_bytes: int = Field(alias="MAX_UPLOAD_BYTES", default=10 * 1024 * 1024)  # larger uploads get 413
+    upload_chunk_bytes: int = Field(alias="UPLOAD_CHUNK_BYTES", default=1024 * 1024)  # memory per upload in flight
+    image_workers: int = Field(alias="IMAGE_WORKERS", default=2)  # processes rendering thumbnails/WebP; 0 disables
     # S3 placeholders
     s3_bucket: str = Field(alias="S3_BUCKET", default="")
     s3_region: str = Field(alias="S3_REGION", default="")
@@ -0,0 +1,139 @@
+"""Mergeable streaming sketches for analytics.
+
+- ``CountMinSketch``: approximate per-item counts in fixed memory. Accepts
+  negative updates, so tags removed by edits/deletes are subtracted.
+- ``SpaceSaving``: the ``capacity`` heaviest items seen (increments only);
+  used as the candidate set for top-k, ranked by the Count-Min estimates.
+- ``HyperLogLog``: distinct counts with ~1.6% standard error at p=12.
+
+All three merge with a sketch of the same shape (Count-Min: add,
+Space-Saving: mergeable summaries, HyperLogLog: register max), which is how
+per-worker deltas are folded into the shared copy in MongoDB
+(app/services/stream_analytics.py). Hashes are keyed blake2b, never
+``hash()``, so every process maps an item to the same cells.
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def _hash64(item: str, salt: bytes = b"") -> int:
+    return int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8, salt=salt).digest(), "big")
+
+
+class CountMinSketch:
+    def __init__(self, width: int = 2048, depth: int = 4, table: Optional[np.ndarray] = None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.int64)
+
+    def _cells(self, item: str) -> Tuple[np.ndarray, np.ndarray]:
+        # Kirsch-Mitzenmacher double hashing: row i uses h1 + i * h2
+        h1, h2 = _hash64(item, b"cms-1"), _hash64(item, b"cms-2") | 1
+        return np.arange(self.depth), np.array([(h1 + i * h2) % self.width for i in range(self.depth)])
+
+    def add(self, item: str, count: int = 1) -> None:
+        self.table[self._cells(item)] += count
+
+    def estimate(self, item: str) -> int:
+        return int(max(self.table[self._cells(item)].min(), 0))
+
+    def merge(self, other: "CountMinSketch") -> None:
+        if other.table.shape != self.table.shape:
+            raise ValueError("Count-Min sketches must have the same width and depth")
+        self.table += other.table
+
+    def to_bytes(self) -> bytes:
+        return self.table.astype("<i8").tobytes()
+
+    @classmethod
+    def from_bytes(cls, raw: bytes, width: int, depth: int) -> "CountMinSketch":
+        return cls(width, depth, np.frombuffer(raw, dtype="<i8").reshape(depth, width).astype(np.int64))
+
+
+class SpaceSaving:
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def _floor(self) -> int:
+        """Count an unmonitored item may already have (0 until the summary is full)."""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def add(self, item: str, count: int = 1) -> None:
+        if item in self.counts:
+            self.counts[item] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item], self.errors[item] = count, 0
+            return
+        victim = min(self.counts, key=self.counts.get)
+        floor = self.counts.pop(victim)
+        self.errors.pop(victim)
+        self.counts[item], self.errors[item] = floor + count, floor
+
+    def merge(self, other: "SpaceSaving") -> None:
+        """Mergeable-summaries rule: an item missing on one side gets that side's floor."""
+        mine, theirs = self._floor(), other._floor()
+        counts, errors = {}, {}
+        for item in self.counts.keys() | other.counts.keys():
+            counts[item] = self.counts.get(item, mine) + other.counts.get(item, theirs)
+            errors[item] = self.errors.get(item, mine) + other.errors.get(item, theirs)
+        keep = sorted(counts, key=counts.get, reverse=True)[: self.capacity]
+        self.counts = {item: counts[item] for item in keep}
+        self.errors = {item: errors[item] for item in keep}
+
+    def top(self, n: int) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+    def to_list(self) -> List[list]:
+        return [[item, self.counts[item], self.errors[item]] for item in self.counts]
+
+    @classmethod
+    def from_list(cls, rows: Iterable[list], capacity: int) -> "SpaceSaving":
+        summary = cls(capacity)
+        for item, count, error in rows:
+            summary.counts[item], summary.errors[item] = count, error
+        return summary
+
+
+class HyperLogLog:
+    def __init__(self, p: int = 12, registers: Optional[np.ndarray] = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+
+    def add(self, item: str) -> None:
+        h = _hash64(item, b"hll")
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1  # leading zeros + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * np.log(self.m / zeros)  # linear counting for small sets
+        return int(round(estimate))
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.p != self.p:
+            raise ValueError("HyperLogLogs must have the same precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def to_bytes(self) -> bytes:
+        return self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, raw: bytes, p: int) -> "HyperLogLog":
+        return cls(p, np.frombuffer(raw, dtype=np.uint8).copy())
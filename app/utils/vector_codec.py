@@ -0,0 +1,62 @@
+"""Compact BSON encoding for listing embeddings.
+
+Embeddings used to be stored as arrays of BSON doubles (~3.5 KB for 384
+dimensions). They are now packed into a BSON Binary (user-defined subtype)
+whose first byte says how the payload is laid out:
+
+- ``f``: little-endian float32 values (4 bytes per dimension)
+- ``q``: little-endian float32 scale followed by int8 values, where
+  ``value = q * scale`` (1 byte per dimension)
+
+``decode_embedding`` also accepts the legacy array form, so documents can be
+migrated lazily or in bulk with ``python -m etl.migrate_embeddings``.
+"""
+from __future__ import annotations
+
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from bson.binary import Binary, USER_DEFINED_SUBTYPE
+
+from app.utils.settings import settings
+
+FLOAT32 = b"f"
+INT8 = b"q"
+FORMATS = ("float32", "int8", "array")
+
+# Matches documents that carry an embedding in any supported encoding
+HAS_EMBEDDING = {"$type": ["array", "binData"]}
+
+
+def encode_embedding(vec: Iterable[float], fmt: Optional[str] = None) -> Any:
+    """Encode a vector for storage in the ``embedding`` field."""
+    fmt = fmt or settings.embedding_format
+    arr = np.asarray(vec, dtype=np.float32).ravel()
+    if fmt == "array":
+        return arr.astype(float).tolist()
+    if fmt == "int8":
+        peak = float(np.abs(arr).max()) if arr.size else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        codes = np.clip(np.rint(arr / scale), -127, 127).astype(np.int8)
+        payload = INT8 + np.float32(scale).astype("<f4").tobytes() + codes.tobytes()
+        return Binary(payload, USER_DEFINED_SUBTYPE)
+    if fmt == "float32":
+        return Binary(FLOAT32 + arr.astype("<f4").tobytes(), USER_DEFINED_SUBTYPE)
+    raise ValueError(f"Unsupported embedding format: {fmt}")
+
+
+def decode_embedding(value: Any) -> Optional[np.ndarray]:
+    """Decode a stored embedding into a float32 vector (None if absent/unreadable)."""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return np.asarray(value, dtype=np.float32)
+    if isinstance(value, (bytes, bytearray)):
+        data = bytes(value)
+        tag, body = data[:1], data[1:]
+        if tag == FLOAT32:
+            return np.frombuffer(body, dtype="<f4").astype(np.float32)
+        if tag == INT8 and len(body) >= 4:
+            scale = np.frombuffer(body[:4], dtype="<f4")[0]
+            return np.frombuffer(body[4:], dtype=np.int8).astype(np.float32) * scale
+    return None
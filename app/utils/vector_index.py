@@ -0,0 +1,376 @@
+"""In-process approximate nearest neighbour index over listing embeddings.
+
+The index is an IVF (inverted file) structure: vectors are clustered with
+spherical k-means and a query only scores the members of the ``nprobe``
+closest clusters, so search cost grows with ``nprobe * N / nlist`` rather
+than ``N``. Small collections (below ``train_threshold``) are searched
+exhaustively, which is both exact and faster at that size.
+
+Embeddings produced by ``embed_texts_async`` are L2-normalised, so the inner
+product used here is the cosine similarity.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.utils.embedding_store import embedding_store, reconcile_embedding_store
+from app.utils.scoring import cosine_scores, pack_sign_bits, shortlist_by_hamming, top_k
+from app.utils.settings import settings
+from app.utils.vector_codec import HAS_EMBEDDING, decode_embedding
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _kmeans(data: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means; returns unit-norm centroids of shape (nlist, dim)."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(data.shape[0], size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty clusters from random points so no list goes unused
+            sums[empty] = data[rng.choice(data.shape[0], size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums).astype(np.float32)
+    return centroids
+
+
+class VectorIndex:
+    """IVF-flat index keyed by listing id (string form of the ObjectId)."""
+
+    def __init__(
+        self,
+        dim: int = 0,
+        nlist: int = 0,
+        nprobe: int = 24,
+        train_threshold: int = 4096,
+    ):
+        self.dim = dim
+        self.nlist_setting = nlist  # 0 = choose from collection size
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self._lock = threading.RLock()
+        self._epoch = 0  # bumped by every rebuild, so a stale retrain is discarded
+        self._dirty: Optional[Set[int]] = None  # rows changed while retrain() runs
+        self._reset()
+
+    def _reset(self) -> None:
+        self._epoch += 1
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._codes = np.zeros((0, (self.dim + 7) // 8), dtype=np.uint8)
+        self._live = np.zeros(0, dtype=bool)
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._size = 0  # rows handed out so far (live + free)
+        self._ids: List[Optional[str]] = []
+        self._row_of: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._members: List[Set[int]] = []
+        self._member_arrays: List[Optional[np.ndarray]] = []
+        self._trained_size = 0
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def __contains__(self, listing_id: str) -> bool:
+        return listing_id in self._row_of
+
+    def accepts(self, query: Iterable[float]) -> bool:
+        """Whether ``query`` can be searched here (index loaded, same dimension)."""
+        return self.ready and np.size(query) == self.dim
+
+    def get(self, listing_id: str) -> Optional[np.ndarray]:
+        row = self._row_of.get(listing_id)
+        return None if row is None else self._vectors[row]
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    # ------------------------------------------------------------------ build
+
+    def build(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        """Replace the index contents with ``ids``/``vectors`` in one pass."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 2 and vectors.shape[1]:
+            dim = vectors.shape[1]
+        else:
+            dim = self.dim
+        vectors = vectors.reshape(-1, dim) if dim else vectors
+        with self._lock:
+            self.dim = dim
+            self._reset()
+            self._grow(len(ids))
+            n = len(ids)
+            self._vectors[:n] = vectors
+            self._codes[:n] = pack_sign_bits(vectors) if n else 0
+            self._live[:n] = True
+            self._ids = list(ids)
+            self._row_of = {listing_id: row for row, listing_id in enumerate(self._ids)}
+            self._size = n
+            if n >= self.train_threshold:
+                self._train()
+            self.ready = True
+
+    def _choose_nlist(self, n: int) -> int:
+        if self.nlist_setting:
+            return max(1, min(self.nlist_setting, n))
+        return max(16, min(4096, int(math.sqrt(n))))
+
+    def _train(self) -> None:
+        live_rows = np.flatnonzero(self._live[: self._size])
+        self._install(*self._cluster(self._vectors, live_rows), live_rows)
+
+    def _cluster(self, vectors: np.ndarray, live_rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Centroids and the cluster of each of ``live_rows``; reads ``vectors`` only."""
+        n = live_rows.size
+        nlist = self._choose_nlist(n)
+        # ~40 points per centroid is enough for stable clusters (the usual IVF rule of thumb)
+        sample_size = min(n, nlist * 40)
+        rng = np.random.default_rng(0)
+        sample_rows = rng.choice(live_rows, size=sample_size, replace=False)
+        centroids = _kmeans(vectors[sample_rows], nlist)
+        assign = np.empty(n, dtype=np.int32)
+        for start in range(0, n, 65536):
+            chunk = live_rows[start:start + 65536]
+            assign[start:start + chunk.size] = np.argmax(vectors[chunk] @ centroids.T, axis=1)
+        return centroids, assign
+
+    def _install(self, centroids: np.ndarray, assign: np.ndarray, rows: np.ndarray) -> None:
+        """Switch to ``centroids`` with ``rows`` assigned as given (lock held)."""
+        nlist = centroids.shape[0]
+        self._centroids = centroids
+        self._members = [set() for _ in range(nlist)]
+        self._member_arrays = [None] * nlist
+        self._assign[:] = -1
+        self._assign[rows] = assign
+        for cluster in np.unique(assign):
+            self._members[cluster].update(rows[assign == cluster].tolist())
+        self._trained_size = len(self._row_of)
+
+    def needs_training(self) -> bool:
+        """Whether the collection outgrew the clustering it was trained on."""
+        live = len(self._row_of)
+        if self._centroids is None:
+            return live >= self.train_threshold
+        return live > 4 * self._trained_size
+
+    def retrain(self) -> None:
+        """Re-cluster the index; blocking, so call it through ``asyncio.to_thread``.
+
+        k-means runs on a snapshot without holding the lock, so searches keep
+        using the old clustering meanwhile. Rows added or removed in the
+        meantime are assigned to the new clusters when they are swapped in.
+        """
+        with self._lock:
+            if self._dirty is not None or not self.needs_training():
+                return
+            epoch, vectors = self._epoch, self._vectors
+            live_rows = np.flatnonzero(self._live[: self._size])
+            self._dirty = set()
+        try:
+            centroids, assign = self._cluster(vectors, live_rows)
+            with self._lock:
+                if self._epoch != epoch:
+                    return  # rebuilt meanwhile
+                dirty = np.fromiter(self._dirty, dtype=np.int64, count=len(self._dirty))
+                keep = ~np.isin(live_rows, dirty)
+                self._install(centroids, assign[keep], live_rows[keep])
+                for row in dirty[self._live[dirty]]:
+                    cluster = int(np.argmax(centroids @ self._vectors[row]))
+                    self._assign[row] = cluster
+                    self._members[cluster].add(int(row))
+        finally:
+            with self._lock:
+                self._dirty = None
+
+    def _grow(self, needed: int) -> None:
+        capacity = self._vectors.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        vectors = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        vectors[:capacity] = self._vectors
+        codes = np.zeros((new_capacity, self._codes.shape[1]), dtype=np.uint8)
+        codes[:capacity] = self._codes
+        live = np.zeros(new_capacity, dtype=bool)
+        live[:capacity] = self._live
+        assign = np.full(new_capacity, -1, dtype=np.int32)
+        assign[:capacity] = self._assign
+        self._vectors, self._codes, self._live, self._assign = vectors, codes, live, assign
+
+    # ---------------------------------------------------------------- updates
+
+    def add(self, listing_id: str, vector: Iterable[float]) -> None:
+        """Insert or replace the vector for ``listing_id``.
+
+        Never retrains; check ``needs_training()`` and call ``retrain()`` off the event loop.
+        """
+        vec = np.asarray(vector, dtype=np.float32).ravel()
+        with self._lock:
+            if not self._row_of and vec.size != self.dim:
+                # An empty index takes the dimension of its first vector
+                ready, self.dim = self.ready, vec.size
+                self._reset()
+                self.ready = ready
+            vec = vec.reshape(self.dim)
+            self._remove_locked(listing_id)
+            if self._free:
+                row = self._free.pop()
+                self._ids[row] = listing_id
+            else:
+                row = self._size
+                self._grow(row + 1)
+                self._ids.append(listing_id)
+                self._size += 1
+            self._vectors[row] = vec
+            self._codes[row] = pack_sign_bits(vec)[0]
+            self._live[row] = True
+            self._row_of[listing_id] = row
+            if self._dirty is not None:
+                self._dirty.add(row)
+            if self._centroids is not None:
+                cluster = int(np.argmax(self._centroids @ vec))
+                self._assign[row] = cluster
+                self._members[cluster].add(row)
+                self._member_arrays[cluster] = None
+
+    def remove(self, listing_id: str) -> None:
+        with self._lock:
+            self._remove_locked(listing_id)
+
+    def _remove_locked(self, listing_id: str) -> None:
+        row = self._row_of.pop(listing_id, None)
+        if row is None:
+            return
+        self._live[row] = False
+        self._ids[row] = None
+        if self._dirty is not None:
+            self._dirty.add(row)
+        cluster = int(self._assign[row])
+        if cluster >= 0:
+            self._members[cluster].discard(row)
+            self._member_arrays[cluster] = None
+            self._assign[row] = -1
+        self._free.append(row)
+
+    # ----------------------------------------------------------------- search
+
+    def _cluster_rows(self, cluster: int) -> np.ndarray:
+        rows = self._member_arrays[cluster]
+        if rows is None:
+            rows = np.fromiter(self._members[cluster], dtype=np.int64, count=len(self._members[cluster]))
+            self._member_arrays[cluster] = rows
+        return rows
+
+    def search(self, query: Iterable[float], k: int, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Return up to ``k`` ``(listing_id, cosine)`` pairs, best first."""
+        q = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            if not self._row_of:
+                return []
+            if self._centroids is None:
+                rows = np.flatnonzero(self._live[: self._size])
+            else:
+                probes = top_k(cosine_scores(q, self._centroids), nprobe or self.nprobe)
+                rows = np.concatenate([self._cluster_rows(int(c)) for c in probes])
+            scores = cosine_scores(q, self._vectors[rows])
+            best = top_k(scores, k)
+            return [(self._ids[rows[i]], float(scores[i])) for i in best]
+
+    def search_subset(self, query: Iterable[float], ids: Iterable[str], k: int, shortlist: int) -> List[Tuple[str, float]]:
+        """Exhaustive two-stage search restricted to ``ids``.
+
+        The sign-bit codes of every candidate are scanned by Hamming distance,
+        and only the ``shortlist`` closest are re-ranked with exact cosine.
+        """
+        q = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            row_of = self._row_of
+            rows = np.fromiter((row_of[i] for i in ids if i in row_of), dtype=np.int64)
+            if rows.size == 0:
+                return []
+            rows = rows[shortlist_by_hamming(q, self._codes[rows], max(shortlist, k))]
+            scores = cosine_scores(q, self._vectors[rows])
+            best = top_k(scores, k)
+            return [(self._ids[rows[i]], float(scores[i])) for i in best]
+
+
+listing_index = VectorIndex(settings.embedding_dim, nlist=settings.ann_nlist, nprobe=settings.ann_nprobe)
+
+
+async def load_listing_index(db) -> int:
+    """Build ``listing_index`` from the on-disk embedding store.
+
+    The store is first reconciled against MongoDB, which only reads back
+    listings embedded since its watermark.
+    """
+    global _synced_at
+    started = datetime.utcnow()
+    await reconcile_embedding_store(db)
+    ids, vectors = await asyncio.to_thread(embedding_store.live)
+    # Building trains the clustering: seconds at 1M vectors, so not on the event loop
+    await asyncio.to_thread(listing_index.build, ids, vectors)
+    _synced_at = started
+    return len(ids)
+
+
+# Embeddings are written by the queue worker (etl/embedding_worker.py), often in
+# another process, so each API worker polls for rows embedded since its last
+# sync. The lookback covers writes that committed after we read past them.
+_synced_at: Optional[datetime] = None
+REFRESH_LOOKBACK = timedelta(seconds=30)
+
+
+async def refresh_listing_index(db) -> int:
+    """Add listings embedded since the last sync to ``listing_index`` and drop archived or deleted ones."""
+    global _synced_at
+    if _synced_at is None:
+        return 0
+    started = datetime.utcnow()
+    added = 0
+    query = {"embedding": HAS_EMBEDDING, "embedded_at": {"$gte": _synced_at - REFRESH_LOOKBACK}}
+    async for doc in db.listings.find(query, {"embedding": 1}):
+        vec = decode_embedding(doc.get("embedding"))
+        if vec is None or (len(listing_index) and vec.shape != (listing_index.dim,)):
+            continue
+        listing_id = str(doc["_id"])
+        current = listing_index.get(listing_id)
+        if current is not None and np.array_equal(current, vec):
+            continue
+        listing_index.add(listing_id, vec)
+        added += 1
+    # Listings archived by another worker's sweeper (app/services/archive.py)
+    async for doc in db.listings_archive.find({"archived_at": {"$gte": _synced_at - REFRESH_LOOKBACK}}, {"_id": 1}):
+        listing_index.remove(str(doc["_id"]))
+    # Listings deleted through another worker (tombstones written for the rollup ETL)
+    async for doc in db.listing_tombstones.find({"deleted_at": {"$gte": _synced_at - REFRESH_LOOKBACK}}, {"_id": 1}):
+        listing_index.remove(str(doc["_id"]))
+    if listing_index.needs_training():
+        await asyncio.to_thread(listing_index.retrain)
+    _synced_at = started
+    return added
+
+
+async def run_index_refresher(db, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_listing_index(db)
+        except Exception as e:
+            print(f"⚠️  ANN index refresh failed: {e}")
+
@@ -0,0 +1,79 @@
+"""Event-loop latency during a burst of logins, bcrypt inline vs. offloaded.
+
+A ticker coroutine sleeps 1 ms in a loop and records how late it wakes up;
+that lateness is what every other request on the worker (listing reads,
+searches) waits on top of its own work. Each mode then runs N concurrent
+password verifications: "inline" calls passlib in the coroutine like the old
+handlers, "offloaded" goes through ``verify_password_async``.
+
+Usage:
+    python -m benchmarks.password_hashing                    # 50 logins, 10 rounds
+    python -m benchmarks.password_hashing --logins 50 --rounds 12 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+async def _ticker(lags: list, stop: asyncio.Event, interval: float = 0.001) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - t0 - interval) * 1000)
+
+
+async def _measure(label: str, login, logins: int) -> None:
+    lags: list = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(lags, stop))
+    await asyncio.sleep(0.05)  # baseline ticks
+    t0 = time.perf_counter()
+    await asyncio.gather(*[login() for _ in range(logins)])
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await ticker
+    lag = np.array(lags or [0.0])
+    print(
+        f"{label:>10}: {logins} logins in {elapsed:.2f}s | loop lag p50={np.percentile(lag, 50):.1f}ms "
+        f"p99={np.percentile(lag, 99):.1f}ms max={lag.max():.1f}ms | ticks={len(lags)}"
+    )
+
+
+async def main(logins: int) -> None:
+    from app.auth.security import pwd_context, verify_password_async
+    from app.utils import metrics
+
+    stored = pwd_context.hash("correct horse battery staple")
+
+    async def inline_login():
+        assert pwd_context.verify("correct horse battery staple", stored)
+
+    async def offloaded_login():
+        valid, _ = await verify_password_async("correct horse battery staple", stored)
+        assert valid
+
+    await _measure("inline", inline_login, logins)
+    await _measure("offloaded", offloaded_login, logins)
+    queue = metrics.snapshot()["summaries"].get("auth.hash_queue_ms", {})
+    if queue.get("count"):
+        print(f"offloaded queue time: mean={queue['sum'] / queue['count']:.0f}ms max={queue['max']:.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Loop latency under concurrent bcrypt logins")
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=10, help="bcrypt cost (production default is 12)")
+    parser.add_argument("--workers", type=int, default=None, help="PASSWORD_HASH_WORKERS override")
+    args = parser.parse_args()
+    # Settings are read at import time
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    if args.workers:
+        os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    asyncio.run(main(args.logins))
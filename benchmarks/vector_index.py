@@ -0,0 +1,83 @@
+"""Recall@k and latency benchmark for the listing ANN index.
+
+Vectors are drawn from a Gaussian mixture on the unit sphere so that, like
+real sentence embeddings, they have cluster structure. Ground truth comes
+from an exhaustive matrix product over the same data.
+
+Usage:
+    python -m benchmarks.vector_index                 # 100k and 1M vectors
+    python -m benchmarks.vector_index --sizes 100000 --nprobe 8 16 32
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.utils.scoring import top_k
+from app.utils.vector_index import VectorIndex, _normalize
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int = 2000, seed: int = 42) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = _normalize(rng.standard_normal((clusters, dim)).astype(np.float32))
+    out = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100_000):
+        stop = min(n, start + 100_000)
+        labels = rng.integers(0, clusters, size=stop - start)
+        noise = rng.standard_normal((stop - start, dim)).astype(np.float32) * 0.06
+        out[start:stop] = _normalize(centers[labels] + noise)
+    return out
+
+
+def run(n: int, dim: int, k: int, queries: int, nprobes) -> None:
+    print(f"\n=== {n:,} vectors, dim={dim}, k={k}, {queries} queries ===")
+    data = synthetic_embeddings(n + queries, dim)
+    base, qs = data[:n], data[n:]
+    ids = [str(i) for i in range(n)]
+
+    index = VectorIndex(dim=dim)
+    t0 = time.perf_counter()
+    index.build(ids, base)
+    print(f"build: {time.perf_counter() - t0:.1f}s (nlist={len(index._members)})")
+
+    truth = []
+    brute_lat = []
+    for q in qs:
+        t0 = time.perf_counter()
+        truth.append(set(top_k(base @ q, k).tolist()))
+        brute_lat.append(time.perf_counter() - t0)
+    print(f"exhaustive: p50={np.percentile(brute_lat, 50) * 1000:.2f}ms p99={np.percentile(brute_lat, 99) * 1000:.2f}ms")
+
+    for nprobe in nprobes:
+        lat = []
+        hits = 0
+        for q, expected in zip(qs, truth):
+            t0 = time.perf_counter()
+            res = index.search(q, k, nprobe=nprobe)
+            lat.append(time.perf_counter() - t0)
+            hits += len(expected & {int(i) for i, _ in res})
+        recall = hits / (k * len(truth))
+        print(
+            f"nprobe={nprobe:<3} recall@{k}={recall:.3f} "
+            f"p50={np.percentile(lat, 50) * 1000:.2f}ms p99={np.percentile(lat, 99) * 1000:.2f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 24, 64])
+    args = parser.parse_args()
+    for n in args.sizes:
+        run(n, args.dim, args.k, args.queries, args.nprobe)
+
+
+if __name__ == "__main__":
+    main()
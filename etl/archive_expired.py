@@ -0,0 +1,34 @@
+"""Move expired listings to listings_archive.
+
+Usage:
+    python -m etl.archive_expired                    # one sweep
+    python -m etl.archive_expired --batch-size 2000
+"""
+import argparse
+import asyncio
+
+from app.db.mongo import connect_to_mongo, get_db, close_mongo_connection
+from app.services.archive import backfill_active_flags, sweep_expired
+from app.services.stream_analytics import stream_analytics
+from app.utils.settings import settings
+
+
+async def run(batch_size: int):
+    await connect_to_mongo()
+    db = get_db()
+    flagged = await backfill_active_flags(db)
+    if flagged:
+        print(f"🏷️  Set active flag on {flagged} older listings")
+    archived = await sweep_expired(db, batch_size)
+    # Tag decrements for the archived listings are only in memory until flushed
+    await stream_analytics.flush(db)
+    remaining = await db.listings.count_documents({})
+    print(f"✅ Archived {archived} expired listings; {remaining} remain in listings")
+    await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive expired listings")
+    parser.add_argument("--batch-size", type=int, default=settings.archive_batch_size)
+    args = parser.parse_args()
+    asyncio.run(run(args.batch_size))
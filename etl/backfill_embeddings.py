@@ -1,117 +1,116 @@
+"""Backfill listing embeddings in batches.
+
+Usage:
+    python -m etl.backfill_embeddings                    # listings whose corpus hash changed
+    python -m etl.backfill_embeddings --force            # re-embed everything
+    python -m etl.backfill_embeddings --resume           # continue after the last checkpoint
+    python -m etl.backfill_embeddings --batch-size 512 --workers 4
+"""
+import argparse
 import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
 from app.utils.settings import settings
-from app.utils.embeddings import embed_text
+from app.utils.embeddings import shutdown_embedding_executor
+from app.services.embedding_jobs import embed_listings
 from app.db.mongo import connect_to_mongo, get_db, close_mongo_connection
 
+CHECKPOINT_ID = "backfill_embeddings"
+
+
+async def _save_checkpoint(db, last_id) -> None:
+    await db.etl_checkpoints.update_one(
+        {"_id": CHECKPOINT_ID},
+        {"$set": {"last_id": last_id, "model": settings.embedding_model, "updated_at": datetime.utcnow()}},
+        upsert=True,
+    )
 
-def corpus(doc: dict) -> str:
-    """
-    Enhanced corpus generation with category context and synonym expansion
-    for better semantic embeddings - matches the logic in listings.py
-    """
-    parts = [
-        doc.get("title") or "",
-        doc.get("description") or "",
-    ]
-    
-    # Add category context
-    category = doc.get("category", "")
-    if category:
-        parts.append(f"Category: {category}")
-    
-    # Expand tags with synonyms
-    tags = doc.get("tags") or []
-    expanded_tags = list(tags)
-    
-    for tag in tags:
-        tag_lower = tag.lower()
-        
-        # Brand/product expansions
-        if "iphone" in tag_lower or "apple" in tag_lower:
-            expanded_tags.extend(["Apple smartphone", "iOS phone", "Apple device"])
-        elif "samsung" in tag_lower:
-            expanded_tags.extend(["Samsung smartphone", "Android phone", "Galaxy device"])
-        elif "oneplus" in tag_lower or "one plus" in tag_lower:
-            expanded_tags.extend(["OnePlus smartphone", "Android phone", "One Plus device"])
-        elif "lexus" in tag_lower:
-            expanded_tags.extend(["Lexus vehicle", "luxury car", "Toyota premium brand"])
-        elif "toyota" in tag_lower:
-            expanded_tags.extend(["Toyota vehicle", "automobile", "car"])
-        elif "honda" in tag_lower:
-            expanded_tags.extend(["Honda vehicle", "automobile", "car", "motorcycle"])
-        elif "retriever" in tag_lower or "dog" in tag_lower:
-            expanded_tags.extend(["pet dog", "canine", "puppy", "animal companion"])
-        elif "cat" in tag_lower:
-            expanded_tags.extend(["pet cat", "feline", "kitten", "animal companion"])
-        elif "boat" in tag_lower:
-            expanded_tags.extend(["water vessel", "marine vehicle", "watercraft"])
-        elif "laptop" in tag_lower or "notebook" in tag_lower:
-            expanded_tags.extend(["portable computer", "laptop computer", "notebook computer"])
-        elif "phone" in tag_lower and "iphone" not in tag_lower:
-            expanded_tags.extend(["smartphone", "mobile phone", "cell phone"])
-    
-    if expanded_tags:
-        parts.append(" ".join(expanded_tags))
-    
-    # Add city for location awareness
-    city = doc.get("city") or ""
-    if city:
-        parts.append(f"Location: {city}")
-    
-    return " | ".join([p for p in parts if p])
-
-
-async def run():
+
+async def run(batch_size: int, workers: int, force: bool, resume: bool):
     if not settings.enable_semantic_search:
         print("⚠️  ENABLE_SEMANTIC_SEARCH is false; enable it in .env before backfilling.")
         return
-    
-    print("=" * 60)
-    print("Enhanced Embeddings Backfill Script")
-    print("=" * 60)
-    
+
     await connect_to_mongo()
     db = get_db()
-    
-    # Get all listings (will regenerate all embeddings with enhanced corpus)
-    print("\n🔍 Searching for listings to update...")
-    cursor = db.listings.find({}, {"title": 1, "description": 1, "tags": 1, "city": 1, "category": 1})
-    
-    count = 0
-    total = await db.listings.count_documents({})
-    
-    print(f"📊 Found {total} total listings in database")
-    print("\n🚀 Starting embedding generation with enhanced corpus...\n")
-    
+
+    query: dict = {}
+    if resume:
+        checkpoint = await db.etl_checkpoints.find_one({"_id": CHECKPOINT_ID})
+        if checkpoint and checkpoint.get("last_id") is not None:
+            query["_id"] = {"$gt": checkpoint["last_id"]}
+            print(f"⏩ Resuming after {checkpoint['last_id']}")
+
+    total = await db.listings.count_documents(query)
+    print(f"📊 {total} listings to check (batch size {batch_size}, {workers} workers)")
+
+    # Batches finish out of order; the checkpoint only advances past a batch
+    # once every earlier batch has been written too.
+    in_flight = asyncio.Semaphore(workers)
+    finished: Dict[int, object] = {}
+    next_to_commit = 0
+    errors: List[BaseException] = []
+    done = 0
+    embedded = 0
+    started = time.perf_counter()
+
+    async def process(seq: int, docs: List[dict]):
+        nonlocal next_to_commit, done, embedded
+        try:
+            embedded += len(await embed_listings(db, docs, force))
+        except Exception as e:  # keep the checkpoint behind the failed batch
+            errors.append(e)
+            print(f"❌ Batch {seq} failed: {e}")
+            return
+        finally:
+            in_flight.release()
+        finished[seq] = docs[-1]["_id"]
+        done += len(docs)
+        last_id: Optional[object] = None
+        while next_to_commit in finished and not errors:
+            last_id = finished.pop(next_to_commit)
+            next_to_commit += 1
+        if last_id is not None:
+            await _save_checkpoint(db, last_id)
+        rate = done / max(time.perf_counter() - started, 1e-9)
+        print(f"  ✅ {done}/{total} checked, {embedded} embedded ({rate:.0f} docs/s)")
+
+    projection = {"title": 1, "description": 1, "tags": 1, "city": 1, "category": 1, "embedding_hash": 1}
+    cursor = db.listings.find(query, projection).sort("_id", 1).batch_size(batch_size)
+    tasks = []
+    batch: List[dict] = []
+    seq = 0
     async for doc in cursor:
-        title = doc.get("title", "Untitled")
-        enhanced_corpus = corpus(doc)
-        
-        print(f"[{count + 1}/{total}] Processing: {title}")
-        print(f"  📝 Enhanced corpus preview: {enhanced_corpus[:150]}...")
-        
-        vec = embed_text(enhanced_corpus)
-        print(f"  ✅ Generated {len(vec)}-dimensional embedding")
-        
-        await db.listings.update_one({"_id": doc["_id"]}, {"$set": {"embedding": vec}})
-        count += 1
-        print()
-    
-    print("=" * 60)
-    print(f"✅ Successfully backfilled embeddings for {count} listings!")
-    print("=" * 60)
-    print("\n💡 Your listings now have enhanced embeddings that understand:")
-    print("   • Brand synonyms (Apple → iPhone)")
-    print("   • Product categories")
-    print("   • Common variations and related terms")
-    print("\n🎯 Try searching with queries like:")
-    print("   • 'Apple Phone' (will match iPhone)")
-    print("   • 'luxury car' (will match Lexus)")
-    print("   • 'dog' (will match retriever, puppy, etc.)")
-    print()
-    
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await in_flight.acquire()
+            tasks.append(asyncio.create_task(process(seq, batch)))
+            seq += 1
+            batch = []
+        if errors:
+            break
+    if batch and not errors:
+        await in_flight.acquire()
+        tasks.append(asyncio.create_task(process(seq, batch)))
+    await asyncio.gather(*tasks)
+
+    if errors:
+        print(f"⚠️  Stopped after {len(errors)} failed batch(es); rerun with --resume to continue.")
+    else:
+        print(f"✅ Embedded {embedded} of {done} listings in {time.perf_counter() - started:.1f}s (rest unchanged)")
+
+    shutdown_embedding_executor()
     await close_mongo_connection()
 
 
 if __name__ == "__main__":
-    asyncio.run(run())
+    parser = argparse.ArgumentParser(description="Backfill listing embeddings")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=settings.embedding_workers, help="batches encoded in parallel")
+    parser.add_argument("--force", action="store_true", help="re-embed even when the corpus hash is unchanged")
+    parser.add_argument("--resume", action="store_true", help="continue after the last checkpointed _id")
+    args = parser.parse_args()
+    settings.embedding_workers = args.workers
+    asyncio.run(run(args.batch_size, args.workers, args.force, args.resume))
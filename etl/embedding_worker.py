@@ -0,0 +1,56 @@
+"""Standalone embedding worker: drains the ``embedding_jobs`` queue.
+
+Usage:
+    python -m etl.embedding_worker                       # run until stopped
+    python -m etl.embedding_worker --concurrency 2 --batch-size 64
+    python -m etl.embedding_worker --once                # drain the queue and exit
+"""
+import argparse
+import asyncio
+import os
+import socket
+
+from app.db.mongo import connect_to_mongo, get_db, close_mongo_connection
+from app.services.embedding_jobs import process_jobs, queue_stats, run_worker_loop
+from app.utils.embeddings import shutdown_embedding_executor
+from app.utils.settings import settings
+
+
+async def run(batch_size: int, concurrency: int, lease_seconds: float, poll_interval: float, once: bool):
+    if not settings.enable_semantic_search:
+        print("⚠️  ENABLE_SEMANTIC_SEARCH is false; nothing to embed.")
+        return
+
+    await connect_to_mongo()
+    db = get_db()
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"👷 Embedding worker {owner} (batch {batch_size}, concurrency {concurrency})")
+    print(f"📊 Queue: {await queue_stats(db)}")
+
+    try:
+        if once:
+            async def drain():
+                while await process_jobs(db, owner, batch_size, lease_seconds):
+                    pass
+
+            await asyncio.gather(*[drain() for _ in range(concurrency)])
+            print(f"✅ Queue drained: {await queue_stats(db)}")
+        else:
+            await asyncio.gather(*[
+                run_worker_loop(db, owner, batch_size, lease_seconds, poll_interval) for _ in range(concurrency)
+            ])
+    finally:
+        shutdown_embedding_executor()
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process queued listing embedding jobs")
+    parser.add_argument("--batch-size", type=int, default=settings.embedding_job_batch_size)
+    parser.add_argument("--concurrency", type=int, default=settings.embedding_workers, help="batches in flight")
+    parser.add_argument("--lease-seconds", type=float, default=settings.embedding_job_lease_seconds)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    args = parser.parse_args()
+    settings.embedding_workers = args.concurrency
+    asyncio.run(run(args.batch_size, args.concurrency, args.lease_seconds, args.poll_interval, args.once))
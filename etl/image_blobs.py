@@ -0,0 +1,111 @@
+"""Move legacy uploads into content-addressed blob storage and free unused blobs.
+
+Uploads made before blob storage are flat ``<listing_id>_<name>`` files in
+``LOCAL_IMAGES_DIR``. For every live and archived listing this stores each
+such file as a blob (taking a reference), rewrites the listing's ``images``
+and ``image_variants`` URLs, and finally deletes flat files no listing points
+at any more. It then frees blobs left without references. Safe to rerun; a
+listing edited while it runs is skipped and picked up next time.
+
+Usage:
+    python -m etl.image_blobs
+    python -m etl.image_blobs --sweep-only   # just free unreferenced blobs
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Set
+
+from app.db.mongo import connect_to_mongo, get_db, close_mongo_connection
+from app.services.images import file_sha256
+from app.services.storage import (
+    IMAGES_URL, blob_sha, collect_unreferenced, image_extension, local_path, release_images, store_blob,
+)
+from app.utils.etag import versioned
+from app.utils.response_cache import response_cache
+from app.utils.settings import settings
+
+
+def _copy_to_temp(path: Path) -> Path:
+    fd, name = tempfile.mkstemp(dir=settings.local_images_dir, prefix=".upload-", suffix=".part")
+    with open(fd, "wb") as out, open(path, "rb") as src:
+        shutil.copyfileobj(src, out)
+    return Path(name)
+
+
+async def _to_blob(db, path: Path) -> str:
+    sha256 = await asyncio.to_thread(file_sha256, path)
+    tmp = await asyncio.to_thread(_copy_to_temp, path)
+    try:
+        blob, _ = await store_blob(db, tmp, sha256, path.stat().st_size, image_extension(path.name))
+    finally:
+        tmp.unlink(missing_ok=True)
+    return f"{IMAGES_URL}/{blob['path']}"
+
+
+async def migrate(db) -> dict:
+    stats = {"listings": 0, "images": 0, "skipped": 0, "files_removed": 0}
+    legacy: Set[str] = set()
+    query = {"images": {"$regex": f"^{IMAGES_URL}/"}}
+    for name in ("listings", "listings_archive"):
+        async for doc in db[name].find(query, {"images": 1, "image_variants": 1}):
+            images = doc.get("images") or []
+            moved: Dict[str, str] = {}
+            for url in images:
+                path = local_path(url)
+                if path is None or blob_sha(url) or url in moved or not path.is_file():
+                    continue
+                moved[url] = await _to_blob(db, path)
+            if not moved:
+                continue
+            new_images = [moved.get(url, url) for url in images]
+            variants = [{**v, "src": moved.get(v.get("src"), v.get("src"))} for v in doc.get("image_variants") or []]
+            # Only if nobody edited the images meanwhile
+            res = await db[name].update_one(
+                {"_id": doc["_id"], "images": images},
+                versioned({"$set": {"images": new_images, "image_variants": variants}}),
+            )
+            if res.matched_count:
+                legacy.update(moved)
+                stats["listings"] += 1
+                stats["images"] += sum(1 for url in images if url in moved)
+                # store_blob took one reference per distinct file; add the repeats
+                for url in moved:
+                    for _ in range(images.count(url) - 1):
+                        await db.image_blobs.update_one({"_id": blob_sha(moved[url])}, {"$inc": {"refs": 1}})
+            else:
+                await release_images(db, moved.values())
+                stats["skipped"] += 1
+    for url in legacy:
+        still_used = any([
+            await db[name].find_one({"images": url}, {"_id": 1}) for name in ("listings", "listings_archive")
+        ])
+        if not still_used:
+            local_path(url).unlink(missing_ok=True)
+            stats["files_removed"] += 1
+    if stats["listings"]:
+        await response_cache.invalidate()
+    return stats
+
+
+async def run(sweep_only: bool):
+    await connect_to_mongo()
+    db = get_db()
+    if not sweep_only:
+        stats = await migrate(db)
+        print(
+            f"📦 Moved {stats['images']} images of {stats['listings']} listings into blob storage "
+            f"({stats['files_removed']} flat files removed, {stats['skipped']} listings changed meanwhile)"
+        )
+    freed = await collect_unreferenced(db)
+    print(f"🧹 Freed {freed} unreferenced blobs")
+    await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate legacy uploads to blob storage and free unused blobs")
+    parser.add_argument("--sweep-only", action="store_true", help="skip the migration")
+    args = parser.parse_args()
+    asyncio.run(run(args.sweep_only))
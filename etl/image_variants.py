@@ -0,0 +1,55 @@
+"""Render thumbnail/WebP variants for uploaded images that have none yet.
+
+New uploads get variants from the API right after upload; run this once
+after installing Pillow, or after changing ``VARIANT_SIZES``. Only images
+uploaded to local storage (``/listings/images/...``) are processed.
+
+Usage:
+    python -m etl.image_variants
+    python -m etl.image_variants --limit 500
+"""
+import argparse
+import asyncio
+
+from app.db.mongo import connect_to_mongo, get_db, close_mongo_connection
+from app.services.images import file_sha256, generate_variants, shutdown_image_executor, variants_enabled
+from app.services.storage import IMAGES_URL, blob_sha, local_path
+
+
+async def run(limit: int):
+    if not variants_enabled():
+        print("❌ Image variants are disabled (needs Pillow, IMAGE_WORKERS > 0 and local storage)")
+        return
+    await connect_to_mongo()
+    db = get_db()
+    done = failed = missing = 0
+    query = {"images": {"$regex": f"^{IMAGES_URL}/"}}
+    cursor = db.listings.find(query, {"images": 1, "image_variants.src": 1})
+    async for doc in cursor:
+        have = {v.get("src") for v in doc.get("image_variants") or []}
+        for url in doc.get("images") or []:
+            path = local_path(url)
+            if path is None or url in have:
+                continue
+            if not path.is_file():
+                missing += 1
+                continue
+            sha256 = blob_sha(url) or await asyncio.to_thread(file_sha256, path)
+            if await generate_variants(db, doc["_id"], url, path, sha256):
+                done += 1
+            else:
+                failed += 1
+            if limit and done >= limit:
+                break
+        if limit and done >= limit:
+            break
+    print(f"✅ Rendered variants for {done} images ({failed} failed, {missing} files missing)")
+    await close_mongo_connection()
+    shutdown_image_executor()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill image variants")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many images (0 = all)")
+    args = parser.parse_args()
+    asyncio.run(run(args.limit))
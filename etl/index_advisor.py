@@ -0,0 +1,132 @@
+"""Explain the canonical queries against the declared indexes.
+
+Usage:
+    python -m etl.index_advisor                  # report only
+    python -m etl.index_advisor --create         # create declared indexes missing from the database
+    python -m etl.index_advisor --drop           # drop indexes not declared in app/db/indexes.py
+    python -m etl.index_advisor --max-ratio 20   # flag queries examining >20 docs per result
+
+Exits with status 1 when a query collection-scans, sorts in memory or
+examines too many documents per result, so it can gate CI.
+"""
+import argparse
+import asyncio
+import sys
+from typing import Iterable, List, Set
+
+from app.db.indexes import INDEXES, QueryShape, canonical_queries
+from app.db.mongo import connect_to_mongo, get_db, close_mongo_connection, ensure_indexes
+
+
+def _winning_stages(node, inside: bool = False) -> Iterable[dict]:
+    """Every plan stage under a ``winningPlan`` (rejected plans are ignored)."""
+    if isinstance(node, dict):
+        if inside and "stage" in node:
+            yield node
+        for key, value in node.items():
+            if key == "rejectedPlans":
+                continue
+            yield from _winning_stages(value, inside or key == "winningPlan")
+    elif isinstance(node, list):
+        for item in node:
+            yield from _winning_stages(item, inside)
+
+
+def _execution_stats(node) -> List[dict]:
+    found = []
+    if isinstance(node, dict):
+        if "executionStats" in node:
+            found.append(node["executionStats"])
+        for key, value in node.items():
+            if key != "executionStats":
+                found.extend(_execution_stats(value))
+    elif isinstance(node, list):
+        for item in node:
+            found.extend(_execution_stats(item))
+    return found
+
+
+async def _explain(db, shape: QueryShape) -> dict:
+    if shape.pipeline is not None:
+        command = {"aggregate": shape.collection, "pipeline": shape.pipeline, "cursor": {}}
+    else:
+        command = {"find": shape.collection, "filter": shape.filter}
+        if shape.sort:
+            command["sort"] = shape.sort
+        if shape.limit:
+            command["limit"] = shape.limit
+    return await db.command({"explain": command, "verbosity": "executionStats"})
+
+
+async def _report_indexes(db, create: bool, drop: bool) -> None:
+    if create:
+        await ensure_indexes()
+    declared = {}
+    for spec in INDEXES:
+        declared.setdefault(spec.collection, set()).add(spec.name)
+    for collection, names in declared.items():
+        existing: Set[str] = set((await db[collection].index_information()).keys()) - {"_id_"}
+        for name in sorted(names - existing):
+            print(f"  ➕ {collection}.{name} is declared but missing (run with --create)")
+        for name in sorted(existing - names):
+            if drop:
+                await db[collection].drop_index(name)
+                print(f"  🗑️  Dropped {collection}.{name}")
+            else:
+                print(f"  ➖ {collection}.{name} is not declared (run with --drop to remove)")
+
+
+async def run(create: bool, drop: bool, max_ratio: float) -> int:
+    await connect_to_mongo()
+    db = get_db()
+
+    print("📇 Indexes")
+    await _report_indexes(db, create, drop)
+
+    print("🔎 Canonical queries")
+    problems = 0
+    for shape in canonical_queries():
+        try:
+            explain = await _explain(db, shape)
+        except Exception as e:
+            print(f"  ❌ {shape.name}: explain failed: {e}")
+            problems += 1
+            continue
+        stages = list(_winning_stages(explain))
+        names = {s["stage"] for s in stages}
+        used = sorted({s["indexName"] for s in stages if s.get("indexName")})
+        stats = _execution_stats(explain)
+        returned = sum(s.get("nReturned", 0) for s in stats[:1])
+        examined = sum(s.get("totalDocsExamined", 0) for s in stats[:1])
+        keys = sum(s.get("totalKeysExamined", 0) for s in stats[:1])
+        ratio = examined / max(returned, 1)
+
+        issues = []
+        if "COLLSCAN" in names and not shape.full_scan_ok:
+            issues.append("COLLSCAN")
+        if "SORT" in names:
+            issues.append("in-memory SORT")
+        if ratio > max_ratio:
+            issues.append(f"examined/returned {ratio:.1f}")
+        problems += bool(issues)
+
+        icon = "⚠️ " if issues else "✅"
+        detail = f"index={','.join(used) or '-'} keys={keys} docs={examined} returned={returned}"
+        suffix = f"  <- {'; '.join(issues)}" if issues else ""
+        print(f"  {icon} {shape.collection}: {shape.name} [{detail}]{suffix}")
+
+    await close_mongo_connection()
+    if problems:
+        print(f"⚠️  {problems} quer{'y' if problems == 1 else 'ies'} need attention")
+        return 1
+    print("✅ All canonical queries are served by indexes")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Explain canonical queries and manage declared indexes")
+    parser.add_argument("--create", action="store_true", help="create declared indexes that are missing")
+    parser.add_argument("--drop", action="store_true", help="drop indexes that are not declared")
+    parser.add_argument("--max-ratio", type=float, default=10.0, help="max documents examined per result")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.create, args.drop, args.max_ratio)))
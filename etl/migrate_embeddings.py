@@ -0,0 +1,65 @@
+"""Convert stored listing embeddings to the compact binary encoding in bulk.
+
+Usage:
+    python -m etl.migrate_embeddings                    # arrays -> EMBEDDING_FORMAT
+    python -m etl.migrate_embeddings --format int8      # arrays -> int8
+    python -m etl.migrate_embeddings --format int8 --reencode   # also re-encode binary docs
+"""
+import argparse
+import asyncio
+
+from pymongo import UpdateOne
+
+from app.db.mongo import connect_to_mongo, get_db, close_mongo_connection
+from app.utils.settings import settings
+from app.utils.vector_codec import FORMATS, HAS_EMBEDDING, decode_embedding, encode_embedding
+
+
+async def _avg_doc_size(db) -> float:
+    pipeline = [{"$group": {"_id": None, "avg": {"$avg": {"$bsonSize": "$$ROOT"}}}}]
+    try:
+        res = await db.listings.aggregate(pipeline).to_list(length=1)
+    except Exception:
+        return 0.0  # $bsonSize needs MongoDB 4.4+
+    return float(res[0]["avg"]) if res else 0.0
+
+
+async def run(fmt: str, batch_size: int, reencode: bool):
+    await connect_to_mongo()
+    db = get_db()
+
+    before = await _avg_doc_size(db)
+    query = {"embedding": HAS_EMBEDDING if reencode else {"$type": "array"}}
+    total = await db.listings.count_documents(query)
+    print(f"🔁 Converting {total} listing embeddings to '{fmt}' (batch size {batch_size})")
+
+    converted = 0
+    ops = []
+    async for doc in db.listings.find(query, {"embedding": 1}, batch_size=batch_size):
+        vec = decode_embedding(doc.get("embedding"))
+        if vec is None:
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"embedding": encode_embedding(vec, fmt)}}))
+        if len(ops) >= batch_size:
+            await db.listings.bulk_write(ops, ordered=False)
+            converted += len(ops)
+            ops = []
+            print(f"  ✅ {converted}/{total}")
+    if ops:
+        await db.listings.bulk_write(ops, ordered=False)
+        converted += len(ops)
+
+    after = await _avg_doc_size(db)
+    print(f"✅ Converted {converted} embeddings")
+    if before and after:
+        print(f"📦 Average listing size: {before:,.0f} B → {after:,.0f} B")
+    await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert listing embeddings to a compact encoding")
+    parser.add_argument("--format", choices=FORMATS, default=settings.embedding_format)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--reencode", action="store_true", help="also re-encode embeddings that are already binary")
+    args = parser.parse_args()
+    asyncio.run(run(args.format, args.batch_size, args.reencode))
@@ -0,0 +1,24 @@
+"""Seed or reset the streaming analytics sketches (top tags, distinct counts).
+
+The API keeps them current on every listing write; run this once after
+deploying, or to correct drift (e.g. writes made while no API was running).
+Deltas flushed by running API workers during the rebuild are overwritten.
+
+Usage:
+    python -m etl.rebuild_sketches
+"""
+import asyncio
+
+from app.db.mongo import connect_to_mongo, get_db, close_mongo_connection
+from app.services.stream_analytics import rebuild_sketches
+
+
+async def run():
+    await connect_to_mongo()
+    result = await rebuild_sketches(get_db())
+    print(f"✅ Rebuilt {result['sketches']} sketches from {result['listings']} live listings")
+    await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
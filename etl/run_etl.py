@@ -1,56 +1,30 @@
-import asyncio
-from datetime import datetime, timezone
-
-from motor.motor_asyncio import AsyncIOMotorClient
-from app.utils.settings import settings
-
+"""Incremental analytics ETL: refresh the daily rollups behind GET /analytics/summary.
 
-async def run():
-    client = AsyncIOMotorClient(settings.mongodb_uri)
-    db = client[settings.mongodb_db]
+Only days with listings created, edited, archived or deleted since the last
+run are recomputed (app/services/rollups.py).
 
-    # Aggregation: listings per city
-    per_city = [
-        {"$group": {"_id": "$city", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-    ]
-    per_city_res = [x async for x in db.listings.aggregate(per_city)]
-
-    # Aggregation: listings per category
-    per_category = [
-        {"$group": {"_id": "$category", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-    ]
-    per_category_res = [x async for x in db.listings.aggregate(per_category)]
-
-    # Most common tags (top 20)
-    common_tags = [
-        {"$unwind": "$tags"},
-        {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 20},
-    ]
-    common_tags_res = [x async for x in db.listings.aggregate(common_tags)]
+Usage:
+    python -m etl.run_etl            # incremental (full rebuild on the first run)
+    python -m etl.run_etl --full     # recompute every day
+"""
+import argparse
+import asyncio
 
-    # Daily new listings (last 30 days) by day based on _id timestamp
-    daily_new = [
-        {"$addFields": {"createdAt": {"$toDate": "$_id"}}},
-        {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$createdAt"}}, "count": {"$sum": 1}}},
-        {"$sort": {"_id": 1}},
-    ]
-    daily_new_res = [x async for x in db.listings.aggregate(daily_new)]
+from app.db.mongo import connect_to_mongo, get_db, close_mongo_connection
+from app.services.rollups import run_rollups
 
-    summary = {
-        "generatedAt": datetime.now(timezone.utc).isoformat(),
-        "perCity": per_city_res,
-    "perCategory": per_category_res,
-        "commonTags": common_tags_res,
-        "dailyNew": daily_new_res,
-    }
 
-    await db.analytics_summary.insert_one(summary)
-    client.close()
+async def run(full: bool):
+    await connect_to_mongo()
+    db = get_db()
+    result = await run_rollups(db, full=full)
+    kind = "Full rebuild" if result["full"] else "Incremental run"
+    print(f"✅ {kind}: recomputed {result['days']} days, wrote {result['buckets']} rollup buckets")
+    await close_mongo_connection()
 
 
 if __name__ == "__main__":
-    asyncio.run(run())
+    parser = argparse.ArgumentParser(description="Refresh daily analytics rollups")
+    parser.add_argument("--full", action="store_true", help="recompute every day instead of changed days only")
+    args = parser.parse_args()
+    asyncio.run(run(args.full))
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react'
 import { Link } from 'react-router-dom'
-import { resolveImageUrl, formatPrice } from '../utils/imageHelper'
+import { cardImageUrl, formatPrice, type ImageVariant } from '../utils/imageHelper'
 import { getCityNames, getCityCoordinates } from '../utils/cities'
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
@@ -16,6 +16,7 @@ interface Listing {
   category: string
   tags: string[]
   images: string[]
+  image_variants?: ImageVariant[]
   posted_date: string
 }
 
@@ -227,7 +228,7 @@ export const HomePage: React.FC = () => {
               >
                 {listing.images && listing.images.length > 0 ? (
                   <img
-                    src={resolveImageUrl(listing.images[0])}
+                    src={cardImageUrl(listing)}
                     alt={listing.title}
                     className="listing-image"
                   />
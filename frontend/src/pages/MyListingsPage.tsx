@@ -2,7 +2,7 @@ import React, { useEffect, useState } from 'react'
 import { Link } from 'react-router-dom'
 import { useAuth } from '../contexts/AuthContext'
 import { getCityNames } from '../utils/cities'
-import { resolveImageUrl, formatPrice } from '../utils/imageHelper'
+import { resolveImageUrl, cardImageUrl, formatPrice, type ImageVariant } from '../utils/imageHelper'
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
 
@@ -15,6 +15,7 @@ interface Listing {
   category: string
   tags: string[]
   images: string[]
+  image_variants?: ImageVariant[]
   posted_date: string
   expires_at: string
 }
@@ -285,7 +286,7 @@ export const MyListingsPage: React.FC = () => {
             <div key={listing._id} className="listing-card my-listing-card">
               {listing.images && listing.images.length > 0 ? (
                 <img
-                  src={resolveImageUrl(listing.images[0])}
+                  src={cardImageUrl(listing)}
                   alt={listing.title}
                   className="listing-image"
                 />
@@ -20,6 +20,31 @@ export function resolveImageUrl(imagePath: string): string {
   return `${API_URL}${imagePath}`
 }
 
+export interface ImageVariant {
+  src: string
+  width: number
+  height: number
+  thumb: Record<string, string>
+  medium: Record<string, string>
+}
+
+// WebP first: every supported browser decodes it; AVIF is smaller but not universal
+const VARIANT_FORMATS = ['webp', 'jpeg', 'avif']
+
+/**
+ * URL for a listing card image: the thumbnail variant of the first image when
+ * the server has rendered one, otherwise the original.
+ */
+export function cardImageUrl(listing: { images: string[]; image_variants?: ImageVariant[] }): string {
+  const first = listing.images?.[0]
+  if (!first) {
+    return ''
+  }
+  const variant = listing.image_variants?.find((v) => v.src === first)
+  const format = VARIANT_FORMATS.find((f) => variant?.thumb?.[f])
+  return resolveImageUrl(format ? variant!.thumb[format] : first)
+}
+
 /**
  * Formats a price value with Sri Lankan Rupee (LKR) currency
  * @param price - The numeric price value
@@ -1,13 +1,29 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.utils.settings import settings
-from app.db.mongo import connect_to_mongo, close_mongo_connection, ensure_indexes
+from app.db.mongo import connect_to_mongo, close_mongo_connection, ensure_indexes, get_db
+import asyncio
+import os
+import socket
+from app.utils.vector_index import load_listing_index, run_index_refresher
+from app.services.embedding_jobs import run_worker_loop
+from app.services.archive import backfill_active_flags, run_archive_sweeper
+from app.services.stream_analytics import run_sketch_flusher, stream_analytics
+from app.utils.embeddings import warm_query_cache, shutdown_embedding_executor
+from app.auth.security import shutdown_hash_executor
+from app.services.images import shutdown_image_executor
+from app.services.storage import BlobStaticFiles, UploadSizeLimit
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from pathlib import Path
 from app.routes import auth as auth_routes
 from app.routes import listings as listings_routes
 from app.routes import analytics as analytics_routes
-from fastapi.staticfiles import StaticFiles
 
 app = FastAPI(title="DA2 Smart Listings API", version="0.1.0")
+_background_tasks = []
+
+# Before Starlette spools an oversized upload to disk; added first so CORS wraps its 413
+app.add_middleware(UploadSizeLimit, max_bytes=settings.max_upload_bytes)
 
 # CORS for local dev frontends
 app.add_middleware(
@@ -16,27 +32,66 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
 
+async def _warm_query_cache(queries) -> None:
+    try:
+        print(f"🔥 Warmed query embedding cache with {await warm_query_cache(queries)} queries")
+    except Exception as e:
+        print(f"⚠️  Query cache warm-up failed: {e}")
+
+
 @app.on_event("startup")
 async def startup_event():
     await connect_to_mongo()
     await ensure_indexes()
+    flagged = await backfill_active_flags(get_db())
+    if flagged:
+        print(f"🏷️  Set active flag on {flagged} older listings")
+    if settings.archive_sweep_seconds > 0:
+        _background_tasks.append(asyncio.create_task(
+            run_archive_sweeper(get_db(), settings.archive_sweep_seconds, settings.archive_batch_size)
+        ))
+    _background_tasks.append(asyncio.create_task(run_sketch_flusher(get_db(), settings.sketch_flush_seconds)))
+    if settings.enable_semantic_search:
+        count = await load_listing_index(get_db())
+        print(f"🧭 ANN index loaded with {count} listing embeddings")
+        if settings.query_cache_warmup_file and Path(settings.query_cache_warmup_file).exists():
+            queries = Path(settings.query_cache_warmup_file).read_text(encoding="utf-8").splitlines()
+            _background_tasks.append(asyncio.create_task(_warm_query_cache(queries)))
+        # Pick up embeddings written by the queue worker
+        _background_tasks.append(asyncio.create_task(run_index_refresher(get_db(), settings.index_refresh_seconds)))
+        if settings.embedding_worker_inline:
+            owner = f"{socket.gethostname()}:{os.getpid()}:api"
+            _background_tasks.append(asyncio.create_task(run_worker_loop(
+                get_db(), owner, settings.embedding_job_batch_size, settings.embedding_job_lease_seconds, 1.0
+            )))
+            print("👷 Draining embedding jobs inside the API process")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    for task in _background_tasks:
+        task.cancel()
+    try:
+        await stream_analytics.flush(get_db())
+    except Exception as e:
+        print(f"⚠️  Analytics sketch flush failed: {e}")
     await close_mongo_connection()
+    shutdown_embedding_executor()
+    shutdown_hash_executor()
+    shutdown_image_executor()
 
 
 app.include_router(auth_routes.router, prefix="/auth", tags=["auth"])
 app.include_router(listings_routes.router, prefix="/listings", tags=["listings"])
 app.include_router(analytics_routes.router, prefix="/analytics", tags=["analytics"])
 
-# Static serving for local images
+# Static serving for local images (content-addressed blobs are served as immutable)
 app.mount(
     "/listings/images",
-    StaticFiles(directory=settings.local_images_dir),
+    BlobStaticFiles(directory=settings.local_images_dir),
     name="listings-images",
 )
@@ -0,0 +1,167 @@
+"""ResponseCache through RedisBackend, against an in-memory Redis stand-in."""
+import asyncio
+
+import pytest
+
+from app.utils.response_cache import GENERATION_KEY, RedisBackend, ResponseCache
+
+
+class FakeRedis:
+    """The subset of ``redis.asyncio.Redis`` RedisBackend uses, with a settable clock."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.down = False
+        self.data = {}  # key -> (value, expires_at or None)
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("Error 111 connecting to localhost:6379. Connection refused.")
+
+    def _get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= self.now:
+            del self.data[key]
+            return None
+        return value
+
+    async def mget(self, keys):
+        self._check()
+        return [self._get(k) for k in keys]
+
+    async def set(self, key, value, ex=None):
+        self._check()
+        self.data[key] = (value, self.now + ex if ex else None)
+
+    async def incr(self, key):
+        self._check()
+        value = int(self._get(key) or 0) + 1
+        self.data[key] = (str(value).encode(), None)
+        return value
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def cache(redis):
+    return ResponseCache(RedisBackend(client=redis), ttl=60)
+
+
+def renderer(body=b"[]"):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return body, {"X-Next-Cursor": "abc"}
+
+    return compute, calls
+
+
+def test_hit_after_first_render(cache, redis):
+    compute, calls = renderer()
+    key = cache.key("latest", limit=20)
+    first = asyncio.run(cache.get_or_compute(key, compute))
+    second = asyncio.run(cache.get_or_compute(key, compute))
+    assert first == second == (b"[]", {"X-Next-Cursor": "abc"})
+    assert len(calls) == 1
+    assert key in redis.data
+
+
+def test_generation_bump_invalidates(cache, redis):
+    compute, calls = renderer()
+    key = cache.key("latest", limit=20)
+    asyncio.run(cache.get_or_compute(key, compute))
+    asyncio.run(cache.invalidate())
+    assert redis.data[GENERATION_KEY][0] == b"1"
+    asyncio.run(cache.get_or_compute(key, compute))
+    assert len(calls) == 2
+    # Shared generation: the ETag validator is the bare counter on Redis
+    assert cache.validator(asyncio.run(cache.generation())) == "1"
+
+
+def test_entry_expires_after_ttl(cache, redis):
+    compute, calls = renderer()
+    key = cache.key("listings", sort_by="date_desc")
+    asyncio.run(cache.get_or_compute(key, compute))
+    redis.now += 59
+    asyncio.run(cache.get_or_compute(key, compute))
+    assert len(calls) == 1
+    redis.now += 2
+    asyncio.run(cache.get_or_compute(key, compute))
+    assert len(calls) == 2
+
+
+def test_backend_down_falls_through_to_compute(cache, redis):
+    compute, calls = renderer(b"[1]")
+    key = cache.key("latest", limit=20)
+    redis.down = True
+    assert asyncio.run(cache.get_or_compute(key, compute)) == (b"[1]", {"X-Next-Cursor": "abc"})
+    assert asyncio.run(cache.get_or_compute(key, compute))[0] == b"[1]"
+    assert len(calls) == 2
+    assert asyncio.run(cache.generation()) is None
+    asyncio.run(cache.invalidate())  # logged, not raised
+    redis.down = False
+    asyncio.run(cache.get_or_compute(key, compute))
+    asyncio.run(cache.get_or_compute(key, compute))
+    assert len(calls) == 3
+
+
+def test_concurrent_misses_share_one_render(cache):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"[]", {}
+
+    async def run():
+        key = cache.key("latest", limit=20)
+        return await asyncio.gather(*[cache.get_or_compute(key, compute) for _ in range(5)])
+
+    assert asyncio.run(run()) == [(b"[]", {})] * 5
+    assert len(calls) == 1
+
+
+def test_followers_survive_cancelled_leader(cache):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return b"[]", {}
+
+    async def run():
+        key = cache.key("latest", limit=20)
+        leader = asyncio.create_task(cache.get_or_compute(key, compute))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(cache.get_or_compute(key, compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()  # e.g. the leader's client disconnected
+        return await follower, leader
+
+    rendered, leader = asyncio.run(run())
+    assert rendered == (b"[]", {})
+    assert leader.cancelled()
+    assert len(calls) == 2
+
+
+def test_follower_cancelled_while_leader_runs(cache):
+    async def compute():
+        await asyncio.sleep(0.05)
+        return b"[]", {}
+
+    async def run():
+        key = cache.key("latest", limit=20)
+        leader = asyncio.create_task(cache.get_or_compute(key, compute))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(cache.get_or_compute(key, compute))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(run()) == (b"[]", {})